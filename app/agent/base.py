@@ -1,9 +1,11 @@
 from abc import ABC, abstractmethod
 from contextlib import asynccontextmanager
+from itertools import islice
 from typing import List, Optional
 
 from pydantic import BaseModel, Field, model_validator
 
+from app.agent.context import ContextManager
 from app.llm import LLM
 from app.logger import logger
 from app.sandbox.client import SANDBOX_CLIENT
@@ -32,6 +34,10 @@ class BaseAgent(BaseModel, ABC):
     # Dependencies
     llm: LLM = Field(default_factory=LLM, description="Language model instance")
     memory: Memory = Field(default_factory=Memory, description="Agent's memory store")
+    context_manager: ContextManager = Field(
+        default_factory=ContextManager,
+        description="Keeps the prompt within the model's context window",
+    )
     state: AgentState = Field(
         default=AgentState.IDLE, description="Current agent state"
     )
@@ -179,7 +185,7 @@ class BaseAgent(BaseModel, ABC):
         # Count identical content occurrences
         duplicate_count = sum(
             1
-            for msg in reversed(self.memory.messages[:-1])
+            for msg in islice(reversed(self.memory.messages), 1, None)
             if msg.role == "assistant" and msg.content == last_message.content
         )
 
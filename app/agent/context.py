@@ -0,0 +1,207 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from app.llm import LLM
+from app.logger import logger
+from app.prompt.context import SUMMARY_PROMPT, SUMMARY_SYSTEM_PROMPT
+from app.schema import CONTEXT_SUMMARY_PREFIX, Memory, Message, Role
+
+
+def group_steps(messages: List[Message]) -> List[List[Message]]:
+    """Split messages into units that are kept or compacted together.
+
+    An assistant message with tool calls forms one unit with the tool results
+    that follow it, so a call is never separated from its results. Every
+    other message is a unit of its own.
+    """
+    units: List[List[Message]] = []
+    for message in messages:
+        if message.role == Role.TOOL and units and units[-1][0].tool_calls:
+            units[-1].append(message)
+        else:
+            units.append([message])
+    return units
+
+
+class ContextManager(BaseModel):
+    """Keeps an agent's prompt within a token budget by compacting its memory.
+
+    When the prompt (system prompt, tool schemas and memory) grows beyond
+    ``target_ratio`` of the model's context window, the oldest steps are
+    folded into a running LLM-generated summary. The summary sits right
+    after the anchor messages, which are the system messages and the
+    original user request. Each compaction only summarizes the newly evicted
+    steps together with the previous summary. The ``keep_recent`` latest
+    steps are always kept verbatim.
+
+    The context window is taken from the model registry, where a
+    ``[models."<name>"]`` config table describes a model that is not built
+    in. Compaction stays off for models whose context window is unknown,
+    rather than summarizing their history against a guessed limit.
+
+    Memories backed by a store are also compacted once their steps outgrow
+    the ``hot_messages`` window that ``Memory.context`` sends, so their
+    prompt never needs messages read back from the store.
+    """
+
+    target_ratio: float = Field(
+        0.6, description="Fraction of the context window the prompt may use"
+    )
+    # Compact down to this fraction of the budget, so the next compaction is
+    # not needed again on the very next step
+    compact_ratio: float = Field(
+        0.75, description="Fraction of the budget to compact down to"
+    )
+    keep_recent: int = Field(
+        6, description="Number of latest steps that are never compacted"
+    )
+    max_observation_chars: int = Field(
+        2000, description="Characters of each message included in a summary request"
+    )
+    compactions: int = Field(default=0, description="Number of compactions run")
+
+    def token_budget(self, llm: LLM) -> Optional[int]:
+        """Maximum prompt tokens for the model, None if its window is unknown"""
+        context_window = llm.capabilities.context_window
+        if not context_window:
+            return None
+        return int(context_window * self.target_ratio)
+
+    @staticmethod
+    def count_tokens(llm: LLM, messages: List[Message]) -> int:
+        """Estimate the prompt tokens of messages (cached per message by the LLM)"""
+        tokens = llm.count_message_tokens(
+            [message.to_formatted_dict() for message in messages]
+        )
+        # Images are sent as separate content parts, not counted from the dict
+        images = sum(1 for message in messages if message.image_id)
+        return tokens + images * llm.token_counter.count_image({})
+
+    async def compact(
+        self,
+        memory: Memory,
+        llm: LLM,
+        system_msgs: Optional[List[Message]] = None,
+        tools: Optional[List[dict]] = None,
+    ) -> bool:
+        """Compact the memory if the prompt would exceed the token budget.
+
+        Args:
+            memory: The agent's memory, updated in place
+            llm: The agent's LLM, used for token counts and summaries
+            system_msgs: System messages sent along with the memory
+            tools: Tool schemas sent along with the memory
+
+        Returns:
+            bool: Whether the memory was compacted
+        """
+        budget = self.token_budget(llm)
+        # Persistent memories only send the steps in their hot window
+        window_limit = memory.hot_messages if memory.store is not None else None
+        if budget is None and window_limit is None:
+            return False
+        if budget is not None:
+            if system_msgs:
+                budget -= self.count_tokens(llm, system_msgs)
+            if tools:
+                budget -= llm.token_counter.count_tools(tools)
+
+        context = memory.context()
+        anchor_count = memory.anchor_count()
+        steps = len(memory.messages) - anchor_count
+        over_budget = budget is not None and (self.count_tokens(llm, context) > budget)
+        if not over_budget and (window_limit is None or steps <= window_limit):
+            return False
+
+        anchors = context[:anchor_count]
+        previous_summary = None
+        if anchors and (anchors[-1].content or "").startswith(CONTEXT_SUMMARY_PREFIX):
+            previous_summary = anchors.pop()
+        units = group_steps(memory.messages[anchor_count:])
+
+        total = self.count_tokens(llm, anchors) + sum(
+            self.count_tokens(llm, unit) for unit in units
+        )
+        target = int(budget * self.compact_ratio) if budget is not None else None
+        evicted: List[Message] = []
+        while len(units) > self.keep_recent and (
+            (target is not None and total > target)
+            or (window_limit is not None and steps > window_limit)
+        ):
+            unit = units.pop(0)
+            evicted.extend(unit)
+            total -= self.count_tokens(llm, unit)
+            steps -= len(unit)
+        if not evicted:
+            logger.warning(
+                f"Memory exceeds the context budget or window ({total}/{budget} tokens, "
+                f"{steps} messages) but only the {self.keep_recent} most recent steps remain"
+            )
+            return False
+
+        summary = await self._summarize(llm, previous_summary, evicted)
+        # Replace the previous summary and the evicted steps in place, so a
+        # persistent memory only rewrites those messages
+        base = len(anchors)
+        memory.messages.pin(base)
+        memory.messages.replace_oldest(
+            len(evicted) + (1 if previous_summary else 0),
+            [Message.user_message(f"{CONTEXT_SUMMARY_PREFIX}\n{summary}")],
+        )
+        memory.messages.pin(base + 1)
+        self.compactions += 1
+        logger.info(
+            f"🗜️ Compacted {len(evicted)} messages into a summary, "
+            f"memory now ~{self.count_tokens(llm, memory.context())} tokens (budget {budget})"
+        )
+        return True
+
+    def _render(self, message: Message) -> str:
+        """Render a message as a transcript line for the summary request"""
+        limit = self.max_observation_chars
+        if message.role == Role.TOOL:
+            header = f"[tool result: {message.name}]"
+        else:
+            header = f"[{message.role}]"
+        lines = [header]
+        if message.content:
+            content = message.content
+            if len(content) > limit:
+                content = (
+                    f"{content[:limit]}... ({len(content) - limit} more characters)"
+                )
+            lines.append(content)
+        for tool_call in message.tool_calls or []:
+            lines.append(
+                f"-> calls {tool_call.function.name}({tool_call.function.arguments[:limit]})"
+            )
+        return "\n".join(lines)
+
+    async def _summarize(
+        self, llm: LLM, previous_summary: Optional[Message], evicted: List[Message]
+    ) -> str:
+        """Fold evicted messages into the running summary"""
+        transcript = "\n\n".join(self._render(message) for message in evicted)
+        previous_text = ""
+        if previous_summary:
+            previous_text = previous_summary.content[len(CONTEXT_SUMMARY_PREFIX) :]
+            previous_text = previous_text.strip()
+        previous = f"Summary so far:\n{previous_text}\n\n" if previous_text else ""
+        prompt = SUMMARY_PROMPT.format(
+            previous_summary=previous,
+            merge_hint=" that also keeps the summary so far" if previous else "",
+            transcript=transcript,
+        )
+        try:
+            summary = await llm.ask(
+                [Message.user_message(prompt)],
+                system_msgs=[Message.system_message(SUMMARY_SYSTEM_PROMPT)],
+                stream=False,
+            )
+            return summary.strip()
+        except Exception as e:
+            # Fall back to a truncated digest rather than losing the steps
+            logger.warning(f"Context summarization failed, keeping a digest: {e}")
+            digest = [" ".join(self._render(m).split())[:200] for m in evicted]
+            return "\n".join(filter(None, [previous_text, *digest]))
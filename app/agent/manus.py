@@ -70,7 +70,11 @@ class Manus(ToolCallAgent):
             try:
                 if server_config.type == "sse":
                     if server_config.url:
-                        await self.connect_mcp_server(server_config.url, server_id)
+                        await self.connect_mcp_server(
+                            server_config.url,
+                            server_id,
+                            parallel_safe=server_config.parallel_safe,
+                        )
                         logger.info(
                             f"Connected to MCP server {server_id} at {server_config.url}"
                         )
@@ -81,6 +85,7 @@ class Manus(ToolCallAgent):
                             server_id,
                             use_stdio=True,
                             stdio_args=server_config.args,
+                            parallel_safe=server_config.parallel_safe,
                         )
                         logger.info(
                             f"Connected to MCP server {server_id} using command {server_config.command}"
@@ -94,15 +99,16 @@ class Manus(ToolCallAgent):
         server_id: str = "",
         use_stdio: bool = False,
         stdio_args: List[str] = None,
+        parallel_safe: bool = False,
     ) -> None:
         """Connect to an MCP server and add its tools."""
         if use_stdio:
             await self.mcp_clients.connect_stdio(
-                server_url, stdio_args or [], server_id
+                server_url, stdio_args or [], server_id, parallel_safe
             )
             self.connected_servers[server_id or server_url] = server_url
         else:
-            await self.mcp_clients.connect_sse(server_url, server_id)
+            await self.mcp_clients.connect_sse(server_url, server_id, parallel_safe)
             self.connected_servers[server_id or server_url] = server_url
 
         # Update available tools with only the new tools from this server
@@ -144,7 +150,7 @@ class Manus(ToolCallAgent):
             self._initialized = True
 
         original_prompt = self.next_step_prompt
-        recent_messages = self.memory.messages[-3:] if self.memory.messages else []
+        recent_messages = self.memory.recent(3)
         browser_in_use = any(
             tc.function.name == BrowserUseTool().name
             for msg in recent_messages
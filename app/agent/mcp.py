@@ -43,6 +43,7 @@ class MCPAgent(ToolCallAgent):
         server_url: Optional[str] = None,
         command: Optional[str] = None,
         args: Optional[List[str]] = None,
+        parallel_safe: bool = False,
     ) -> None:
         """Initialize the MCP connection.
 
@@ -51,6 +52,7 @@ class MCPAgent(ToolCallAgent):
             server_url: URL of the MCP server (for SSE connection)
             command: Command to run (for stdio connection)
             args: Arguments for the command (for stdio connection)
+            parallel_safe: Whether the server's tools may run concurrently
         """
         if connection_type:
             self.connection_type = connection_type
@@ -59,11 +61,15 @@ class MCPAgent(ToolCallAgent):
         if self.connection_type == "sse":
             if not server_url:
                 raise ValueError("Server URL is required for SSE connection")
-            await self.mcp_clients.connect_sse(server_url=server_url)
+            await self.mcp_clients.connect_sse(
+                server_url=server_url, parallel_safe=parallel_safe
+            )
         elif self.connection_type == "stdio":
             if not command:
                 raise ValueError("Command is required for stdio connection")
-            await self.mcp_clients.connect_stdio(command=command, args=args or [])
+            await self.mcp_clients.connect_stdio(
+                command=command, args=args or [], parallel_safe=parallel_safe
+            )
         else:
             raise ValueError(f"Unsupported connection type: {self.connection_type}")
 
@@ -158,7 +164,7 @@ class MCPAgent(ToolCallAgent):
 
         # Handle multimedia responses
         if isinstance(result, ToolResult) and result.base64_image:
-            self.memory.add_message(
+            self.defer_message(
                 Message.system_message(
                     MULTIMEDIA_RESPONSE_PROMPT.format(tool_name=name)
                 )
@@ -1,8 +1,9 @@
 import asyncio
+import functools
 import json
-from typing import Any, List, Optional, Union
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 
 from app.agent.react import ReActAgent
 from app.exceptions import TokenLimitExceeded
@@ -10,6 +11,7 @@ from app.logger import logger
 from app.prompt.toolcall import NEXT_STEP_PROMPT, SYSTEM_PROMPT
 from app.schema import TOOL_CHOICE_TYPE, AgentState, Message, ToolCall, ToolChoice
 from app.tool import CreateChatCompletion, Terminate, ToolCollection
+from app.tool.base import tool_output_sink
 
 
 TOOL_CALL_REQUIRED = "Tool calls required but none provided"
@@ -31,7 +33,29 @@ class ToolCallAgent(ReActAgent):
     special_tool_names: List[str] = Field(default_factory=lambda: [Terminate().name])
 
     tool_calls: List[ToolCall] = Field(default_factory=list)
-    _current_base64_image: Optional[str] = None
+    # Images returned by tool calls, keyed by tool call id
+    _tool_call_images: Dict[str, str] = PrivateAttr(default_factory=dict)
+    # Messages added by tools while they run, appended after the step's tool
+    # results so that those stay adjacent to the assistant message
+    _deferred_messages: List[Message] = PrivateAttr(default_factory=list)
+
+    # Stream the LLM response and start executing each tool call as soon as it
+    # is complete, while the model is still generating the remaining calls
+    stream_tool_calls: bool = False
+    _dispatched_tool_calls: Dict[str, asyncio.Task] = PrivateAttr(default_factory=dict)
+
+    # Run consecutive calls to parallel-safe tools concurrently
+    parallel_tool_calls: bool = False
+    max_parallel_tool_calls: int = 4
+
+    # Optional coroutine receiving the model's content deltas as they stream
+    on_token: Optional[Callable[[str], Awaitable[None]]] = Field(
+        default=None, exclude=True
+    )
+    # Optional coroutine receiving (tool name, output chunk) while tools run
+    on_tool_output: Optional[Callable[[str, str], Awaitable[None]]] = Field(
+        default=None, exclude=True
+    )
 
     max_steps: int = 30
     max_observe: Optional[Union[int, bool]] = None
@@ -40,37 +64,38 @@ class ToolCallAgent(ReActAgent):
         """Process current state and decide next actions using tools"""
         if self.next_step_prompt:
             user_msg = Message.user_message(self.next_step_prompt)
-            self.messages += [user_msg]
+            self.memory.add_message(user_msg)
+
+        self._cancel_dispatched_tool_calls()
+        stream = self.stream_tool_calls and self.tool_choices != ToolChoice.NONE
+
+        system_msgs = (
+            [Message.system_message(self.system_prompt)] if self.system_prompt else None
+        )
+        tools = self.available_tools.to_params()
+        await self.context_manager.compact(self.memory, self.llm, system_msgs, tools)
 
         try:
             # Get response with tool options
             response = await self.llm.ask_tool(
-                messages=self.messages,
-                system_msgs=(
-                    [Message.system_message(self.system_prompt)]
-                    if self.system_prompt
-                    else None
-                ),
-                tools=self.available_tools.to_params(),
+                messages=self.memory.context(),
+                system_msgs=system_msgs,
+                tools=tools,
                 tool_choice=self.tool_choices,
+                stream=stream or self.on_token is not None,
+                on_tool_call=self._dispatch_tool_call if stream else None,
+                on_token=self.on_token,
             )
-        except ValueError:
-            raise
-        except Exception as e:
-            # Check if this is a RetryError containing TokenLimitExceeded
-            if hasattr(e, "__cause__") and isinstance(e.__cause__, TokenLimitExceeded):
-                token_limit_error = e.__cause__
-                logger.error(
-                    f"🚨 Token limit error (from RetryError): {token_limit_error}"
-                )
-                self.memory.add_message(
-                    Message.assistant_message(
-                        f"Maximum token limit reached, cannot continue execution: {str(token_limit_error)}"
-                    )
+        except TokenLimitExceeded as token_limit_error:
+            # Token limit errors are never retried and surface directly
+            logger.error(f"🚨 Token limit error: {token_limit_error}")
+            self.memory.add_message(
+                Message.assistant_message(
+                    f"Maximum token limit reached, cannot continue execution: {str(token_limit_error)}"
                 )
-                self.state = AgentState.FINISHED
-                return False
-            raise
+            )
+            self.state = AgentState.FINISHED
+            return False
 
         self.tool_calls = tool_calls = (
             response.tool_calls if response and response.tool_calls else []
@@ -138,12 +163,8 @@ class ToolCallAgent(ReActAgent):
             return self.messages[-1].content or "No content or commands to execute"
 
         results = []
-        for command in self.tool_calls:
-            # Reset base64_image for each tool call
-            self._current_base64_image = None
-
-            result = await self.execute_tool(command)
-
+        outcomes = await self._execute_tool_calls(self.tool_calls)
+        for command, (result, base64_image) in zip(self.tool_calls, outcomes):
             if self.max_observe:
                 result = result[: self.max_observe]
 
@@ -156,13 +177,107 @@ class ToolCallAgent(ReActAgent):
                 content=result,
                 tool_call_id=command.id,
                 name=command.function.name,
-                base64_image=self._current_base64_image,
+                base64_image=base64_image,
             )
             self.memory.add_message(tool_msg)
             results.append(result)
 
+        # Calls from an abandoned (e.g. retried) stream are not part of this step
+        self._cancel_dispatched_tool_calls()
+
+        if self._deferred_messages:
+            self.memory.add_messages(self._deferred_messages)
+            self._deferred_messages = []
+
         return "\n\n".join(results)
 
+    async def _execute_tool_calls(
+        self, commands: List[ToolCall]
+    ) -> List[Tuple[str, Optional[str]]]:
+        """Execute tool calls and return their outcomes in call order.
+
+        With ``parallel_tool_calls`` enabled, each run of consecutive calls to
+        parallel-safe tools is gathered under ``max_parallel_tool_calls``;
+        calls to exclusive tools act as barriers and run on their own.
+        """
+        if not self.parallel_tool_calls:
+            return [await self._await_tool_call(command) for command in commands]
+
+        semaphore = asyncio.Semaphore(max(1, self.max_parallel_tool_calls))
+
+        async def run_limited(command: ToolCall) -> Tuple[str, Optional[str]]:
+            async with semaphore:
+                return await self._await_tool_call(command)
+
+        outcomes: List[Tuple[str, Optional[str]]] = []
+        batch: List[ToolCall] = []
+        for command in commands:
+            if self._is_parallel_safe(command):
+                batch.append(command)
+                continue
+            if batch:
+                outcomes += await asyncio.gather(*map(run_limited, batch))
+                batch = []
+            outcomes.append(await self._await_tool_call(command))
+        if batch:
+            outcomes += await asyncio.gather(*map(run_limited, batch))
+        return outcomes
+
+    def _is_parallel_safe(self, command: ToolCall) -> bool:
+        """Check if a tool call may run concurrently with its neighbours"""
+        name = command.function.name
+        tool = self.available_tools.get_tool(name)
+        return bool(tool and tool.parallel_safe) and not self._is_special_tool(name)
+
+    async def _await_tool_call(self, command: ToolCall) -> Tuple[str, Optional[str]]:
+        """Get the outcome of a tool call, reusing an early-dispatched execution"""
+        # Tool calls dispatched while streaming are already running
+        task = self._dispatched_tool_calls.pop(command.id, None)
+        if task:
+            return await task
+        return await self._run_tool_call(command)
+
+    async def _run_tool_call(self, command: ToolCall) -> Tuple[str, Optional[str]]:
+        """Execute a tool call and return its observation and captured image"""
+        result = await self.execute_tool(command)
+        return result, self._tool_call_images.pop(command.id, None)
+
+    async def _dispatch_tool_call(self, command: ToolCall) -> asyncio.Task:
+        """Start executing a tool call received from a streaming response.
+
+        Each dispatched call waits for the previously dispatched one, so tools
+        still run one at a time and in the order the model emitted them. The
+        returned task is cancelled by the LLM if the stream fails.
+        """
+        previous = (
+            next(reversed(self._dispatched_tool_calls.values()))
+            if self._dispatched_tool_calls
+            else None
+        )
+
+        async def run_after_previous() -> Tuple[str, Optional[str]]:
+            if previous:
+                await asyncio.gather(previous, return_exceptions=True)
+            return await self._run_tool_call(command)
+
+        logger.info(f"🚀 Dispatching tool '{command.function.name}' early")
+        task = asyncio.create_task(run_after_previous())
+        self._dispatched_tool_calls[command.id] = task
+
+        def forget_if_cancelled(task: asyncio.Task) -> None:
+            # A cancelled call belongs to a failed stream attempt
+            if task.cancelled() and self._dispatched_tool_calls.get(command.id) is task:
+                del self._dispatched_tool_calls[command.id]
+
+        task.add_done_callback(forget_if_cancelled)
+        return task
+
+    def _cancel_dispatched_tool_calls(self) -> None:
+        """Cancel tool calls dispatched during streaming that were never consumed"""
+        for task in self._dispatched_tool_calls.values():
+            task.cancel()
+        self._dispatched_tool_calls.clear()
+
     async def execute_tool(self, command: ToolCall) -> str:
         """Execute a single tool call with robust error handling"""
         if not command or not command.function or not command.function.name:
@@ -178,7 +293,16 @@ class ToolCallAgent(ReActAgent):
 
             # Execute the tool
             logger.info(f"🔧 Activating tool: '{name}'...")
-            result = await self.available_tools.execute(name=name, tool_input=args)
+            sink = (
+                tool_output_sink.set(functools.partial(self.on_tool_output, name))
+                if self.on_tool_output
+                else None
+            )
+            try:
+                result = await self.available_tools.execute(name=name, tool_input=args)
+            finally:
+                if sink:
+                    tool_output_sink.reset(sink)
 
             # Handle special tools
             await self._handle_special_tool(name=name, result=result)
@@ -186,7 +310,7 @@ class ToolCallAgent(ReActAgent):
             # Check if result is a ToolResult with base64_image
             if hasattr(result, "base64_image") and result.base64_image:
                 # Store the base64_image for later use in tool_message
-                self._current_base64_image = result.base64_image
+                self._tool_call_images[command.id] = result.base64_image
 
             # Format result for display (standard case)
             observation = (
@@ -207,6 +331,15 @@ class ToolCallAgent(ReActAgent):
             logger.exception(error_msg)
             return f"Error: {error_msg}"
 
+    def defer_message(self, message: Message) -> None:
+        """Add a message to memory after the tool results of the current step.
+
+        Tools may run concurrently or while the model is still streaming, so a
+        message added directly could land between the assistant message and
+        its tool results, which the API rejects.
+        """
+        self._deferred_messages.append(message)
+
     async def _handle_special_tool(self, name: str, result: Any, **kwargs):
         """Handle special tool execution and state changes"""
         if not self._is_special_tool(name):
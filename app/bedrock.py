@@ -1,13 +1,21 @@
+import asyncio
+import functools
 import json
 import sys
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Literal, Optional
+from typing import AsyncIterator, Dict, List, Literal, Optional
 
 import boto3
+from botocore.config import Config as BotoConfig
 
 
+# boto3 calls block, so they run on a bounded pool of worker threads. A
+# streaming call holds its worker until the stream is drained or closed.
+DEFAULT_MAX_WORKERS = 8
 
 
 # Class to handle OpenAI-style response formatting
@@ -25,19 +33,35 @@ class OpenAIResponse:
             setattr(self, key, value)
 
     def model_dump(self, *args, **kwargs):
-        # Convert object to dict and add timestamp
-        data = self.__dict__
+        # Convert object to plain, JSON serializable dicts and add timestamp
+        data = self._to_dict()
         data["created_at"] = datetime.now().isoformat()
         return data
 
+    def _to_dict(self) -> Dict:
+        def plain(value):
+            if isinstance(value, OpenAIResponse):
+                return value._to_dict()
+            if isinstance(value, list):
+                return [plain(item) for item in value]
+            return value
+
+        return {key: plain(value) for key, value in self.__dict__.items()}
+
 
 # Main client class for interacting with Amazon Bedrock
 class BedrockClient:
-    def __init__(self):
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS):
         # Initialize Bedrock client, you need to configure AWS env first
         try:
-            self.client = boto3.client("bedrock-runtime")
-            self.chat = Chat(self.client)
+            self.client = boto3.client(
+                "bedrock-runtime",
+                config=BotoConfig(max_pool_connections=max_workers),
+            )
+            self.executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="bedrock"
+            )
+            self.chat = Chat(self.client, self.executor)
         except Exception as e:
             print(f"Error initializing Bedrock client: {e}")
             sys.exit(1)
@@ -45,14 +69,15 @@ class BedrockClient:
 
 # Chat interface class
 class Chat:
-    def __init__(self, client):
-        self.completions = ChatCompletions(client)
+    def __init__(self, client, executor: ThreadPoolExecutor):
+        self.completions = ChatCompletions(client, executor)
 
 
 # Core class handling chat completions functionality
 class ChatCompletions:
-    def __init__(self, client):
+    def __init__(self, client, executor: ThreadPoolExecutor):
         self.client = client
+        self.executor = executor
         # Track the current tool use ID between message conversions
         self.current_tooluse_id: Optional[str] = None
 
@@ -80,6 +105,9 @@ class ChatCompletions:
                     }
                 }
                 bedrock_tools.append(bedrock_tool)
+                # Translate prompt caching breakpoints into Bedrock cache points
+                if tool.get("cache_control"):
+                    bedrock_tools.append({"cachePoint": {"type": "default"}})
         return bedrock_tools
 
     def _convert_openai_messages_to_bedrock_format(self, messages):
@@ -88,7 +116,14 @@ class ChatCompletions:
         system_prompt = []
         for message in messages:
             if message.get("role") == "system":
-                system_prompt = [{"text": message.get("content")}]
+                content = message.get("content")
+                if isinstance(content, list):
+                    # Content parts, possibly carrying a cache_control breakpoint
+                    system_prompt = [{"text": item.get("text", "")} for item in content]
+                    if any(item.get("cache_control") for item in content):
+                        system_prompt.append({"cachePoint": {"type": "default"}})
+                else:
+                    system_prompt = [{"text": content}]
             elif message.get("role") == "user":
                 bedrock_message = {
                     "role": message.get("role", "user"),
@@ -187,10 +222,45 @@ class ChatCompletions:
                     "inputTokens", 0
                 ),
                 "total_tokens": bedrock_response.get("usage", {}).get("totalTokens", 0),
+                "prompt_tokens_details": {
+                    "cached_tokens": bedrock_response.get("usage", {}).get(
+                        "cacheReadInputTokens", 0
+                    ),
+                },
             },
         }
         return OpenAIResponse(openai_format)
 
+    def _build_converse_request(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        tools: Optional[List[dict]] = None,
+    ) -> dict:
+        # Build the keyword arguments shared by converse and converse_stream
+        (
+            system_prompt,
+            bedrock_messages,
+        ) = self._convert_openai_messages_to_bedrock_format(messages)
+        request = {
+            "modelId": model,
+            "system": system_prompt,
+            "messages": bedrock_messages,
+            "inferenceConfig": {"temperature": temperature, "maxTokens": max_tokens},
+        }
+        if tools:
+            request["toolConfig"] = {"tools": tools}
+        return request
+
+    async def _run_blocking(self, func, *args, **kwargs):
+        # Run a blocking boto3 call on the worker pool without stalling the loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
+
     async def _invoke_bedrock(
         self,
         model: str,
@@ -202,17 +272,10 @@ class ChatCompletions:
         **kwargs,
     ) -> OpenAIResponse:
         # Non-streaming invocation of Bedrock model
-        (
-            system_prompt,
-            bedrock_messages,
-        ) = self._convert_openai_messages_to_bedrock_format(messages)
-        response = self.client.converse(
-            modelId=model,
-            system=system_prompt,
-            messages=bedrock_messages,
-            inferenceConfig={"temperature": temperature, "maxTokens": max_tokens},
-            toolConfig={"tools": tools} if tools else None,
+        request = self._build_converse_request(
+            model, messages, max_tokens, temperature, tools
         )
+        response = await self._run_blocking(self.client.converse, **request)
         openai_response = self._convert_bedrock_response_to_openai_format(response)
         return openai_response
 
@@ -225,76 +288,169 @@ class ChatCompletions:
         tools: Optional[List[dict]] = None,
         tool_choice: Literal["none", "auto", "required"] = "auto",
         **kwargs,
-    ) -> OpenAIResponse:
-        # Streaming invocation of Bedrock model
-        (
-            system_prompt,
-            bedrock_messages,
-        ) = self._convert_openai_messages_to_bedrock_format(messages)
-        response = self.client.converse_stream(
-            modelId=model,
-            system=system_prompt,
-            messages=bedrock_messages,
-            inferenceConfig={"temperature": temperature, "maxTokens": max_tokens},
-            toolConfig={"tools": tools} if tools else None,
+    ) -> AsyncIterator[OpenAIResponse]:
+        # Streaming invocation of Bedrock model. The request is sent before
+        # returning so connection and throttling errors surface to the caller
+        # here, like they do for the OpenAI client.
+        request = self._build_converse_request(
+            model, messages, max_tokens, temperature, tools
+        )
+        response = await self._run_blocking(self.client.converse_stream, **request)
+        return self._convert_bedrock_events_to_openai_chunks(
+            self._iter_bedrock_events(response.get("stream")), model
         )
 
-        # Initialize response structure
-        bedrock_response = {
-            "output": {"message": {"role": "", "content": []}},
-            "stopReason": "",
-            "usage": {},
-            "metrics": {},
-        }
-        bedrock_response_text = ""
-        bedrock_response_tool_input = ""
+    async def _iter_bedrock_events(self, stream) -> AsyncIterator[dict]:
+        """Yield events from a blocking boto3 EventStream.
 
-        # Process streaming response
-        stream = response.get("stream")
-        if stream:
-            for event in stream:
-                if event.get("messageStart", {}).get("role"):
-                    bedrock_response["output"]["message"]["role"] = event[
-                        "messageStart"
-                    ]["role"]
-                if event.get("contentBlockDelta", {}).get("delta", {}).get("text"):
-                    bedrock_response_text += event["contentBlockDelta"]["delta"]["text"]
-                    print(
-                        event["contentBlockDelta"]["delta"]["text"], end="", flush=True
-                    )
-                if event.get("contentBlockStop", {}).get("contentBlockIndex") == 0:
-                    bedrock_response["output"]["message"]["content"].append(
-                        {"text": bedrock_response_text}
-                    )
-                if event.get("contentBlockStart", {}).get("start", {}).get("toolUse"):
-                    bedrock_tool_use = event["contentBlockStart"]["start"]["toolUse"]
-                    tool_use = {
-                        "toolUseId": bedrock_tool_use["toolUseId"],
-                        "name": bedrock_tool_use["name"],
+        A worker thread drains the stream and hands each event to the event
+        loop through a queue. Closing the iterator early (break, cancellation)
+        closes the underlying stream, which releases the worker thread.
+        """
+        if stream is None:
+            return
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stopped = threading.Event()
+        finished = object()
+
+        def emit(item) -> None:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # Event loop already closed, nobody is listening anymore
+                stopped.set()
+
+        def pump() -> None:
+            try:
+                for event in stream:
+                    if stopped.is_set():
+                        break
+                    emit(event)
+            except Exception as e:
+                if not stopped.is_set():
+                    emit(e)
+            finally:
+                emit(finished)
+
+        loop.run_in_executor(self.executor, pump)
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+            stream.close()
+
+    async def _convert_bedrock_events_to_openai_chunks(
+        self, events: AsyncIterator[dict], model: str
+    ) -> AsyncIterator[OpenAIResponse]:
+        # Convert Bedrock stream events to OpenAI chat.completion.chunk objects
+        chunk_id = f"chatcmpl-{uuid.uuid4()}"
+        created = int(time.time())
+        # Maps Bedrock content block index -> OpenAI tool call index
+        tool_call_indexes: Dict[int, int] = {}
+        tool_calls_with_input = set()
+
+        def make_chunk(delta=None, finish_reason=None, usage=None):
+            choices = []
+            if usage is None:
+                choices.append(
+                    {
+                        "index": 0,
+                        "delta": {
+                            "role": None,
+                            "content": None,
+                            "tool_calls": None,
+                            **(delta or {}),
+                        },
+                        "finish_reason": finish_reason,
                     }
-                    bedrock_response["output"]["message"]["content"].append(
-                        {"toolUse": tool_use}
+                )
+            return OpenAIResponse(
+                {
+                    "id": chunk_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": choices,
+                    "usage": usage,
+                }
+            )
+
+        def tool_call_delta(index, tool_use_id=None, name=None, arguments=None):
+            return {
+                "tool_calls": [
+                    {
+                        "index": index,
+                        "id": tool_use_id,
+                        "type": "function" if tool_use_id else None,
+                        "function": {"name": name, "arguments": arguments},
+                    }
+                ]
+            }
+
+        try:
+            async for event in events:
+                if "messageStart" in event:
+                    role = event["messageStart"].get("role", "assistant")
+                    yield make_chunk({"role": role})
+                elif "contentBlockStart" in event:
+                    start = event["contentBlockStart"]
+                    tool_use = start.get("start", {}).get("toolUse")
+                    if tool_use:
+                        index = len(tool_call_indexes)
+                        tool_call_indexes[start.get("contentBlockIndex")] = index
+                        # Remember the tool use ID to attach subsequent results
+                        self.current_tooluse_id = tool_use["toolUseId"]
+                        yield make_chunk(
+                            tool_call_delta(
+                                index, tool_use["toolUseId"], tool_use["name"], ""
+                            )
+                        )
+                elif "contentBlockDelta" in event:
+                    block = event["contentBlockDelta"]
+                    delta = block.get("delta", {})
+                    if delta.get("text"):
+                        yield make_chunk({"content": delta["text"]})
+                    elif delta.get("toolUse") and delta["toolUse"].get("input"):
+                        index = tool_call_indexes.get(block.get("contentBlockIndex"))
+                        if index is not None:
+                            tool_calls_with_input.add(index)
+                            yield make_chunk(
+                                tool_call_delta(
+                                    index, arguments=delta["toolUse"]["input"]
+                                )
+                            )
+                elif "contentBlockStop" in event:
+                    block_index = event["contentBlockStop"].get("contentBlockIndex")
+                    index = tool_call_indexes.get(block_index)
+                    if index is not None and index not in tool_calls_with_input:
+                        # Tools without parameters stream no input at all
+                        yield make_chunk(tool_call_delta(index, arguments="{}"))
+                elif "messageStop" in event:
+                    yield make_chunk(
+                        finish_reason=event["messageStop"].get("stopReason", "end_turn")
                     )
-                    # Remember the tool use ID to attach subsequent results
-                    self.current_tooluse_id = bedrock_tool_use["toolUseId"]
-                if event.get("contentBlockDelta", {}).get("delta", {}).get("toolUse"):
-                    bedrock_response_tool_input += event["contentBlockDelta"]["delta"][
-                        "toolUse"
-                    ]["input"]
-                    print(
-                        event["contentBlockDelta"]["delta"]["toolUse"]["input"],
-                        end="",
-                        flush=True,
+                elif "metadata" in event:
+                    usage = event["metadata"].get("usage", {})
+                    yield make_chunk(
+                        usage={
+                            "completion_tokens": usage.get("outputTokens", 0),
+                            "prompt_tokens": usage.get("inputTokens", 0),
+                            "total_tokens": usage.get("totalTokens", 0),
+                            "prompt_tokens_details": {
+                                "cached_tokens": usage.get("cacheReadInputTokens", 0)
+                            },
+                        }
                     )
-                if event.get("contentBlockStop", {}).get("contentBlockIndex") == 1:
-                    bedrock_response["output"]["message"]["content"][1]["toolUse"][
-                        "input"
-                    ] = json.loads(bedrock_response_tool_input)
-        print()
-        openai_response = self._convert_bedrock_response_to_openai_format(
-            bedrock_response
-        )
-        return openai_response
+        finally:
+            await events.aclose()
 
     def create(
         self,
@@ -5,9 +5,9 @@ try:
 except ImportError:
     import tomli as tomllib
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Literal, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 
 def get_project_root() -> Path:
@@ -31,6 +31,156 @@ class LLMSettings(BaseModel):
     temperature: float = Field(1.0, description="Sampling temperature")
     api_type: str = Field(..., description="Azure, Openai, or Ollama")
     api_version: str = Field(..., description="Azure Openai version if AzureOpenai")
+    prompt_caching: Optional[bool] = Field(
+        None,
+        description="Mark cache breakpoints on the system prompt and tools (Anthropic/Bedrock prompt caching). None uses the model's capabilities",
+    )
+    stream_usage: bool = Field(
+        True,
+        description="Request a usage block at the end of streamed responses (stream_options.include_usage)",
+    )
+    max_retries: int = Field(
+        5, description="Maximum retries of transient (network, 429, 5xx) failures"
+    )
+    retry_deadline: float = Field(
+        300.0, description="Total seconds allowed per call including retries"
+    )
+    requests_per_minute: Optional[int] = Field(
+        None,
+        description="Client-side request rate limit for this model, endpoint and API key (None for unlimited)",
+    )
+    tokens_per_minute: Optional[int] = Field(
+        None,
+        description="Client-side input token rate limit for this model, endpoint and API key (None for unlimited)",
+    )
+    endpoints: Optional[List[str]] = Field(
+        None,
+        description="Names of equivalent [llm.<name>] configs to balance requests across (None for a single endpoint)",
+    )
+    hedge_percentile: Optional[float] = Field(
+        0.95,
+        description="Latency percentile after which a request is duplicated on a second endpoint (None to disable hedging)",
+    )
+    full_detail_images: Optional[int] = Field(
+        2,
+        description="Number of most recent images in the history sent at full detail (None for all)",
+    )
+    stale_images: Literal["low", "drop"] = Field(
+        "low",
+        description="Send older images at low detail or replace them with a placeholder",
+    )
+
+
+class ModelCapabilities(BaseModel):
+    """Limits, features and pricing of a model, used to shape requests"""
+
+    context_window: Optional[int] = Field(
+        None, description="Maximum input tokens per request (None if unknown)"
+    )
+    max_output_tokens: Optional[int] = Field(
+        None, description="Maximum completion tokens per request (None if unknown)"
+    )
+    tokenizer: Optional[str] = Field(
+        None,
+        description="tiktoken encoding used for local token counts (None to resolve from the model name)",
+    )
+    supports_images: bool = Field(False, description="Accepts image inputs")
+    supports_prompt_caching: bool = Field(
+        False, description="Supports cache_control prompt caching breakpoints"
+    )
+    supports_tool_streaming: bool = Field(True, description="Streams tool call deltas")
+    reasoning: bool = Field(
+        False,
+        description="Reasoning model: takes max_completion_tokens and no temperature",
+    )
+    input_price: Optional[float] = Field(
+        None, description="USD per million input tokens"
+    )
+    cached_input_price: Optional[float] = Field(
+        None, description="USD per million input tokens served from the prompt cache"
+    )
+    output_price: Optional[float] = Field(
+        None, description="USD per million output tokens"
+    )
+
+
+class LLMCacheSettings(BaseModel):
+    """Configuration for the local LLM response cache"""
+
+    mode: str = Field(
+        "off",
+        description="off, cache (read-through), record (always call and store) or replay (offline, cache only)",
+    )
+    path: str = Field(
+        "cache/llm_responses.sqlite",
+        description="SQLite database path, relative to the project root if not absolute",
+    )
+    max_size_mb: int = Field(
+        256,
+        description="Maximum cache size in MB before least recently used entries are evicted",
+    )
+
+
+class LLMBatchSettings(BaseModel):
+    """Configuration for batched submission of non-streaming LLM requests"""
+
+    mode: str = Field(
+        "off",
+        description="off, local (concurrent bursts, for vLLM/Ollama style servers) or provider (OpenAI/Azure batch API)",
+    )
+    max_batch_size: int = Field(
+        64, description="Submit a batch once this many requests are queued"
+    )
+    max_wait: float = Field(
+        1.0, description="Seconds to wait for more requests before submitting"
+    )
+    local_concurrency: int = Field(
+        16, description="Concurrent requests per batch in local mode"
+    )
+    completion_window: str = Field(
+        "24h", description="Completion window of provider batch jobs"
+    )
+    poll_interval: float = Field(
+        30.0, description="Seconds between provider batch job status checks"
+    )
+
+
+class MemorySettings(BaseModel):
+    """Configuration for persisting agent memory across processes"""
+
+    backend: str = Field(
+        "memory",
+        description="memory (in-process only) or sqlite (persistent, resumable sessions)",
+    )
+    path: str = Field(
+        "data/memory.sqlite",
+        description="SQLite database path, relative to the project root if not absolute",
+    )
+    hot_messages: int = Field(
+        20,
+        description="Latest messages per session kept in RAM with a persistent backend",
+    )
+    cached_messages: int = Field(
+        100,
+        description="Older messages per session kept in RAM once read back from a persistent backend",
+    )
+
+
+class HTTPPoolSettings(BaseModel):
+    """Configuration for the shared HTTP connection pool used by LLM clients"""
+
+    max_connections: int = Field(100, description="Maximum concurrent connections")
+    max_keepalive_connections: int = Field(
+        20, description="Maximum idle keep-alive connections"
+    )
+    keepalive_expiry: float = Field(
+        30.0, description="Seconds an idle keep-alive connection is kept open"
+    )
+    http2: bool = Field(
+        True, description="Use HTTP/2 when the 'h2' package is installed"
+    )
+    timeout: float = Field(600.0, description="Default request timeout (seconds)")
+    connect_timeout: float = Field(5.0, description="Connection timeout (seconds)")
 
 
 class ProxySettings(BaseModel):
@@ -92,6 +242,22 @@ class BrowserSettings(BaseModel):
     max_content_length: int = Field(
         2000, description="Maximum length for content retrieval operations"
     )
+    screenshot_full_page: bool = Field(
+        False, description="Capture the full page instead of the viewport"
+    )
+    screenshot_format: Literal["jpeg", "webp"] = Field(
+        "jpeg", description="Image format of browser state screenshots"
+    )
+    screenshot_quality: int = Field(
+        80, description="JPEG/WebP quality of screenshots (1-100)"
+    )
+    screenshot_resize: bool = Field(
+        True,
+        description="Downscale screenshots to the resolution the model tiles them at",
+    )
+    screenshot_skip_unchanged: bool = Field(
+        True, description="Skip the screenshot when the page DOM has not changed"
+    )
 
 
 class SandboxSettings(BaseModel):
@@ -106,6 +272,10 @@ class SandboxSettings(BaseModel):
     network_enabled: bool = Field(
         False, description="Whether network access is allowed"
     )
+    max_output_chars: Optional[int] = Field(
+        100000,
+        description="Characters of command output returned, keeping the start and end",
+    )
 
 
 class MCPServerConfig(BaseModel):
@@ -117,6 +287,10 @@ class MCPServerConfig(BaseModel):
     args: List[str] = Field(
         default_factory=list, description="Arguments for stdio command"
     )
+    parallel_safe: bool = Field(
+        False,
+        description="Whether the server's tools may run concurrently with other tool calls",
+    )
 
 
 class MCPSettings(BaseModel):
@@ -149,6 +323,7 @@ class MCPSettings(BaseModel):
                         url=server_config.get("url"),
                         command=server_config.get("command"),
                         args=server_config.get("args", []),
+                        parallel_safe=server_config.get("parallel_safe", False),
                     )
                 return servers
         except Exception as e:
@@ -157,6 +332,21 @@ class MCPSettings(BaseModel):
 
 class AppConfig(BaseModel):
     llm: Dict[str, LLMSettings]
+    models: Dict[str, ModelCapabilities] = Field(
+        default_factory=dict, description="Model capability overrides by model name"
+    )
+    llm_cache: Optional[LLMCacheSettings] = Field(
+        None, description="LLM response cache configuration"
+    )
+    llm_batch: Optional[LLMBatchSettings] = Field(
+        None, description="LLM batch submission configuration"
+    )
+    http_pool: Optional[HTTPPoolSettings] = Field(
+        None, description="HTTP connection pool configuration"
+    )
+    memory: Optional[MemorySettings] = Field(
+        None, description="Agent memory persistence configuration"
+    )
     sandbox: Optional[SandboxSettings] = Field(
         None, description="Sandbox configuration"
     )
@@ -174,6 +364,18 @@ class AppConfig(BaseModel):
     class Config:
         arbitrary_types_allowed = True
 
+    @model_validator(mode="after")
+    def _check_endpoints(self) -> "AppConfig":
+        """Reject endpoint pools naming [llm.<name>] configs that do not exist"""
+        for name, settings in self.llm.items():
+            unknown = [e for e in settings.endpoints or [] if e not in self.llm]
+            if unknown:
+                raise ValueError(
+                    f"LLM config '{name}' lists unknown endpoints: {', '.join(unknown)}"
+                    f" (known: {', '.join(self.llm)})"
+                )
+        return self
+
 
 class Config:
     _instance = None
@@ -227,6 +429,16 @@ class Config:
             "temperature": base_llm.get("temperature", 1.0),
             "api_type": base_llm.get("api_type", ""),
             "api_version": base_llm.get("api_version", ""),
+            "prompt_caching": base_llm.get("prompt_caching"),
+            "stream_usage": base_llm.get("stream_usage", True),
+            "max_retries": base_llm.get("max_retries", 5),
+            "retry_deadline": base_llm.get("retry_deadline", 300.0),
+            "requests_per_minute": base_llm.get("requests_per_minute"),
+            "tokens_per_minute": base_llm.get("tokens_per_minute"),
+            "endpoints": base_llm.get("endpoints"),
+            "hedge_percentile": base_llm.get("hedge_percentile", 0.95),
+            "full_detail_images": base_llm.get("full_detail_images", 2),
+            "stale_images": base_llm.get("stale_images", "low"),
         }
 
         # handle browser config.
@@ -281,6 +493,35 @@ class Config:
         else:
             mcp_settings = MCPSettings(servers=MCPSettings.load_server_config())
 
+        llm_cache_config = raw_config.get("llm_cache", {})
+        if llm_cache_config:
+            llm_cache_settings = LLMCacheSettings(**llm_cache_config)
+        else:
+            llm_cache_settings = LLMCacheSettings()
+
+        models_settings = {
+            name: ModelCapabilities(**capabilities)
+            for name, capabilities in raw_config.get("models", {}).items()
+        }
+
+        llm_batch_config = raw_config.get("llm_batch", {})
+        if llm_batch_config:
+            llm_batch_settings = LLMBatchSettings(**llm_batch_config)
+        else:
+            llm_batch_settings = LLMBatchSettings()
+
+        http_pool_config = raw_config.get("http_pool", {})
+        if http_pool_config:
+            http_pool_settings = HTTPPoolSettings(**http_pool_config)
+        else:
+            http_pool_settings = HTTPPoolSettings()
+
+        memory_config = raw_config.get("memory", {})
+        if memory_config:
+            memory_settings = MemorySettings(**memory_config)
+        else:
+            memory_settings = MemorySettings()
+
         run_flow_config = raw_config.get("runflow")
         if run_flow_config:
             run_flow_settings = RunflowSettings(**run_flow_config)
@@ -290,10 +531,16 @@ class Config:
             "llm": {
                 "default": default_settings,
                 **{
-                    name: {**default_settings, **override_config}
+                    # An endpoint pool belongs to the config that declares it
+                    name: {**default_settings, "endpoints": None, **override_config}
                     for name, override_config in llm_overrides.items()
                 },
             },
+            "models": models_settings,
+            "llm_cache": llm_cache_settings,
+            "llm_batch": llm_batch_settings,
+            "http_pool": http_pool_settings,
+            "memory": memory_settings,
             "sandbox": sandbox_settings,
             "browser_config": browser_settings,
             "search_config": search_settings,
@@ -307,6 +554,31 @@ class Config:
     def llm(self) -> Dict[str, LLMSettings]:
         return self._config.llm
 
+    @property
+    def models(self) -> Dict[str, ModelCapabilities]:
+        """Get the model capability overrides from config"""
+        return self._config.models
+
+    @property
+    def llm_cache(self) -> LLMCacheSettings:
+        """Get the LLM response cache configuration"""
+        return self._config.llm_cache
+
+    @property
+    def llm_batch(self) -> LLMBatchSettings:
+        """Get the LLM batch submission configuration"""
+        return self._config.llm_batch
+
+    @property
+    def memory(self) -> MemorySettings:
+        """Get the agent memory persistence configuration"""
+        return self._config.memory
+
+    @property
+    def http_pool(self) -> HTTPPoolSettings:
+        """Get the HTTP connection pool configuration"""
+        return self._config.http_pool
+
     @property
     def sandbox(self) -> SandboxSettings:
         return self._config.sandbox
@@ -11,3 +11,11 @@ class OpenManusError(Exception):
 
 class TokenLimitExceeded(OpenManusError):
     """Exception raised when the token limit is exceeded"""
+
+
+class ResponseCacheMiss(OpenManusError):
+    """Exception raised when a response is missing from the cache in replay mode"""
+
+
+class LLMBatchError(OpenManusError):
+    """Exception raised when a request submitted in a batch has no usable result"""
@@ -1,7 +1,7 @@
 import json
 import time
 from enum import Enum
-from typing import Dict, List, Optional, Union
+from typing import Awaitable, Callable, Dict, List, Optional, Union
 
 from pydantic import Field
 
@@ -50,6 +50,10 @@ class PlanningFlow(BaseFlow):
     executor_keys: List[str] = Field(default_factory=list)
     active_plan_id: str = Field(default_factory=lambda: f"plan_{int(time.time())}")
     current_step_index: Optional[int] = None
+    # Optional coroutine receiving the final summary tokens as they stream
+    on_token: Optional[Callable[[str], Awaitable[None]]] = Field(
+        default=None, exclude=True
+    )
 
     def __init__(
         self, agents: Union[BaseAgent, List[BaseAgent], Dict[str, BaseAgent]], **data
@@ -418,7 +422,9 @@ class PlanningFlow(BaseFlow):
             )
 
             response = await self.llm.ask(
-                messages=[user_message], system_msgs=[system_message]
+                messages=[user_message],
+                system_msgs=[system_message],
+                on_token=self.on_token,
             )
 
             return f"Plan completed:\n\n{response}"
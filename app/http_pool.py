@@ -0,0 +1,138 @@
+"""
+Shared HTTP connection pool for LLM clients.
+
+All ``AsyncOpenAI`` / ``AsyncAzureOpenAI`` clients are given the same
+``httpx.AsyncClient`` so that concurrent agents and web sessions reuse
+keep-alive (and, when ``h2`` is installed, HTTP/2) connections to the model
+endpoint instead of each paying its own TLS handshake.
+
+httpx connections are bound to the event loop they were opened on, so the
+shared client routes every request through a per-loop connection pool.
+"""
+
+import asyncio
+import importlib.util
+import threading
+from typing import Dict, Optional
+
+import httpx
+from openai import DefaultAsyncHttpxClient
+
+from app.config import HTTPPoolSettings, config
+from app.logger import logger
+
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class LoopAwareTransport(httpx.AsyncBaseTransport):
+    """Async transport that keeps one connection pool per running event loop."""
+
+    def __init__(self, settings: HTTPPoolSettings):
+        self.settings = settings
+        self.http2 = settings.http2 and HTTP2_AVAILABLE
+        if settings.http2 and not HTTP2_AVAILABLE:
+            logger.warning("HTTP/2 requested but 'h2' is not installed, using HTTP/1.1")
+        self.limits = httpx.Limits(
+            max_connections=settings.max_connections,
+            max_keepalive_connections=settings.max_keepalive_connections,
+            keepalive_expiry=settings.keepalive_expiry,
+        )
+
+        self._transports: Dict[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport] = {}
+        self._lock = threading.Lock()
+        self._total_requests = 0
+        self._active_requests = 0
+
+    def _get_transport(self) -> httpx.AsyncHTTPTransport:
+        """Get the connection pool for the running event loop, creating it if needed"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                # Pools of closed loops can never be used again
+                for closed in [lp for lp in self._transports if lp.is_closed()]:
+                    del self._transports[closed]
+                transport = httpx.AsyncHTTPTransport(
+                    limits=self.limits, http2=self.http2
+                )
+                self._transports[loop] = transport
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        transport = self._get_transport()
+        self._total_requests += 1
+        self._active_requests += 1
+        try:
+            return await transport.handle_async_request(request)
+        finally:
+            self._active_requests -= 1
+
+    async def aclose(self) -> None:
+        """Close the connection pool of the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.pop(loop, None)
+        if transport:
+            await transport.aclose()
+
+    def get_stats(self) -> Dict:
+        """Gets connection pool statistics.
+
+        Returns:
+            Dict: Statistics information.
+        """
+        with self._lock:
+            transports = list(self._transports.values())
+        connections = idle_connections = 0
+        for transport in transports:
+            pool = getattr(transport, "_pool", None)
+            for connection in getattr(pool, "connections", []):
+                connections += 1
+                if connection.is_idle():
+                    idle_connections += 1
+        return {
+            "event_loops": len(transports),
+            "connections": connections,
+            "idle_connections": idle_connections,
+            "total_requests": self._total_requests,
+            "active_requests": self._active_requests,
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+        }
+
+
+_shared_transport: Optional[LoopAwareTransport] = None
+_shared_client: Optional[httpx.AsyncClient] = None
+_shared_client_lock = threading.Lock()
+
+
+def get_shared_http_client() -> httpx.AsyncClient:
+    """Get the process-wide HTTP client used by all LLM clients"""
+    global _shared_client, _shared_transport
+    with _shared_client_lock:
+        if _shared_client is None:
+            settings = config.http_pool or HTTPPoolSettings()
+            _shared_transport = LoopAwareTransport(settings)
+            _shared_client = DefaultAsyncHttpxClient(
+                transport=_shared_transport,
+                timeout=httpx.Timeout(
+                    settings.timeout, connect=settings.connect_timeout
+                ),
+            )
+        return _shared_client
+
+
+def get_http_pool_stats() -> Dict:
+    """Gets statistics of the shared connection pool"""
+    if _shared_transport is None:
+        return {}
+    return _shared_transport.get_stats()
+
+
+async def close_loop_connections() -> None:
+    """Close the shared connection pool of the running event loop"""
+    if _shared_transport is not None:
+        await _shared_transport.aclose()
@@ -0,0 +1,112 @@
+"""
+Content-addressed store for message images.
+
+Screenshots are attached to messages on most browser steps and kept for the
+whole session. Rather than holding each one as a base64 string inside its
+message, the decoded bytes are stored once under their SHA-256 digest and
+messages keep only the digest. Identical images are stored once, and an
+image is freed when the last message referencing it is garbage collected.
+"""
+
+import base64
+import binascii
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+
+
+class ImageStore:
+    """Reference-counted image bytes keyed by content digest"""
+
+    def __init__(self):
+        # digest -> (bytes, whether the bytes are decoded base64)
+        self._images: Dict[str, Tuple[bytes, bool]] = {}
+        self._refs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def put(self, base64_image: str) -> str:
+        """Store a base64 encoded image and return its digest.
+
+        The caller holds a reference on the image and must release it.
+        """
+        try:
+            data, decoded = base64.b64decode(base64_image, validate=True), True
+        except (binascii.Error, ValueError):
+            # Not strict base64 (e.g. a data URL), keep the text as is
+            data, decoded = base64_image.encode("utf-8"), False
+        return self.put_bytes(data, decoded)
+
+    def put_bytes(self, data: bytes, decoded: bool = True) -> str:
+        """Store raw image bytes and return their digest.
+
+        The reference is taken under the same lock as the insertion, so the
+        image cannot be freed before the caller releases it.
+
+        Args:
+            data: Image bytes
+            decoded: Whether the bytes are decoded base64, rather than text
+                that is returned as is
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if digest not in self._images:
+                self._images[digest] = (data, decoded)
+                self._refs[digest] = 0
+            self._refs[digest] += 1
+        return digest
+
+    def acquire(self, digest: str) -> None:
+        """Add a reference to a stored image.
+
+        Raises:
+            KeyError: If the image is not stored, e.g. already freed
+        """
+        with self._lock:
+            if digest not in self._refs:
+                raise KeyError(f"Image {digest} is not stored")
+            self._refs[digest] += 1
+
+    def release(self, digest: str) -> None:
+        """Drop a reference to an image, freeing it with the last one"""
+        with self._lock:
+            if digest not in self._refs:
+                return
+            self._refs[digest] -= 1
+            if self._refs[digest] <= 0:
+                del self._refs[digest]
+                del self._images[digest]
+
+    def get(self, digest: str) -> Optional[str]:
+        """Get an image as a base64 string, None if it is not stored"""
+        entry = self._images.get(digest)
+        if entry is None:
+            return None
+        data, decoded = entry
+        return base64.b64encode(data).decode("ascii") if decoded else data.decode()
+
+    def get_bytes(self, digest: str) -> Optional[bytes]:
+        """Get the raw bytes of an image, None if it is not stored"""
+        entry = self._images.get(digest)
+        return entry[0] if entry else None
+
+    def get_entry(self, digest: str) -> Optional[Tuple[bytes, bool]]:
+        """Get the stored bytes of an image and whether they are decoded base64"""
+        return self._images.get(digest)
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._images
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Number of stored images and their total size in bytes"""
+        with self._lock:
+            return {
+                "images": len(self._images),
+                "bytes": sum(len(data) for data, _ in self._images.values()),
+            }
+
+
+# Process-wide store shared by all messages
+image_store = ImageStore()
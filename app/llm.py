@@ -1,45 +1,220 @@
+import asyncio
+import functools
+import hashlib
+import json
 import math
-from typing import Dict, List, Optional, Union
+import random
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
+import httpx
 import tiktoken
+from botocore.exceptions import ClientError as BotoClientError
+from botocore.exceptions import ConnectionError as BotoConnectionError
+from botocore.exceptions import HTTPClientError as BotoHTTPClientError
 from openai import (
+    APIConnectionError,
     APIError,
+    APIStatusError,
     AsyncAzureOpenAI,
     AsyncOpenAI,
     AuthenticationError,
     OpenAIError,
     RateLimitError,
 )
-from openai.types.chat import ChatCompletion, ChatCompletionMessage
-from tenacity import (
-    retry,
-    retry_if_exception_type,
-    stop_after_attempt,
-    wait_random_exponential,
+from openai.types.chat import (
+    ChatCompletion,
+    ChatCompletionMessage,
+    ChatCompletionMessageToolCall,
 )
+from openai.types.chat.chat_completion_message_tool_call import Function
+from tenacity import RetryCallState, retry, wait_random_exponential
 
 from app.bedrock import BedrockClient
-from app.config import LLMSettings, config
-from app.exceptions import TokenLimitExceeded
+from app.config import (
+    PROJECT_ROOT,
+    LLMBatchSettings,
+    LLMCacheSettings,
+    LLMSettings,
+    config,
+)
+from app.exceptions import LLMBatchError, ResponseCacheMiss, TokenLimitExceeded
+from app.http_pool import get_shared_http_client
 from app.logger import logger  # Assuming a logger is set up in your app
+from app.model_registry import get_model_capabilities
 from app.schema import (
     ROLE_VALUES,
     TOOL_CHOICE_TYPE,
     TOOL_CHOICE_VALUES,
+    FormattedMessage,
     Message,
     ToolChoice,
+    format_message_dict,
+)
+
+
+# Passed to on_token when a streamed attempt fails after sending content: the
+# text received so far is void, a retry streams the whole response again
+STREAM_RESET = "\x00stream-reset\x00"
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+# Bedrock error codes for throttling and transient service failures
+RETRYABLE_BEDROCK_CODES = {
+    "ThrottlingException",
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ModelNotReadyException",
+}
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Classify an LLM call failure as transient (retry) or permanent (fail fast).
+
+    Transient: connection errors and timeouts, HTTP 408/409/429 and 5xx, and
+    Bedrock throttling/unavailability. Everything else, including
+    authentication and other 4xx errors, token limits, replay cache misses and
+    validation errors, is permanent.
+    """
+    if isinstance(error, (TokenLimitExceeded, ResponseCacheMiss)):
+        return False
+    if isinstance(error, APIConnectionError):  # Includes APITimeoutError
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    if isinstance(error, BotoClientError):
+        return error.response.get("Error", {}).get("Code") in RETRYABLE_BEDROCK_CODES
+    return isinstance(
+        error,
+        (
+            BotoConnectionError,
+            BotoHTTPClientError,
+            httpx.TransportError,
+            asyncio.TimeoutError,
+        ),
+    )
+
+
+def _should_retry(retry_state: RetryCallState) -> bool:
+    """Retry only transient failures and count permanent ones"""
+    error = retry_state.outcome.exception()
+    if error is None:
+        return False
+    if is_retryable_error(error):
+        return True
+    retry_state.args[0].retry_stats["non_retryable"] += 1
+    return False
+
+
+def _retry_deadline(retry_state: RetryCallState) -> float:
+    """Total time budget of a call, including all of its retries"""
+    return retry_state.kwargs.get("deadline") or retry_state.args[0].retry_deadline
+
+
+def _stop_retrying(retry_state: RetryCallState) -> bool:
+    """Stop after max_retries or once the call's deadline budget is spent"""
+    llm = retry_state.args[0]
+    return (
+        retry_state.attempt_number > llm.max_retries
+        or retry_state.seconds_since_start >= _retry_deadline(retry_state)
+    )
+
+
+_random_exponential_wait = wait_random_exponential(min=1, max=60)
+
+
+def _wait_within_deadline(retry_state: RetryCallState) -> float:
+    """Exponential backoff that never sleeps past the call's deadline"""
+    remaining = _retry_deadline(retry_state) - retry_state.seconds_since_start
+    return max(0.0, min(_random_exponential_wait(retry_state), remaining))
+
+
+def _record_retry(retry_state: RetryCallState) -> None:
+    """Count and log a retry before sleeping"""
+    llm = retry_state.args[0]
+    error = retry_state.outcome.exception()
+    error_name = type(error).__name__
+    llm.retry_stats["retries"] += 1
+    llm.retry_stats["errors"][error_name] = (
+        llm.retry_stats["errors"].get(error_name, 0) + 1
+    )
+    logger.warning(
+        f"Retrying {retry_state.fn.__name__} after {error_name} "
+        f"(attempt {retry_state.attempt_number}/{llm.max_retries + 1}, "
+        f"sleeping {retry_state.upcoming_sleep:.2f}s): {error}"
+    )
+
+
+def _retries_exhausted(retry_state: RetryCallState) -> Any:
+    """Count the failure and re-raise the last error instead of a RetryError"""
+    retry_state.args[0].retry_stats["exhausted"] += 1
+    return retry_state.outcome.result()
+
+
+_retrying = retry(
+    retry=_should_retry,
+    stop=_stop_retrying,
+    wait=_wait_within_deadline,
+    before_sleep=_record_retry,
+    retry_error_callback=_retries_exhausted,
 )
 
+# Monotonic time by which the current LLM call, retries included, must end
+_call_deadline: ContextVar[Optional[float]] = ContextVar(
+    "llm_call_deadline", default=None
+)
+
+
+def llm_retry(fn: Callable) -> Callable:
+    """Retry transient failures of an LLM call within its deadline budget.
+
+    The deadline is the call's ``deadline`` argument, or the configured
+    ``retry_deadline``. Attempts read the time left with
+    ``LLM._attempt_timeout`` so that none outlives the budget.
+    """
+    retrying = _retrying(fn)
+
+    @functools.wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        budget = kwargs.get("deadline") or self.retry_deadline
+        token = _call_deadline.set(time.monotonic() + budget)
+        try:
+            return await retrying(self, *args, **kwargs)
+        finally:
+            _call_deadline.reset(token)
+
+    return wrapper
+
+
+def _stream_deadline() -> asyncio.Timeout:
+    """Timeout ending a streamed response at the current call's deadline.
 
-REASONING_MODELS = ["o1", "o3-mini"]
-MULTIMODAL_MODELS = [
-    "gpt-4-vision-preview",
-    "gpt-4o",
-    "gpt-4o-mini",
-    "claude-3-opus-20240229",
-    "claude-3-sonnet-20240229",
-    "claude-3-haiku-20240307",
-]
+    Stream timeouts only bound the wait for each chunk, so a slow drip of
+    chunks could otherwise outlast the call's budget.
+    """
+    deadline = _call_deadline.get()
+    if deadline is None:
+        return asyncio.timeout(None)
+    return asyncio.timeout(max(0.0, deadline - time.monotonic()))
 
 
 class TokenCounter:
@@ -54,8 +229,35 @@ class TokenCounter:
     HIGH_DETAIL_TARGET_SHORT_SIDE = 768
     TILE_SIZE = 512
 
+    # Maximum number of cached per-message / per-tool token counts
+    CACHE_SIZE = 4096
+
     def __init__(self, tokenizer):
         self.tokenizer = tokenizer
+        # Token counts keyed on a content hash, so that only messages and tool
+        # schemas that have not been seen before are run through the tokenizer
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        # Token counts of memoized Message.to_formatted_dict results, keyed by
+        # id() and dropped when the dict is freed, so they need no hashing
+        self._by_identity: Dict[int, int] = {}
+
+    @staticmethod
+    def _content_key(kind: str, item: Union[dict, str]) -> str:
+        """Build a stable cache key from the content of a message or tool"""
+        if not isinstance(item, str):
+            item = json.dumps(item, sort_keys=True, ensure_ascii=False, default=str)
+        return f"{kind}:{hashlib.sha1(item.encode('utf-8')).hexdigest()}"
+
+    def _cached(self, key: str, compute) -> int:
+        """Return a cached token count, computing and storing it on a miss"""
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        tokens = compute()
+        self._cache[key] = tokens
+        if len(self._cache) > self.CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return tokens
 
     def count_text(self, text: str) -> int:
         """Calculate tokens for a text string"""
@@ -92,18 +294,23 @@ class TokenCounter:
             self._calculate_high_detail_tokens(1024, 1024) if detail == "high" else 1024
         )
 
-    def _calculate_high_detail_tokens(self, width: int, height: int) -> int:
-        """Calculate tokens for high detail images based on dimensions"""
+    @classmethod
+    def high_detail_size(cls, width: int, height: int) -> Tuple[int, int]:
+        """Dimensions a high detail image is scaled to before tiling"""
         # Step 1: Scale to fit in MAX_SIZE x MAX_SIZE square
-        if width > self.MAX_SIZE or height > self.MAX_SIZE:
-            scale = self.MAX_SIZE / max(width, height)
+        if width > cls.MAX_SIZE or height > cls.MAX_SIZE:
+            scale = cls.MAX_SIZE / max(width, height)
             width = int(width * scale)
             height = int(height * scale)
 
         # Step 2: Scale so shortest side is HIGH_DETAIL_TARGET_SHORT_SIDE
-        scale = self.HIGH_DETAIL_TARGET_SHORT_SIDE / min(width, height)
-        scaled_width = int(width * scale)
-        scaled_height = int(height * scale)
+        scale = cls.HIGH_DETAIL_TARGET_SHORT_SIDE / min(width, height)
+        return int(width * scale), int(height * scale)
+
+    def _calculate_high_detail_tokens(self, width: int, height: int) -> int:
+        """Calculate tokens for high detail images based on dimensions"""
+        # Steps 1 and 2: Scale to the size the model processes
+        scaled_width, scaled_height = self.high_detail_size(width, height)
 
         # Step 3: Count number of 512px tiles
         tiles_x = math.ceil(scaled_width / self.TILE_SIZE)
@@ -144,31 +351,944 @@ class TokenCounter:
                 token_count += self.count_text(function.get("arguments", ""))
         return token_count
 
+    def count_single_message(self, message: dict) -> int:
+        """Calculate tokens for a single formatted message"""
+        tokens = self.BASE_MESSAGE_TOKENS  # Base tokens per message
+
+        # Add role tokens
+        tokens += self.count_text(message.get("role", ""))
+
+        # Add content tokens
+        if "content" in message:
+            tokens += self.count_content(message["content"])
+
+        # Add tool calls tokens
+        if "tool_calls" in message:
+            tokens += self.count_tool_calls(message["tool_calls"])
+
+        # Add name and tool_call_id tokens
+        tokens += self.count_text(message.get("name", ""))
+        tokens += self.count_text(message.get("tool_call_id", ""))
+
+        return tokens
+
     def count_message_tokens(self, messages: List[dict]) -> int:
-        """Calculate the total number of tokens in a message list"""
+        """Calculate the total number of tokens in a message list.
+
+        Per-message counts are cached by message identity and content, so on
+        each agent step only the messages added since the previous call are
+        encoded.
+        """
         total_tokens = self.FORMAT_TOKENS  # Base format tokens
 
         for message in messages:
-            tokens = self.BASE_MESSAGE_TOKENS  # Base tokens per message
+            total_tokens += self._message_tokens(message)
+
+        return total_tokens
 
-            # Add role tokens
-            tokens += self.count_text(message.get("role", ""))
+    def _message_tokens(self, message: dict) -> int:
+        """Token count of a message, cached by identity, then by content"""
+        key = id(message)
+        tokens = self._by_identity.get(key)
+        if tokens is not None:
+            return tokens
 
-            # Add content tokens
-            if "content" in message:
-                tokens += self.count_content(message["content"])
+        tokens = self._cached(
+            self._content_key("message", self._without_image_data(message)),
+            lambda: self.count_single_message(message),
+        )
+        if isinstance(message, FormattedMessage):
+            self._by_identity[key] = tokens
+            weakref.finalize(message, self._by_identity.pop, key, None)
+        return tokens
+
+    @staticmethod
+    def _without_image_data(message: dict) -> dict:
+        """The message with image URLs left out, which do not change its count.
+
+        Keeps base64 data URLs out of the content hash.
+        """
+        content = message.get("content")
+        if not isinstance(content, list) or not any(
+            isinstance(item, dict) and "image_url" in item for item in content
+        ):
+            return message
+        return {
+            **message,
+            "content": [
+                {key: value for key, value in item.items() if key != "image_url"}
+                if isinstance(item, dict) and "image_url" in item
+                else item
+                for item in content
+            ],
+        }
+
+    def count_tools(self, tools: List[dict]) -> int:
+        """Calculate tokens for tool descriptions.
+
+        Schemas from ``ToolCollection.to_params`` are counted once per
+        collection version; other schemas are cached per tool by content.
+        """
+        version = getattr(tools, "version", None)
+        if version is not None:
+            return self._cached(
+                f"tools:{version}", lambda: self._count_tool_schemas(tools)
+            )
+        return self._count_tool_schemas(tools)
+
+    def _count_tool_schemas(self, tools: List[dict]) -> int:
+        token_count = 0
+        for tool in tools:
+            token_count += self._cached(
+                self._content_key("tool", tool),
+                lambda: self.count_text(str(tool)),
+            )
+        return token_count
 
-            # Add tool calls tokens
-            if "tool_calls" in message:
-                tokens += self.count_tool_calls(message["tool_calls"])
 
-            # Add name and tool_call_id tokens
-            tokens += self.count_text(message.get("name", ""))
-            tokens += self.count_text(message.get("tool_call_id", ""))
+class LLMResponseCache:
+    """Content-addressed on-disk cache of LLM completions, backed by SQLite.
+
+    Entries are keyed on a hash of the request (model, messages, tools,
+    tool_choice, temperature) and evicted least-recently-used once the total
+    stored size exceeds ``max_size``.
+
+    Modes:
+        off: never read or write the cache
+        cache: return cached responses, call the API and store on a miss
+        record: always call the API and store (overwrite) the response
+        replay: only serve cached responses, raise ResponseCacheMiss on a miss
+    """
+
+    MODES = ("off", "cache", "record", "replay")
+
+    _instances: Dict[str, "LLMResponseCache"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: Path, max_size: int, mode: str = "cache"):
+        if mode not in self.MODES:
+            raise ValueError(f"Invalid LLM cache mode: {mode}")
+        self.path = path
+        self.max_size = max_size
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access "
+            "ON responses (last_access)"
+        )
+        self._conn.commit()
+        self._total_size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    @classmethod
+    def from_settings(
+        cls, settings: Optional[LLMCacheSettings]
+    ) -> Optional["LLMResponseCache"]:
+        """Get the shared cache for the given settings, or None if disabled"""
+        if not settings or settings.mode == "off":
+            return None
+        path = Path(settings.path)
+        if not path.is_absolute():
+            path = PROJECT_ROOT / path
+        with cls._instances_lock:
+            key = str(path)
+            if key not in cls._instances:
+                cls._instances[key] = cls(
+                    path, settings.max_size_mb * 1024 * 1024, settings.mode
+                )
+            return cls._instances[key]
 
-            total_tokens += tokens
+    @staticmethod
+    def make_key(kind: str, params: dict) -> str:
+        """Build the content address of a request"""
+        payload = {
+            "kind": kind,
+            "model": params.get("model"),
+            "messages": params.get("messages"),
+            "tools": params.get("tools"),
+            "tool_choice": params.get("tool_choice"),
+            "temperature": params.get("temperature"),
+        }
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Look up a cached response.
 
-        return total_tokens
+        Raises:
+            ResponseCacheMiss: If the response is not cached in replay mode
+        """
+        if self.mode == "record":
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE responses SET last_access = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+                self._conn.commit()
+        if row:
+            self.hits += 1
+            return json.loads(row[0])
+        self.misses += 1
+        if self.mode == "replay":
+            raise ResponseCacheMiss(f"No recorded LLM response for request {key}")
+        return None
+
+    def put(self, key: str, value: Any) -> None:
+        """Store a response and evict least recently used entries if needed"""
+        if self.mode == "replay":
+            return
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(encoded.encode("utf-8"))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                self._total_size -= row[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, encoded, size, time.time()),
+            )
+            self._total_size += size
+            while self._total_size > self.max_size:
+                oldest = self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY last_access LIMIT 1"
+                ).fetchone()
+                if not oldest:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (oldest[0],))
+                self._total_size -= oldest[1]
+            self._conn.commit()
+
+    def get_stats(self) -> Dict:
+        """Get cache statistics"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            "mode": self.mode,
+            "entries": entries,
+            "size": self._total_size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class RateLimiter:
+    """Client-side token-bucket limiter for requests and tokens per minute.
+
+    One limiter is shared by every LLM instance using the same model on the
+    same endpoint and API key, across agents, sessions, threads and event
+    loops. Each ``acquire`` reserves
+    capacity up front (the buckets may go negative) and then sleeps until its
+    reservation is covered, so callers are served in arrival order instead of
+    all retrying at once when the limit is reached.
+    """
+
+    _instances: Dict[tuple, "RateLimiter"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+        self._lock = threading.Lock()
+        self._request_budget = float(requests_per_minute or 0)
+        self._token_budget = float(tokens_per_minute or 0)
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+
+        self.total_requests = 0
+        self.total_wait = 0.0
+        self.throttled_requests = 0
+
+    @classmethod
+    def for_settings(cls, settings: LLMSettings) -> Optional["RateLimiter"]:
+        """Get the shared limiter for an LLM configuration, or None if no
+        limits are set.
+
+        Configurations share a limiter when they send the same model to the
+        same endpoint (or router endpoints) with the same API key.
+        """
+        requests_per_minute = getattr(settings, "requests_per_minute", None)
+        tokens_per_minute = getattr(settings, "tokens_per_minute", None)
+        if not requests_per_minute and not tokens_per_minute:
+            return None
+        key = (
+            settings.api_type,
+            settings.base_url,
+            hashlib.sha256((settings.api_key or "").encode("utf-8")).hexdigest(),
+            settings.model,
+            tuple(getattr(settings, "endpoints", None) or ()),
+        )
+        with cls._instances_lock:
+            limiter = cls._instances.get(key)
+            if limiter is None:
+                limiter = cls._instances[key] = cls(
+                    requests_per_minute, tokens_per_minute
+                )
+            elif (limiter.requests_per_minute, limiter.tokens_per_minute) != (
+                requests_per_minute,
+                tokens_per_minute,
+            ):
+                logger.warning(
+                    f"Rate limits of {settings.model} at {settings.base_url} differ between "
+                    f"configs, keeping the first ones (requests_per_minute="
+                    f"{limiter.requests_per_minute}, tokens_per_minute="
+                    f"{limiter.tokens_per_minute})"
+                )
+            return limiter
+
+    def _refill(self, now: float) -> None:
+        """Add the capacity accrued since the last update, capped at one minute"""
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if self.requests_per_minute:
+            self._request_budget = min(
+                float(self.requests_per_minute),
+                self._request_budget + elapsed * self.requests_per_minute / 60,
+            )
+        if self.tokens_per_minute:
+            self._token_budget = min(
+                float(self.tokens_per_minute),
+                self._token_budget + elapsed * self.tokens_per_minute / 60,
+            )
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Reserve capacity for one request.
+
+        Args:
+            tokens: Estimated tokens of the request
+
+        Returns:
+            float: Seconds to wait before sending the request
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, self._blocked_until - now)
+
+            if self.requests_per_minute:
+                self._request_budget -= 1
+                if self._request_budget < 0:
+                    wait = max(
+                        wait, -self._request_budget * 60 / self.requests_per_minute
+                    )
+            if self.tokens_per_minute:
+                # A single request larger than the bucket can only wait for a full one
+                self._token_budget -= min(tokens, self.tokens_per_minute)
+                if self._token_budget < 0:
+                    wait = max(wait, -self._token_budget * 60 / self.tokens_per_minute)
+
+            self.total_requests += 1
+            if wait > 0:
+                self.throttled_requests += 1
+                self.total_wait += wait
+            return wait
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait until a request with the given token estimate may be sent"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            logger.info(f"Rate limiter delaying request by {wait:.2f}s")
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back all requests for the given number of seconds"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def observe_rate_limit_error(self, error: RateLimitError) -> None:
+        """Honour the Retry-After header of a rate limit response"""
+        retry_after = self.parse_retry_after(getattr(error, "response", None))
+        if retry_after:
+            logger.warning(f"Rate limited by provider, pausing for {retry_after:.2f}s")
+            self.pause(retry_after)
+
+    @staticmethod
+    def parse_retry_after(response: Any) -> Optional[float]:
+        """Read the retry delay in seconds from a response's headers"""
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            try:
+                return float(retry_after_ms) / 1000
+            except ValueError:
+                pass
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, retry_at.timestamp() - time.time())
+
+    def get_stats(self) -> Dict:
+        """Get limiter statistics"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute,
+                "available_requests": self._request_budget,
+                "available_tokens": self._token_budget,
+                "total_requests": self.total_requests,
+                "throttled_requests": self.throttled_requests,
+                "total_wait": self.total_wait,
+            }
+
+
+def create_llm_client(settings: LLMSettings):
+    """Create the API client for an LLM configuration.
+
+    All OpenAI-compatible clients share one connection pool.
+    """
+    if settings.api_type == "azure":
+        return AsyncAzureOpenAI(
+            base_url=settings.base_url,
+            api_key=settings.api_key,
+            api_version=settings.api_version,
+            http_client=get_shared_http_client(),
+        )
+    if settings.api_type == "aws":
+        return BedrockClient()
+    return AsyncOpenAI(
+        api_key=settings.api_key,
+        base_url=settings.base_url,
+        http_client=get_shared_http_client(),
+    )
+
+
+class RouterEndpoint:
+    """One backend of an LLMRouter with its latency and health statistics.
+
+    Streaming and non-streaming latencies are tracked separately: for streams
+    the latency is the time until the response starts, for complete
+    responses it is the full generation time.
+    """
+
+    EWMA_ALPHA = 0.2
+    LATENCY_WINDOW = 200
+    # Samples needed before a latency percentile is trusted for hedging
+    MIN_HEDGE_SAMPLES = 20
+    MAX_COOLDOWN = 60.0
+
+    def __init__(self, name: str, model: str, client: Any):
+        self.name = name
+        self.model = model
+        self.client = client
+        self.latency_ewma: Dict[bool, Optional[float]] = {False: None, True: None}
+        self.latencies: Dict[bool, Deque[float]] = {
+            False: deque(maxlen=self.LATENCY_WINDOW),
+            True: deque(maxlen=self.LATENCY_WINDOW),
+        }
+        self.error_rate = 0.0
+        self.inflight = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def record_success(self, stream: bool, latency: float) -> None:
+        previous = self.latency_ewma[stream]
+        self.latency_ewma[stream] = (
+            latency
+            if previous is None
+            else self.EWMA_ALPHA * latency + (1 - self.EWMA_ALPHA) * previous
+        )
+        self.latencies[stream].append(latency)
+        self.error_rate *= 1 - self.EWMA_ALPHA
+        self.consecutive_failures = 0
+
+    def record_failure(self, error: BaseException) -> None:
+        """Penalise the endpoint and back off from it for a while"""
+        self.failures += 1
+        self.error_rate = self.EWMA_ALPHA + (1 - self.EWMA_ALPHA) * self.error_rate
+        self.consecutive_failures += 1
+        cooldown = min(self.MAX_COOLDOWN, 2.0 ** (self.consecutive_failures - 1))
+        retry_after = RateLimiter.parse_retry_after(getattr(error, "response", None))
+        if retry_after:
+            cooldown = max(cooldown, retry_after)
+        self.cooldown_until = time.monotonic() + cooldown
+
+    def score(self, stream: bool) -> float:
+        """Expected cost of sending one more request here, lower is better"""
+        latency = self.latency_ewma[stream]
+        if latency is None:
+            # Unmeasured endpoints are tried first so every backend gets samples
+            return 0.0
+        return latency * (self.inflight + 1) * (1 + 10 * self.error_rate)
+
+    def latency_percentile(self, stream: bool, percentile: float) -> Optional[float]:
+        samples = self.latencies[stream]
+        if len(samples) < self.MIN_HEDGE_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+    def get_stats(self) -> Dict:
+        return {
+            "model": self.model,
+            "requests": self.requests,
+            "failures": self.failures,
+            "inflight": self.inflight,
+            "error_rate": self.error_rate,
+            "latency_ewma": self.latency_ewma[False],
+            "stream_latency_ewma": self.latency_ewma[True],
+            "available": self.available,
+        }
+
+
+class LLMRouter:
+    """Spreads completion requests across a pool of equivalent endpoints.
+
+    Exposes the same ``chat.completions.create`` surface as the OpenAI client,
+    so LLM uses it in place of a single client. Each request goes to the
+    better of two randomly sampled healthy endpoints, scored by EWMA latency,
+    in-flight requests and recent error rate. A request that is still
+    pending after the endpoint's ``hedge_percentile`` latency is duplicated
+    on a second endpoint and the first response wins. Transient failures
+    (connection errors, 429, 5xx) put the endpoint in a cooldown and fail
+    over to the next one; other errors are raised immediately.
+
+    Failover attempts share the deadline of the LLM call they serve, so
+    together with the call's retries they never outlast its budget.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Tuple[str, LLMSettings]],
+        hedge_percentile: Optional[float] = 0.95,
+    ):
+        if not endpoints:
+            raise ValueError("LLMRouter needs at least one endpoint")
+        self.endpoints = [
+            RouterEndpoint(name, settings.model, create_llm_client(settings))
+            for name, settings in endpoints
+        ]
+        self.hedge_percentile = hedge_percentile
+        self.hedges = 0
+        self.failovers = 0
+        # Mirror the OpenAI client surface: router.chat.completions.create(...)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _ranked(self, stream: bool) -> List[RouterEndpoint]:
+        """Order endpoints for a request: chosen primary first, then fallbacks"""
+        healthy = [e for e in self.endpoints if e.available]
+        cooling = sorted(
+            (e for e in self.endpoints if not e.available),
+            key=lambda e: e.cooldown_until,
+        )
+        healthy.sort(key=lambda e: e.score(stream))
+        if len(healthy) > 2:
+            # Power of two choices keeps load spread without herding on the
+            # single fastest endpoint
+            first, second = random.sample(healthy, 2)
+            primary = min(first, second, key=lambda e: e.score(stream))
+            healthy.remove(primary)
+            healthy.insert(0, primary)
+        return healthy + cooling
+
+    async def create(self, **params):
+        stream = bool(params.get("stream"))
+        candidates = self._ranked(stream)
+        last_error: Optional[BaseException] = None
+        while candidates:
+            if last_error is not None and self._remaining() == 0:
+                # The call's budget is spent, leave it to its retry policy
+                break
+            primary = candidates.pop(0)
+            try:
+                return await self._hedged(primary, candidates, params, stream)
+            except Exception as e:
+                if not is_retryable_error(e):
+                    raise
+                last_error = e
+                if candidates:
+                    self.failovers += 1
+                    logger.warning(
+                        f"LLM endpoint '{primary.name}' failed ({type(e).__name__}), "
+                        f"failing over to '{candidates[0].name}'"
+                    )
+        raise last_error
+
+    async def _hedged(
+        self,
+        primary: RouterEndpoint,
+        fallbacks: List[RouterEndpoint],
+        params: dict,
+        stream: bool,
+    ):
+        """Send a request, duplicating it on a fallback if the primary is slow"""
+        first = asyncio.create_task(self._call(primary, params, stream))
+        delay = (
+            primary.latency_percentile(stream, self.hedge_percentile)
+            if self.hedge_percentile
+            else None
+        )
+        backup = next((e for e in fallbacks if e.available), None)
+        if delay is None or backup is None:
+            return await first
+
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        # The hedge uses up the backup, it is not tried again on failover
+        fallbacks.remove(backup)
+        self.hedges += 1
+        logger.info(
+            f"LLM endpoint '{primary.name}' slower than p{self.hedge_percentile * 100:.0f} "
+            f"({delay:.2f}s), hedging on '{backup.name}'"
+        )
+        pending = {first, asyncio.create_task(self._call(backup, params, stream))}
+        winner = None
+        error: Optional[BaseException] = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        # Both finished at once, release the losing stream
+                        await self._close(task.result())
+        finally:
+            for task in pending:
+                task.cancel()
+        if winner is None:
+            raise error
+        return winner
+
+    @staticmethod
+    def _remaining() -> Optional[float]:
+        """Seconds left of the current LLM call's deadline, None without one"""
+        deadline = _call_deadline.get()
+        if deadline is None:
+            return None
+        return max(0.0, deadline - time.monotonic())
+
+    async def _call(self, endpoint: RouterEndpoint, params: dict, stream: bool):
+        remaining = self._remaining()
+        if remaining is not None:
+            params = {
+                **params,
+                "timeout": min(params.get("timeout", remaining), remaining),
+            }
+        endpoint.requests += 1
+        endpoint.inflight += 1
+        start_time = time.monotonic()
+        try:
+            response = await endpoint.client.chat.completions.create(
+                **{**params, "model": endpoint.model}
+            )
+        except Exception as e:
+            if is_retryable_error(e):
+                endpoint.record_failure(e)
+            raise
+        finally:
+            endpoint.inflight -= 1
+        endpoint.record_success(stream, time.monotonic() - start_time)
+        return response
+
+    @staticmethod
+    async def _close(response: Any) -> None:
+        close = getattr(response, "close", None) or getattr(response, "aclose", None)
+        if close:
+            await close()
+
+    def get_stats(self) -> Dict:
+        """Get per-endpoint statistics and hedging/failover counters"""
+        return {
+            "hedges": self.hedges,
+            "failovers": self.failovers,
+            "endpoints": {e.name: e.get_stats() for e in self.endpoints},
+        }
+
+
+class LLMBatcher:
+    """Collects independent non-streaming completion requests into batches.
+
+    Exposes the same ``chat.completions.create`` surface as the OpenAI client
+    and wraps the real client. Each request waits on a future that resolves
+    once its batch has been processed. A batch is submitted when
+    ``max_batch_size`` requests are queued or ``max_wait`` seconds after the
+    first one arrived. Streaming requests bypass the batch.
+
+    Requests are queued per event loop and each batch is processed on the
+    loop its requests came from, so one batcher can serve sessions running
+    on separate loops and threads. Callers wait at most the time left of
+    their call deadline; provider mode therefore needs a ``deadline`` (or
+    ``retry_deadline``) covering the completion window.
+
+    Modes:
+        local: submit the batch as one concurrent burst, letting servers with
+            continuous batching (vLLM, Ollama) process it together
+        provider: upload the batch as a JSONL file to the OpenAI/Azure batch
+            API and poll the job until it finishes (up to the completion
+            window, at a lower price)
+    """
+
+    MODES = ("local", "provider")
+    FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+    def __init__(
+        self,
+        client: Any,
+        mode: str = "local",
+        max_batch_size: int = 64,
+        max_wait: float = 1.0,
+        local_concurrency: int = 16,
+        completion_window: str = "24h",
+        poll_interval: float = 30.0,
+    ):
+        if mode not in self.MODES:
+            raise ValueError(f"Invalid LLM batch mode: {mode}")
+        if mode == "provider" and not hasattr(client, "batches"):
+            logger.warning(
+                f"{type(client).__name__} has no batch API, batching requests locally"
+            )
+            mode = "local"
+        self.client = client
+        self.mode = mode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.local_concurrency = local_concurrency
+        self.completion_window = completion_window
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._pending: Dict[
+            asyncio.AbstractEventLoop, List[Tuple[dict, asyncio.Future]]
+        ] = {}
+        self._flush_handles: Dict[asyncio.AbstractEventLoop, asyncio.TimerHandle] = {}
+        self._tasks: set = set()
+        self.batches = 0
+        self.requests = 0
+        self.failed_requests = 0
+        # Mirror the OpenAI client surface: batcher.chat.completions.create(...)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @classmethod
+    def from_settings(
+        cls, client: Any, settings: Optional[LLMBatchSettings]
+    ) -> Optional["LLMBatcher"]:
+        """Wrap a client according to the batch settings, or None if disabled"""
+        if not settings or settings.mode == "off":
+            return None
+        return cls(
+            client,
+            mode=settings.mode,
+            max_batch_size=settings.max_batch_size,
+            max_wait=settings.max_wait,
+            local_concurrency=settings.local_concurrency,
+            completion_window=settings.completion_window,
+            poll_interval=settings.poll_interval,
+        )
+
+    async def create(self, **params):
+        if params.get("stream"):
+            return await self.client.chat.completions.create(**params)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            pending = self._pending.setdefault(loop, [])
+            pending.append((params, future))
+            self.requests += 1
+            full = len(pending) >= self.max_batch_size
+            if not full and loop not in self._flush_handles:
+                self._flush_handles[loop] = loop.call_later(
+                    self.max_wait, self._flush_loop, loop
+                )
+        if full:
+            self._flush_loop(loop)
+
+        deadline = _call_deadline.get()
+        if deadline is None:
+            return await future
+        # A queued or submitted request must not outlive the caller's budget
+        return await asyncio.wait_for(future, max(0.0, deadline - time.monotonic()))
+
+    def flush(self) -> None:
+        """Submit the queued requests of every event loop now"""
+        with self._lock:
+            loops = list(self._pending)
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        for loop in loops:
+            if loop is current:
+                self._flush_loop(loop)
+                continue
+            try:
+                loop.call_soon_threadsafe(self._flush_loop, loop)
+            except RuntimeError:  # Loop closed, nobody awaits its requests
+                with self._lock:
+                    self._pending.pop(loop, None)
+                    self._flush_handles.pop(loop, None)
+
+    def _flush_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Submit the requests queued on a loop, called on that loop"""
+        with self._lock:
+            handle = self._flush_handles.pop(loop, None)
+            batch = self._pending.pop(loop, [])
+        if handle is not None:
+            handle.cancel()
+        batch = [(params, future) for params, future in batch if not future.done()]
+        if not batch:
+            return
+        self.batches += 1
+        task = loop.create_task(self._submit(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _submit(self, batch: List[Tuple[dict, asyncio.Future]]) -> None:
+        try:
+            if self.mode == "provider":
+                await self._submit_to_provider(batch)
+            else:
+                await self._submit_locally(batch)
+        except Exception as e:
+            logger.error(f"LLM batch of {len(batch)} requests failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    self.failed_requests += 1
+                    future.set_exception(e)
+
+    async def _submit_locally(self, batch: List[Tuple[dict, asyncio.Future]]) -> None:
+        semaphore = asyncio.Semaphore(self.local_concurrency)
+
+        async def run(params: dict, future: asyncio.Future) -> None:
+            async with semaphore:
+                if future.done():  # Caller gave up while queued
+                    return
+                try:
+                    response = await self.client.chat.completions.create(**params)
+                except Exception as e:
+                    if not future.done():
+                        self.failed_requests += 1
+                        future.set_exception(e)
+                    return
+                if not future.done():
+                    future.set_result(response)
+
+        await asyncio.gather(*(run(params, future) for params, future in batch))
+
+    async def _submit_to_provider(
+        self, batch: List[Tuple[dict, asyncio.Future]]
+    ) -> None:
+        lines = []
+        for custom_id, (params, _) in enumerate(batch):
+            # Transport options such as the timeout are not part of the body
+            body = {k: v for k, v in params.items() if k not in ("timeout", "stream")}
+            lines.append(
+                json.dumps(
+                    {
+                        "custom_id": str(custom_id),
+                        "method": "POST",
+                        "url": "/v1/chat/completions",
+                        "body": body,
+                    }
+                )
+            )
+        input_file = await self.client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+        )
+        job = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window,
+        )
+        logger.info(f"Submitted LLM batch {job.id} with {len(batch)} requests")
+        while job.status not in self.FINAL_STATUSES:
+            if all(future.done() for _, future in batch):
+                # Every caller gave up, stop paying for the job
+                logger.info(f"Cancelling LLM batch {job.id}, no request awaits it")
+                await self.client.batches.cancel(job.id)
+                return
+            await asyncio.sleep(self.poll_interval)
+            job = await self.client.batches.retrieve(job.id)
+        logger.info(f"LLM batch {job.id} finished with status '{job.status}'")
+
+        records = {}
+        for file_id in (job.output_file_id, job.error_file_id):
+            if not file_id:
+                continue
+            content = await self.client.files.content(file_id)
+            for line in content.text.splitlines():
+                if line.strip():
+                    record = json.loads(line)
+                    records[record["custom_id"]] = record
+
+        for custom_id, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            record = records.get(str(custom_id))
+            response = (record or {}).get("response") or {}
+            if (
+                record
+                and not record.get("error")
+                and response.get("status_code") == 200
+            ):
+                future.set_result(ChatCompletion.model_validate(response["body"]))
+                continue
+            self.failed_requests += 1
+            detail = (record or {}).get("error") or response.get("body")
+            future.set_exception(
+                LLMBatchError(
+                    f"Request {custom_id} of batch {job.id} ({job.status}) has no result: {detail}"
+                )
+            )
+
+    def get_stats(self) -> Dict:
+        """Get batching statistics"""
+        return {
+            "mode": self.mode,
+            "batches": self.batches,
+            "requests": self.requests,
+            "failed_requests": self.failed_requests,
+            "queued": sum(len(pending) for pending in list(self._pending.values())),
+            "in_flight_batches": len(self._tasks),
+        }
 
 
 class LLM:
@@ -187,19 +1307,59 @@ class LLM:
         self, config_name: str = "default", llm_config: Optional[LLMSettings] = None
     ):
         if not hasattr(self, "client"):  # Only initialize if not already initialized
-            llm_config = llm_config or config.llm
-            llm_config = llm_config.get(config_name, llm_config["default"])
+            llm_configs = llm_config or config.llm
+            llm_config = llm_configs.get(config_name, llm_configs["default"])
             self.model = llm_config.model
+            # Limits and features of the model, used to shape requests
+            self.capabilities = get_model_capabilities(self.model)
             self.max_tokens = llm_config.max_tokens
+            max_output_tokens = self.capabilities.max_output_tokens
+            if max_output_tokens and self.max_tokens > max_output_tokens:
+                logger.warning(
+                    f"max_tokens={self.max_tokens} exceeds the {max_output_tokens} output tokens "
+                    f"supported by {self.model}, using {max_output_tokens}"
+                )
+                self.max_tokens = max_output_tokens
             self.temperature = llm_config.temperature
             self.api_type = llm_config.api_type
             self.api_key = llm_config.api_key
             self.api_version = llm_config.api_version
             self.base_url = llm_config.base_url
+            self.prompt_caching = getattr(llm_config, "prompt_caching", None)
+            if self.prompt_caching is None:
+                self.prompt_caching = self.capabilities.supports_prompt_caching
+            # Only Bedrock and models accepting cache_control get breakpoints,
+            # other endpoints may reject unknown content part keys
+            self.prompt_cache_markers = self.prompt_caching and (
+                self.api_type == "aws"
+                or (
+                    self.api_type != "azure"
+                    and self.capabilities.supports_prompt_caching
+                )
+            )
+            if self.prompt_caching and not self.prompt_cache_markers:
+                logger.info(
+                    f"{self.model} does not declare cache_control support, relying on "
+                    f"automatic prefix caching. Set supports_prompt_caching in its "
+                    f"[models] config table to send cache breakpoints."
+                )
+            self.stream_usage = getattr(llm_config, "stream_usage", True)
+            self.full_detail_images = getattr(llm_config, "full_detail_images", 2)
+            self.stale_images = getattr(llm_config, "stale_images", "low")
+            self.max_retries = getattr(llm_config, "max_retries", 5)
+            self.retry_deadline = getattr(llm_config, "retry_deadline", 300.0)
+            self.retry_stats = {
+                "retries": 0,
+                "errors": {},
+                "non_retryable": 0,
+                "exhausted": 0,
+            }
 
             # Add token counting related attributes
             self.total_input_tokens = 0
             self.total_completion_tokens = 0
+            self.total_cached_tokens = 0
+            self.total_cost = 0.0
             self.max_input_tokens = (
                 llm_config.max_input_tokens
                 if hasattr(llm_config, "max_input_tokens")
@@ -207,24 +1367,66 @@ class LLM:
             )
 
             # Initialize tokenizer
-            try:
-                self.tokenizer = tiktoken.encoding_for_model(self.model)
-            except KeyError:
-                # If the model is not in tiktoken's presets, use cl100k_base as default
-                self.tokenizer = tiktoken.get_encoding("cl100k_base")
-
-            if self.api_type == "azure":
-                self.client = AsyncAzureOpenAI(
-                    base_url=self.base_url,
-                    api_key=self.api_key,
-                    api_version=self.api_version,
+            self.tokenizer = self._resolve_tokenizer()
+
+            endpoints = getattr(llm_config, "endpoints", None)
+            if endpoints:
+                # Balance requests across the configured equivalent endpoints
+                self.client = LLMRouter(
+                    [(name, llm_configs[name]) for name in endpoints],
+                    hedge_percentile=getattr(llm_config, "hedge_percentile", 0.95),
                 )
-            elif self.api_type == "aws":
-                self.client = BedrockClient()
             else:
-                self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+                self.client = create_llm_client(llm_config)
+
+            # Optionally collect non-streaming requests into batches
+            self.batcher = LLMBatcher.from_settings(self.client, config.llm_batch)
+            if self.batcher:
+                self.client = self.batcher
 
             self.token_counter = TokenCounter(self.tokenizer)
+            self.response_cache = LLMResponseCache.from_settings(config.llm_cache)
+            self.rate_limiter = RateLimiter.for_settings(llm_config)
+
+    def enable_batching(self, mode: str = "local", **options) -> "LLMBatcher":
+        """Collect this LLM's non-streaming requests into batches.
+
+        Meant for bulk runners that drive many agents concurrently, e.g.
+        ``llm.enable_batching("provider")`` followed by
+        ``await asyncio.gather(*(agent.run(item) for ...))``. While batching,
+        ask/ask_tool requests are sent without streaming.
+
+        Args:
+            mode: "local" or "provider", see LLMBatcher
+            **options: Other LLMBatcher arguments (max_batch_size, max_wait, ...)
+
+        Returns:
+            LLMBatcher: The active batcher, for flushing and statistics
+        """
+        self.disable_batching()
+        self.batcher = LLMBatcher(self.client, mode=mode, **options)
+        self.client = self.batcher
+        return self.batcher
+
+    def disable_batching(self) -> None:
+        """Submit any queued requests and send new ones directly again"""
+        if self.batcher:
+            self.batcher.flush()
+            self.client = self.batcher.client
+            self.batcher = None
+
+    def _resolve_tokenizer(self):
+        """Get the tiktoken encoding for the model, preferring the registry's choice"""
+        if self.capabilities.tokenizer:
+            return tiktoken.get_encoding(self.capabilities.tokenizer)
+        try:
+            return tiktoken.encoding_for_model(self.model)
+        except KeyError:
+            logger.warning(
+                f"No tokenizer known for {self.model}, estimating tokens with cl100k_base. "
+                f"Set 'tokenizer' in its [models] config table for accurate counts."
+            )
+            return tiktoken.get_encoding("cl100k_base")
 
     def count_tokens(self, text: str) -> int:
         """Calculate the number of tokens in a text"""
@@ -235,19 +1437,113 @@ class LLM:
     def count_message_tokens(self, messages: List[dict]) -> int:
         return self.token_counter.count_message_tokens(messages)
 
-    def update_token_count(self, input_tokens: int, completion_tokens: int = 0) -> None:
+    def update_token_count(
+        self, input_tokens: int, completion_tokens: int = 0, cached_tokens: int = 0
+    ) -> None:
         """Update token counts"""
         # Only track tokens if max_input_tokens is set
         self.total_input_tokens += input_tokens
         self.total_completion_tokens += completion_tokens
+        self.total_cached_tokens += cached_tokens
+        self.total_cost += self.estimate_cost(
+            input_tokens, completion_tokens, cached_tokens
+        )
         logger.info(
-            f"Token usage: Input={input_tokens}, Completion={completion_tokens}, "
+            f"Token usage: Input={input_tokens}, Completion={completion_tokens}, Cached={cached_tokens}, "
             f"Cumulative Input={self.total_input_tokens}, Cumulative Completion={self.total_completion_tokens}, "
-            f"Total={input_tokens + completion_tokens}, Cumulative Total={self.total_input_tokens + self.total_completion_tokens}"
+            f"Cumulative Cached={self.total_cached_tokens}, "
+            f"Total={input_tokens + completion_tokens}, Cumulative Total={self.total_input_tokens + self.total_completion_tokens}, "
+            f"Cumulative Cost=${self.total_cost:.4f}"
         )
 
+    def estimate_cost(
+        self, input_tokens: int, completion_tokens: int = 0, cached_tokens: int = 0
+    ) -> float:
+        """Estimate the USD cost of token usage from the model's pricing.
+
+        Returns 0.0 for models without pricing in the registry.
+        """
+        capabilities = self.capabilities
+        input_price = capabilities.input_price or 0.0
+        cached_price = (
+            capabilities.cached_input_price
+            if capabilities.cached_input_price is not None
+            else input_price
+        )
+        output_price = capabilities.output_price or 0.0
+        return (
+            (input_tokens - cached_tokens) * input_price
+            + cached_tokens * cached_price
+            + completion_tokens * output_price
+        ) / 1_000_000
+
+    @staticmethod
+    def get_cached_tokens(usage: Any) -> int:
+        """Extract the number of prompt tokens served from the provider's cache"""
+        if usage is None:
+            return 0
+        # OpenAI style: usage.prompt_tokens_details.cached_tokens
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details else None
+        if cached is None:
+            # Anthropic style (also forwarded by many compatible gateways)
+            cached = getattr(usage, "cache_read_input_tokens", None)
+        return cached or 0
+
+    def apply_prompt_cache(
+        self, messages: List[dict], tools: Optional[List[dict]] = None
+    ) -> Tuple[List[dict], Optional[List[dict]]]:
+        """
+        Mark cache breakpoints on the stable prompt prefix.
+
+        The system prompt and the tool schemas are identical on every agent
+        step, so when ``prompt_caching`` is enabled the last system message and
+        the last tool are tagged with an ephemeral ``cache_control`` marker.
+        Markers are only sent to models declaring ``supports_prompt_caching``
+        (Anthropic style) and to Bedrock, whose client translates them to
+        ``cachePoint`` blocks. Other providers get no markers: those with
+        automatic prefix caching only need a byte-identical prefix, which the
+        stable formatting already provides.
+
+        The inputs are not mutated; marked entries are shallow copies.
+        """
+        if not self.prompt_cache_markers:
+            return messages, tools
+
+        marker = {"type": "ephemeral"}
+        system_indexes = [i for i, m in enumerate(messages) if m["role"] == "system"]
+        if system_indexes:
+            index = system_indexes[-1]
+            system_message = messages[index]
+            content = system_message.get("content")
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            if content:
+                content = [
+                    {"type": "text", "text": item} if isinstance(item, str) else item
+                    for item in content
+                ]
+                content[-1] = {**content[-1], "cache_control": marker}
+                messages = list(messages)
+                messages[index] = {**system_message, "content": content}
+
+        if tools:
+            tools = tools[:-1] + [{**tools[-1], "cache_control": marker}]
+
+        return messages, tools
+
+    def _attempt_timeout(self) -> float:
+        """Seconds left of the current call's deadline budget"""
+        deadline = _call_deadline.get()
+        if deadline is None:
+            return self.retry_deadline
+        return max(0.0, deadline - time.monotonic())
+
     def check_token_limit(self, input_tokens: int) -> bool:
         """Check if token limits are exceeded"""
+        context_window = self.capabilities.context_window
+        if context_window is not None and input_tokens > context_window:
+            return False
         if self.max_input_tokens is not None:
             return (self.total_input_tokens + input_tokens) <= self.max_input_tokens
         # If max_input_tokens is not set, always return True
@@ -255,6 +1551,9 @@ class LLM:
 
     def get_limit_error_message(self, input_tokens: int) -> str:
         """Generate error message for token limit exceeded"""
+        context_window = self.capabilities.context_window
+        if context_window is not None and input_tokens > context_window:
+            return f"Request exceeds the context window of {self.model} (Needed: {input_tokens}, Max: {context_window})"
         if (
             self.max_input_tokens is not None
             and (self.total_input_tokens + input_tokens) > self.max_input_tokens
@@ -263,9 +1562,36 @@ class LLM:
 
         return "Token limit exceeded"
 
+    def _get_cached_response(
+        self, kind: str, params: dict
+    ) -> Tuple[Optional[str], Optional[Any]]:
+        """Look up a request in the response cache.
+
+        Returns:
+            Tuple of (cache key, cached response), both None if caching is off
+
+        Raises:
+            ResponseCacheMiss: If the response is not recorded in replay mode
+        """
+        if not self.response_cache:
+            return None, None
+        key = LLMResponseCache.make_key(kind, params)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            logger.info(f"Serving {kind} response from cache")
+        return key, cached
+
+    def _cache_response(self, key: Optional[str], value: Any) -> None:
+        """Store a response in the response cache if caching is on"""
+        if key and self.response_cache:
+            self.response_cache.put(key, value)
+
     @staticmethod
     def format_messages(
-        messages: List[Union[dict, Message]], supports_images: bool = False
+        messages: List[Union[dict, Message]],
+        supports_images: bool = False,
+        full_detail_images: Optional[int] = None,
+        stale_images: str = "low",
     ) -> List[dict]:
         """
         Format messages for LLM by converting them to OpenAI message format.
@@ -273,9 +1599,15 @@ class LLM:
         Args:
             messages: List of messages that can be either dict or Message objects
             supports_images: Flag indicating if the target model supports image inputs
+            full_detail_images: Number of most recent images sent at full
+                detail, None for all
+            stale_images: How older images are sent, "low" for low detail or
+                "drop" for a textual placeholder
 
         Returns:
-            List[dict]: List of formatted messages in OpenAI format
+            List[dict]: List of formatted messages in OpenAI format. Dicts of
+                Message objects are shared with the message's cache and must
+                not be mutated.
 
         Raises:
             ValueError: If messages are invalid or missing required fields
@@ -291,59 +1623,38 @@ class LLM:
         """
         formatted_messages = []
 
-        for message in messages:
-            # Convert Message objects to dictionaries
-            if isinstance(message, Message):
-                message = message.to_dict()
+        # Image retention: only the latest images are sent at full detail
+        image_details = [None] * len(messages)
+        if supports_images and full_detail_images is not None:
+            seen = 0
+            for index in range(len(messages) - 1, -1, -1):
+                message = messages[index]
+                has_image = (
+                    message.image_id
+                    if isinstance(message, Message)
+                    else isinstance(message, dict) and message.get("base64_image")
+                )
+                if has_image:
+                    seen += 1
+                    if seen > full_detail_images:
+                        image_details[index] = stale_images
 
-            if isinstance(message, dict):
+        for message, image_detail in zip(messages, image_details):
+            if isinstance(message, Message):
+                # Reuse the message's memoized wire format without copying
+                message = message.to_formatted_dict(supports_images, image_detail)
+            elif isinstance(message, dict):
                 # If message is a dict, ensure it has required fields
                 if "role" not in message:
                     raise ValueError("Message dict must contain 'role' field")
-
-                # Process base64 images if present and model supports images
-                if supports_images and message.get("base64_image"):
-                    # Initialize or convert content to appropriate format
-                    if not message.get("content"):
-                        message["content"] = []
-                    elif isinstance(message["content"], str):
-                        message["content"] = [
-                            {"type": "text", "text": message["content"]}
-                        ]
-                    elif isinstance(message["content"], list):
-                        # Convert string items to proper text objects
-                        message["content"] = [
-                            (
-                                {"type": "text", "text": item}
-                                if isinstance(item, str)
-                                else item
-                            )
-                            for item in message["content"]
-                        ]
-
-                    # Add the image to content
-                    message["content"].append(
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{message['base64_image']}"
-                            },
-                        }
-                    )
-
-                    # Remove the base64_image field
-                    del message["base64_image"]
-                # If model doesn't support images but message has base64_image, handle gracefully
-                elif not supports_images and message.get("base64_image"):
-                    # Just remove the base64_image field and keep the text content
-                    del message["base64_image"]
-
-                if "content" in message or "tool_calls" in message:
-                    formatted_messages.append(message)
-                # else: do not include the message
+                message = format_message_dict(message, supports_images, image_detail)
             else:
                 raise TypeError(f"Unsupported message type: {type(message)}")
 
+            if "content" in message or "tool_calls" in message:
+                formatted_messages.append(message)
+            # else: do not include the message
+
         # Validate all messages have required fields
         for msg in formatted_messages:
             if msg["role"] not in ROLE_VALUES:
@@ -351,19 +1662,146 @@ class LLM:
 
         return formatted_messages
 
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
-    )
+    def _format_history(
+        self, messages: List[Union[dict, Message]], supports_images: bool
+    ) -> List[dict]:
+        """Format conversation messages applying the image retention policy"""
+        return self.format_messages(
+            messages,
+            supports_images,
+            full_detail_images=self.full_detail_images,
+            stale_images=self.stale_images,
+        )
+
+    def _stream_options(self) -> dict:
+        """Extra request arguments asking the provider for streamed usage"""
+        if not self.stream_usage:
+            return {}
+        return {"stream_options": {"include_usage": True}}
+
+    def _record_stream_usage(
+        self,
+        usage: Any,
+        input_tokens: int,
+        estimate_completion_tokens: Callable[[], int],
+    ) -> None:
+        """Account a streamed response, preferring the provider's usage block.
+
+        The local estimates are only used when the provider sent no usage.
+
+        Args:
+            usage: Usage block from the final stream chunk, if any
+            input_tokens: Locally estimated prompt tokens
+            estimate_completion_tokens: Computes the local completion estimate
+        """
+        if usage is not None:
+            self.update_token_count(
+                usage.prompt_tokens,
+                usage.completion_tokens,
+                self.get_cached_tokens(usage),
+            )
+            return
+
+        completion_tokens = estimate_completion_tokens()
+        logger.info(
+            f"No usage in streaming response, estimated completion tokens: {completion_tokens}"
+        )
+        self.update_token_count(input_tokens, completion_tokens)
+
+    @staticmethod
+    async def _collect_stream_content(
+        response, on_token: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Tuple[str, Any]:
+        """Drain a streamed completion, forwarding content deltas to ``on_token``.
+
+        Deltas are collected in a list and joined once at the end. If the
+        stream fails after content was forwarded, ``on_token`` receives
+        ``STREAM_RESET``.
+
+        Returns:
+            Tuple[str, Any]: The completion text and the provider's usage
+            block (None if the provider did not send one)
+        """
+        collected_messages: List[str] = []
+        usage = None
+        try:
+            async with _stream_deadline():
+                async for chunk in response:
+                    if getattr(chunk, "usage", None):
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    chunk_message = chunk.choices[0].delta.content
+                    if not chunk_message:
+                        continue
+                    collected_messages.append(chunk_message)
+                    if on_token:
+                        await on_token(chunk_message)
+        except Exception:
+            if collected_messages and on_token:
+                await on_token(STREAM_RESET)
+            raise
+        return "".join(collected_messages), usage
+
+    async def ask_stream(
+        self,
+        messages: List[Union[dict, Message]],
+        system_msgs: Optional[List[Union[dict, Message]]] = None,
+        temperature: Optional[float] = None,
+        deadline: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream the response to a prompt as an async iterator of content deltas.
+
+        Wraps ``ask`` so token limits, caching, rate limiting and retries all
+        apply. If an attempt fails mid-stream, ``STREAM_RESET`` is yielded:
+        the text received so far should be discarded, and the deltas of a
+        retried attempt follow.
+
+        Args:
+            messages: List of conversation messages
+            system_msgs: Optional system messages to prepend
+            temperature (float): Sampling temperature for the response
+            deadline (float): Total seconds allowed for the call including
+                retries (defaults to the configured retry_deadline)
+
+        Yields:
+            str: Content deltas in the order they were generated
+        """
+        tokens: asyncio.Queue = asyncio.Queue()
+        finished = object()
+
+        async def produce() -> None:
+            try:
+                await self.ask(
+                    messages,
+                    system_msgs=system_msgs,
+                    stream=True,
+                    temperature=temperature,
+                    deadline=deadline,
+                    on_token=tokens.put,
+                )
+            finally:
+                tokens.put_nowait(finished)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while (token := await tokens.get()) is not finished:
+                yield token
+            # Surface errors raised by ask once the stream has ended
+            await producer
+        finally:
+            producer.cancel()
+
+    @llm_retry
     async def ask(
         self,
         messages: List[Union[dict, Message]],
         system_msgs: Optional[List[Union[dict, Message]]] = None,
         stream: bool = True,
         temperature: Optional[float] = None,
+        deadline: Optional[float] = None,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None,
     ) -> str:
         """
         Send a prompt to the LLM and get the response.
@@ -373,6 +1811,12 @@ class LLM:
             system_msgs: Optional system messages to prepend
             stream (bool): Whether to stream the response
             temperature (float): Sampling temperature for the response
+            deadline (float): Total seconds allowed for the call including
+                retries (defaults to the configured retry_deadline)
+            on_token: Optional coroutine called with each content delta as it
+                streams in. Non-streaming and cached responses are delivered
+                in a single call. Receives ``STREAM_RESET`` when a streamed
+                attempt fails after sending content.
 
         Returns:
             str: The generated response
@@ -384,15 +1828,19 @@ class LLM:
             Exception: For unexpected errors
         """
         try:
+            # Batched requests complete as a whole, so they are never streamed
+            if self.batcher:
+                stream = False
+
             # Check if the model supports images
-            supports_images = self.model in MULTIMODAL_MODELS
+            supports_images = self.capabilities.supports_images
 
             # Format system and user messages with image support check
             if system_msgs:
                 system_msgs = self.format_messages(system_msgs, supports_images)
-                messages = system_msgs + self.format_messages(messages, supports_images)
+                messages = system_msgs + self._format_history(messages, supports_images)
             else:
-                messages = self.format_messages(messages, supports_images)
+                messages = self._format_history(messages, supports_images)
 
             # Calculate input token count
             input_tokens = self.count_message_tokens(messages)
@@ -403,12 +1851,15 @@ class LLM:
                 # Raise a special exception that won't be retried
                 raise TokenLimitExceeded(error_message)
 
+            messages, _ = self.apply_prompt_cache(messages)
             params = {
                 "model": self.model,
                 "messages": messages,
             }
+            # An attempt gets only the time left of the call's budget
+            params["timeout"] = self._attempt_timeout()
 
-            if self.model in REASONING_MODELS:
+            if self.capabilities.reasoning:
                 params["max_completion_tokens"] = self.max_tokens
             else:
                 params["max_tokens"] = self.max_tokens
@@ -416,6 +1867,15 @@ class LLM:
                     temperature if temperature is not None else self.temperature
                 )
 
+            cache_key, cached = self._get_cached_response("ask", params)
+            if cached is not None:
+                if on_token:
+                    await on_token(cached)
+                return cached
+
+            if self.rate_limiter:
+                await self.rate_limiter.acquire(input_tokens)
+
             if not stream:
                 # Non-streaming request
                 response = await self.client.chat.completions.create(
@@ -427,40 +1887,37 @@ class LLM:
 
                 # Update token counts
                 self.update_token_count(
-                    response.usage.prompt_tokens, response.usage.completion_tokens
+                    response.usage.prompt_tokens,
+                    response.usage.completion_tokens,
+                    self.get_cached_tokens(response.usage),
                 )
 
-                return response.choices[0].message.content
+                content = response.choices[0].message.content
+                if on_token:
+                    await on_token(content)
+                self._cache_response(cache_key, content)
+                return content
 
-            # Streaming request, For streaming, update estimated token count before making the request
-            self.update_token_count(input_tokens)
-
-            response = await self.client.chat.completions.create(**params, stream=True)
-
-            collected_messages = []
-            completion_text = ""
-            async for chunk in response:
-                chunk_message = chunk.choices[0].delta.content or ""
-                collected_messages.append(chunk_message)
-                completion_text += chunk_message
-                print(chunk_message, end="", flush=True)
-
-            print()  # Newline after streaming
-            full_response = "".join(collected_messages).strip()
+            # Streaming request
+            response = await self.client.chat.completions.create(
+                **params, stream=True, **self._stream_options()
+            )
+            completion_text, usage = await self._collect_stream_content(
+                response, on_token
+            )
+            full_response = completion_text.strip()
             if not full_response:
                 raise ValueError("Empty response from streaming LLM")
 
-            # estimate completion tokens for streaming response
-            completion_tokens = self.count_tokens(completion_text)
-            logger.info(
-                f"Estimated completion tokens for streaming response: {completion_tokens}"
+            self._record_stream_usage(
+                usage, input_tokens, lambda: self.count_tokens(completion_text)
             )
-            self.total_completion_tokens += completion_tokens
 
+            self._cache_response(cache_key, full_response)
             return full_response
 
-        except TokenLimitExceeded:
-            # Re-raise token limit errors without logging
+        except (TokenLimitExceeded, ResponseCacheMiss):
+            # Re-raise token limit and replay cache errors without logging
             raise
         except ValueError:
             logger.exception(f"Validation error")
@@ -471,6 +1928,8 @@ class LLM:
                 logger.error("Authentication failed. Check API key.")
             elif isinstance(oe, RateLimitError):
                 logger.error("Rate limit exceeded. Consider increasing retry attempts.")
+                if self.rate_limiter:
+                    self.rate_limiter.observe_rate_limit_error(oe)
             elif isinstance(oe, APIError):
                 logger.error(f"API error: {oe}")
             raise
@@ -478,13 +1937,7 @@ class LLM:
             logger.exception(f"Unexpected error in ask")
             raise
 
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
-    )
+    @llm_retry
     async def ask_with_images(
         self,
         messages: List[Union[dict, Message]],
@@ -492,6 +1945,8 @@ class LLM:
         system_msgs: Optional[List[Union[dict, Message]]] = None,
         stream: bool = False,
         temperature: Optional[float] = None,
+        deadline: Optional[float] = None,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None,
     ) -> str:
         """
         Send a prompt with images to the LLM and get the response.
@@ -502,6 +1957,12 @@ class LLM:
             system_msgs: Optional system messages to prepend
             stream (bool): Whether to stream the response
             temperature (float): Sampling temperature for the response
+            deadline (float): Total seconds allowed for the call including
+                retries (defaults to the configured retry_deadline)
+            on_token: Optional coroutine called with each content delta as it
+                streams in. Non-streaming and cached responses are delivered
+                in a single call. Receives ``STREAM_RESET`` when a streamed
+                attempt fails after sending content.
 
         Returns:
             str: The generated response
@@ -513,15 +1974,20 @@ class LLM:
             Exception: For unexpected errors
         """
         try:
+            # Batched requests complete as a whole, so they are never streamed
+            if self.batcher:
+                stream = False
+
             # For ask_with_images, we always set supports_images to True because
             # this method should only be called with models that support images
-            if self.model not in MULTIMODAL_MODELS:
+            if not self.capabilities.supports_images:
                 raise ValueError(
-                    f"Model {self.model} does not support images. Use a model from {MULTIMODAL_MODELS}"
+                    f"Model {self.model} does not support images. "
+                    f'Set supports_images in its [models."{self.model}"] config table if it does.'
                 )
 
             # Format messages with image support
-            formatted_messages = self.format_messages(messages, supports_images=True)
+            formatted_messages = self._format_history(messages, supports_images=True)
 
             # Ensure the last message is from the user to attach images
             if not formatted_messages or formatted_messages[-1]["role"] != "user":
@@ -529,15 +1995,17 @@ class LLM:
                     "The last message must be from the user to attach images"
                 )
 
-            # Process the last user message to include images
-            last_message = formatted_messages[-1]
+            # Process a copy of the last user message to include images, the
+            # formatted dict is shared with the message's cache
+            last_message = dict(formatted_messages[-1])
+            formatted_messages[-1] = last_message
 
             # Convert content to multimodal format if needed
             content = last_message["content"]
             multimodal_content = (
                 [{"type": "text", "text": content}]
                 if isinstance(content, str)
-                else content
+                else list(content)
                 if isinstance(content, list)
                 else []
             )
@@ -573,14 +2041,17 @@ class LLM:
                 raise TokenLimitExceeded(self.get_limit_error_message(input_tokens))
 
             # Set up API parameters
+            all_messages, _ = self.apply_prompt_cache(all_messages)
             params = {
                 "model": self.model,
                 "messages": all_messages,
                 "stream": stream,
             }
+            # An attempt gets only the time left of the call's budget
+            params["timeout"] = self._attempt_timeout()
 
             # Add model-specific parameters
-            if self.model in REASONING_MODELS:
+            if self.capabilities.reasoning:
                 params["max_completion_tokens"] = self.max_tokens
             else:
                 params["max_tokens"] = self.max_tokens
@@ -588,6 +2059,15 @@ class LLM:
                     temperature if temperature is not None else self.temperature
                 )
 
+            cache_key, cached = self._get_cached_response("ask_with_images", params)
+            if cached is not None:
+                if on_token:
+                    await on_token(cached)
+                return cached
+
+            if self.rate_limiter:
+                await self.rate_limiter.acquire(input_tokens)
+
             # Handle non-streaming request
             if not stream:
                 response = await self.client.chat.completions.create(**params)
@@ -595,28 +2075,36 @@ class LLM:
                 if not response.choices or not response.choices[0].message.content:
                     raise ValueError("Empty or invalid response from LLM")
 
-                self.update_token_count(response.usage.prompt_tokens)
-                return response.choices[0].message.content
+                self.update_token_count(
+                    response.usage.prompt_tokens,
+                    cached_tokens=self.get_cached_tokens(response.usage),
+                )
+                content = response.choices[0].message.content
+                if on_token:
+                    await on_token(content)
+                self._cache_response(cache_key, content)
+                return content
 
             # Handle streaming request
-            self.update_token_count(input_tokens)
-            response = await self.client.chat.completions.create(**params)
-
-            collected_messages = []
-            async for chunk in response:
-                chunk_message = chunk.choices[0].delta.content or ""
-                collected_messages.append(chunk_message)
-                print(chunk_message, end="", flush=True)
-
-            print()  # Newline after streaming
-            full_response = "".join(collected_messages).strip()
+            response = await self.client.chat.completions.create(
+                **params, **self._stream_options()
+            )
+            completion_text, usage = await self._collect_stream_content(
+                response, on_token
+            )
+            full_response = completion_text.strip()
 
             if not full_response:
                 raise ValueError("Empty response from streaming LLM")
 
+            self._record_stream_usage(
+                usage, input_tokens, lambda: self.count_tokens(completion_text)
+            )
+
+            self._cache_response(cache_key, full_response)
             return full_response
 
-        except TokenLimitExceeded:
+        except (TokenLimitExceeded, ResponseCacheMiss):
             raise
         except ValueError as ve:
             logger.error(f"Validation error in ask_with_images: {ve}")
@@ -627,6 +2115,8 @@ class LLM:
                 logger.error("Authentication failed. Check API key.")
             elif isinstance(oe, RateLimitError):
                 logger.error("Rate limit exceeded. Consider increasing retry attempts.")
+                if self.rate_limiter:
+                    self.rate_limiter.observe_rate_limit_error(oe)
             elif isinstance(oe, APIError):
                 logger.error(f"API error: {oe}")
             raise
@@ -634,13 +2124,7 @@ class LLM:
             logger.error(f"Unexpected error in ask_with_images: {e}")
             raise
 
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (OpenAIError, Exception, ValueError)
-        ),  # Don't retry TokenLimitExceeded
-    )
+    @llm_retry
     async def ask_tool(
         self,
         messages: List[Union[dict, Message]],
@@ -649,6 +2133,12 @@ class LLM:
         tools: Optional[List[dict]] = None,
         tool_choice: TOOL_CHOICE_TYPE = ToolChoice.AUTO,  # type: ignore
         temperature: Optional[float] = None,
+        stream: bool = False,
+        on_tool_call: Optional[
+            Callable[[ChatCompletionMessageToolCall], Awaitable[Optional[asyncio.Task]]]
+        ] = None,
+        deadline: Optional[float] = None,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None,
         **kwargs,
     ) -> ChatCompletionMessage | None:
         """
@@ -661,6 +2151,17 @@ class LLM:
             tools: List of tools to use
             tool_choice: Tool choice strategy
             temperature: Sampling temperature for the response
+            stream: Whether to stream the response and assemble tool calls
+                incrementally
+            on_tool_call: Optional coroutine called with each tool call as soon
+                as it is complete in the stream, before the response has ended.
+                It may return the task executing the call, which is cancelled
+                if the streamed attempt fails.
+            deadline: Total seconds allowed for the call including retries
+                (defaults to the configured retry_deadline)
+            on_token: Optional coroutine called with each content delta while
+                streaming, and with ``STREAM_RESET`` when a streamed attempt
+                fails after sending content
             **kwargs: Additional completion arguments
 
         Returns:
@@ -673,30 +2174,30 @@ class LLM:
             Exception: For unexpected errors
         """
         try:
+            # Batched requests complete as a whole, so they are never streamed
+            if self.batcher:
+                stream = False
+
             # Validate tool_choice
             if tool_choice not in TOOL_CHOICE_VALUES:
                 raise ValueError(f"Invalid tool_choice: {tool_choice}")
 
             # Check if the model supports images
-            supports_images = self.model in MULTIMODAL_MODELS
+            supports_images = self.capabilities.supports_images
 
             # Format messages
             if system_msgs:
                 system_msgs = self.format_messages(system_msgs, supports_images)
-                messages = system_msgs + self.format_messages(messages, supports_images)
+                messages = system_msgs + self._format_history(messages, supports_images)
             else:
-                messages = self.format_messages(messages, supports_images)
+                messages = self._format_history(messages, supports_images)
 
             # Calculate input token count
             input_tokens = self.count_message_tokens(messages)
 
             # If there are tools, calculate token count for tool descriptions
-            tools_tokens = 0
             if tools:
-                for tool in tools:
-                    tools_tokens += self.count_tokens(str(tool))
-
-            input_tokens += tools_tokens
+                input_tokens += self.token_counter.count_tools(tools)
 
             # Check if token limits are exceeded
             if not self.check_token_limit(input_tokens):
@@ -711,16 +2212,18 @@ class LLM:
                         raise ValueError("Each tool must be a dict with 'type' field")
 
             # Set up the completion request
+            messages, tools = self.apply_prompt_cache(messages, tools)
             params = {
                 "model": self.model,
                 "messages": messages,
                 "tools": tools,
                 "tool_choice": tool_choice,
-                "timeout": timeout,
+                # An attempt gets only the time left of the call's budget
+                "timeout": min(timeout, self._attempt_timeout()),
                 **kwargs,
             }
 
-            if self.model in REASONING_MODELS:
+            if self.capabilities.reasoning:
                 params["max_completion_tokens"] = self.max_tokens
             else:
                 params["max_tokens"] = self.max_tokens
@@ -728,7 +2231,21 @@ class LLM:
                     temperature if temperature is not None else self.temperature
                 )
 
-            params["stream"] = False  # Always use non-streaming for tool requests
+            cache_key, cached = self._get_cached_response("ask_tool", params)
+            if cached is not None:
+                return ChatCompletionMessage.model_validate(cached)
+
+            if self.rate_limiter:
+                await self.rate_limiter.acquire(input_tokens)
+
+            if stream and self.capabilities.supports_tool_streaming:
+                message = await self._stream_tool_response(
+                    params, input_tokens, on_tool_call, on_token
+                )
+                self._cache_response(cache_key, message.model_dump())
+                return message
+
+            params["stream"] = False
             response: ChatCompletion = await self.client.chat.completions.create(
                 **params
             )
@@ -741,13 +2258,17 @@ class LLM:
 
             # Update token counts
             self.update_token_count(
-                response.usage.prompt_tokens, response.usage.completion_tokens
+                response.usage.prompt_tokens,
+                response.usage.completion_tokens,
+                self.get_cached_tokens(response.usage),
             )
 
-            return response.choices[0].message
+            message = response.choices[0].message
+            self._cache_response(cache_key, message.model_dump())
+            return message
 
-        except TokenLimitExceeded:
-            # Re-raise token limit errors without logging
+        except (TokenLimitExceeded, ResponseCacheMiss):
+            # Re-raise token limit and replay cache errors without logging
             raise
         except ValueError as ve:
             logger.error(f"Validation error in ask_tool: {ve}")
@@ -758,9 +2279,133 @@ class LLM:
                 logger.error("Authentication failed. Check API key.")
             elif isinstance(oe, RateLimitError):
                 logger.error("Rate limit exceeded. Consider increasing retry attempts.")
+                if self.rate_limiter:
+                    self.rate_limiter.observe_rate_limit_error(oe)
             elif isinstance(oe, APIError):
                 logger.error(f"API error: {oe}")
             raise
         except Exception as e:
             logger.error(f"Unexpected error in ask_tool: {e}")
             raise
+
+    async def _stream_tool_response(
+        self,
+        params: dict,
+        input_tokens: int,
+        on_tool_call: Optional[
+            Callable[[ChatCompletionMessageToolCall], Awaitable[Optional[asyncio.Task]]]
+        ] = None,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None,
+    ) -> ChatCompletionMessage:
+        """
+        Stream a tool-call completion and assemble it into a single message.
+
+        Tool calls arrive as deltas keyed by index. A call is complete once a
+        delta for a later index starts or the stream ends; at that point it is
+        handed to ``on_tool_call`` so the caller can start executing it while
+        the model is still generating the remaining calls. If the stream
+        fails, the tasks ``on_tool_call`` returned for this attempt are
+        cancelled, whether the call is then retried or not.
+
+        Args:
+            params: Completion request parameters
+            input_tokens: Locally estimated prompt tokens, used for accounting
+                only when the provider reports no usage
+            on_tool_call: Optional coroutine invoked with each completed tool
+                call, optionally returning the task executing it
+            on_token: Optional coroutine invoked with each content delta
+
+        Returns:
+            ChatCompletionMessage: The assembled response message
+        """
+        start_time = time.monotonic()
+        first_call_latency: Optional[float] = None
+
+        content_parts: List[str] = []
+        # index -> {"id": str, "name": str, "arguments": List[str]}
+        partial_calls: Dict[int, dict] = {}
+        tool_calls: List[ChatCompletionMessageToolCall] = []
+        # Executions started for this attempt's calls
+        dispatched: List[asyncio.Task] = []
+
+        async def complete_call(index: int) -> None:
+            nonlocal first_call_latency
+            partial = partial_calls.pop(index)
+            tool_call = ChatCompletionMessageToolCall(
+                id=partial["id"],
+                type="function",
+                function=Function(
+                    name=partial["name"], arguments="".join(partial["arguments"])
+                ),
+            )
+            tool_calls.append(tool_call)
+            if first_call_latency is None:
+                first_call_latency = time.monotonic() - start_time
+                logger.info(
+                    f"First tool call '{tool_call.function.name}' ready after {first_call_latency:.2f}s"
+                )
+            if on_tool_call:
+                task = await on_tool_call(tool_call)
+                if task is not None:
+                    dispatched.append(task)
+
+        usage = None
+        try:
+            response = await self.client.chat.completions.create(
+                **params, stream=True, **self._stream_options()
+            )
+            async with _stream_deadline():
+                async for chunk in response:
+                    if getattr(chunk, "usage", None):
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        content_parts.append(delta.content)
+                        if on_token:
+                            await on_token(delta.content)
+                    for call_delta in delta.tool_calls or []:
+                        # Calls are emitted in order, so a new index closes all earlier ones
+                        for index in sorted(
+                            i for i in partial_calls if i < call_delta.index
+                        ):
+                            await complete_call(index)
+                        partial = partial_calls.setdefault(
+                            call_delta.index, {"id": "", "name": "", "arguments": []}
+                        )
+                        if call_delta.id:
+                            partial["id"] = call_delta.id
+                        if call_delta.function:
+                            if call_delta.function.name:
+                                partial["name"] += call_delta.function.name
+                            if call_delta.function.arguments:
+                                partial["arguments"].append(
+                                    call_delta.function.arguments
+                                )
+
+            for index in sorted(partial_calls):
+                await complete_call(index)
+        except BaseException as e:
+            # Calls of a failed attempt must not run on, a retry emits its own
+            for task in dispatched:
+                task.cancel()
+            if content_parts and on_token and isinstance(e, Exception):
+                await on_token(STREAM_RESET)
+            raise
+
+        content = "".join(content_parts)
+        self._record_stream_usage(
+            usage,
+            input_tokens,
+            lambda: self.count_tokens(content)
+            + self.token_counter.count_tool_calls(
+                [{"function": call.function.model_dump()} for call in tool_calls]
+            ),
+        )
+
+        return ChatCompletionMessage(
+            role="assistant",
+            content=content or None,
+            tool_calls=tool_calls or None,
+        )
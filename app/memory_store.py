@@ -0,0 +1,454 @@
+"""
+Persistent agent memory.
+
+A ``MemoryStore`` keeps the messages of memory sessions outside the process.
+Memories backed by a store append each message to it as it is added, keep
+only the latest messages in RAM and read older ones back when they are
+accessed. A session can be resumed by id in any process sharing the store,
+e.g. by another web worker after the one serving it died.
+
+``SQLiteMemoryStore`` is the default backend. It runs SQLite in WAL mode, so
+several worker processes on one host can share a database file. Message
+images are stored once per content digest, like in the in-process image
+store.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.config import PROJECT_ROOT, MemorySettings, config
+from app.image_store import image_store
+from app.schema import Memory, Message, MessageBuffer
+
+
+class MemoryStore(ABC):
+    """Backend persisting the messages of memory sessions.
+
+    Messages of a session are addressed by increasing sequence numbers.
+    """
+
+    # Older messages a buffer keeps in RAM once read back
+    cached_messages: int = 100
+
+    @abstractmethod
+    def append(self, session_id: str, entries: List[Tuple[int, Message]]) -> None:
+        """Store messages under their sequence numbers"""
+
+    @abstractmethod
+    def load(self, session_id: str, seqs: List[int]) -> Dict[int, Message]:
+        """Read messages by sequence number"""
+
+    @abstractmethod
+    def seqs(self, session_id: str) -> List[int]:
+        """Sequence numbers of the stored messages of a session, in order"""
+
+    @abstractmethod
+    def delete(self, session_id: str, seqs: Optional[List[int]] = None) -> None:
+        """Delete messages of a session, all of them if seqs is None"""
+
+    @abstractmethod
+    def save_session(self, session_id: str, metadata: dict) -> None:
+        """Store metadata of a session, e.g. what is needed to resume it"""
+
+    @abstractmethod
+    def get_session(self, session_id: str) -> Optional[dict]:
+        """Get the metadata of a session, None if it is not stored"""
+
+    @abstractmethod
+    def delete_session(self, session_id: str) -> None:
+        """Delete a session with its messages and metadata"""
+
+    def open_buffer(
+        self,
+        session_id: str,
+        messages: Optional[Iterable[Message]] = None,
+        hot_messages: int = 20,
+    ) -> "PersistentMessageBuffer":
+        """Open the message buffer of a session.
+
+        Args:
+            session_id: Id of the session
+            messages: Messages replacing the stored ones, None to resume the
+                stored session
+            hot_messages: Number of latest messages kept in RAM
+        """
+        return PersistentMessageBuffer(self, session_id, messages, hot_messages)
+
+
+class PersistentMessageBuffer(MessageBuffer):
+    """Message buffer writing through to a MemoryStore.
+
+    Only the pinned anchor messages and the ``hot_messages`` latest messages
+    are held in RAM, plus up to ``store.cached_messages`` older ones and the
+    oldest one once read back. Other messages are read from the store when accessed, a page
+    at a time when iterating. Dropping messages deletes them from the store.
+    """
+
+    PAGE_SIZE = 32
+
+    def __init__(
+        self,
+        store: MemoryStore,
+        session_id: str,
+        messages: Optional[Iterable[Message]] = None,
+        hot_messages: int = 20,
+    ):
+        super().__init__()
+        self.store = store
+        self.session_id = session_id
+        self.hot_messages = hot_messages
+        self._pinned_seqs: List[int] = []
+        # Sequence numbers of the messages that are not pinned, oldest first
+        self._seqs: deque = deque()
+        self._hot: Dict[int, Message] = {}
+        # Older messages kept after being read back. Messages never change,
+        # and a full cache keeps its entries rather than evicting, so that
+        # scanning the history does not thrash it
+        self._cached: Dict[int, Message] = {}
+        self._next_seq = 0
+
+        if messages is None:
+            self._seqs.extend(store.seqs(session_id))
+            if self._seqs:
+                self._next_seq = self._seqs[-1] + 1
+                self._hot = self._load(self._tail(hot_messages))
+        else:
+            store.delete(session_id)
+            self.extend(messages)
+
+    def _tail(self, n: int) -> List[int]:
+        """Sequence numbers of the n latest messages that are not pinned"""
+        return list(islice(reversed(self._seqs), n))[::-1] if n > 0 else []
+
+    def _load(self, seqs: List[int]) -> Dict[int, Message]:
+        return self.store.load(self.session_id, seqs) if seqs else {}
+
+    def _get(self, seqs: List[int]) -> List[Message]:
+        """Messages by sequence number, reading the cold ones from the store"""
+        loaded = self._load(
+            [seq for seq in seqs if seq not in self._hot and seq not in self._cached]
+        )
+        for seq, message in loaded.items():
+            self._cache(seq, message)
+        return [
+            self._hot.get(seq) or self._cached.get(seq) or loaded[seq] for seq in seqs
+        ]
+
+    def _cache(self, seq: int, message: Message) -> None:
+        """Keep an older message in RAM while the cache has room.
+
+        The oldest message is always kept, Memory.anchor_count checks it on
+        every step.
+        """
+        if len(self._cached) < self.store.cached_messages or seq == self._seqs[0]:
+            self._cached[seq] = message
+
+    def _forget(self, seq: int) -> None:
+        """Drop a message from RAM"""
+        self._hot.pop(seq, None)
+        self._cached.pop(seq, None)
+
+    def _evict(self) -> None:
+        """Move messages that fell out of the hot window to the cache"""
+        if len(self._hot) > self.hot_messages:
+            keep = set(self._tail(self.hot_messages))
+            for seq in [seq for seq in self._hot if seq not in keep]:
+                self._cache(seq, self._hot.pop(seq))
+
+    def __len__(self) -> int:
+        return len(self._pinned) + len(self._seqs)
+
+    def __iter__(self) -> Iterator[Message]:
+        yield from self._pinned
+        seqs = list(self._seqs)
+        for start in range(0, len(seqs), self.PAGE_SIZE):
+            yield from self._get(seqs[start : start + self.PAGE_SIZE])
+
+    def __reversed__(self) -> Iterator[Message]:
+        seqs = list(self._seqs)
+        for end in range(len(seqs), 0, -self.PAGE_SIZE):
+            yield from reversed(self._get(seqs[max(0, end - self.PAGE_SIZE) : end]))
+        yield from reversed(self._pinned)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return super().__getitem__(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+        if index < len(self._pinned):
+            return self._pinned[index]
+        return self._get([self._seqs[index - len(self._pinned)]])[0]
+
+    def __repr__(self) -> str:
+        return (
+            f"PersistentMessageBuffer(session_id={self.session_id!r}, "
+            f"messages={len(self)}, hot={len(self._hot)})"
+        )
+
+    def append(self, message: Message) -> None:
+        self.extend([message])
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        entries = []
+        for message in messages:
+            entries.append((self._next_seq, message))
+            self._next_seq += 1
+        if not entries:
+            return
+        self.store.append(self.session_id, entries)
+        for seq, message in entries:
+            self._seqs.append(seq)
+            self._hot[seq] = message
+        self._evict()
+
+    def clear(self) -> None:
+        self.store.delete(self.session_id)
+        self._pinned.clear()
+        self._pinned_seqs.clear()
+        self._seqs.clear()
+        self._hot = {}
+        self._cached = {}
+
+    def recent(self, n: int) -> List[Message]:
+        if n <= 0:
+            return []
+        messages = self._get(self._tail(n))
+        missing = n - len(messages)
+        if missing > 0 and self._pinned:
+            messages = self._pinned[-missing:] + messages
+        return messages
+
+    def pin(self, count: int) -> None:
+        while len(self._pinned) < count and self._seqs:
+            seq = self._seqs[0]
+            self._pinned.append(self._get([seq])[0])
+            self._pinned_seqs.append(self._seqs.popleft())
+            self._forget(seq)
+        while len(self._pinned) > count:
+            seq = self._pinned_seqs.pop()
+            self._seqs.appendleft(seq)
+            self._hot[seq] = self._pinned.pop()
+
+    def oldest(self) -> Optional[Message]:
+        return self._get([self._seqs[0]])[0] if self._seqs else None
+
+    def popleft(self) -> Message:
+        seq = self._seqs[0]
+        message = self._get([seq])[0]
+        self._seqs.popleft()
+        self._forget(seq)
+        self.store.delete(self.session_id, [seq])
+        return message
+
+    def replace_oldest(self, count: int, messages: List[Message]) -> None:
+        count = min(count, len(self._seqs))
+        if len(messages) > count:
+            raise ValueError("Cannot put more messages in place than are replaced")
+        seqs = [self._seqs.popleft() for _ in range(count)]
+        for seq in seqs:
+            self._forget(seq)
+        # The new messages take over the latest of the replaced sequence
+        # numbers, so they keep their place without rewriting the others
+        kept = len(seqs) - len(messages)
+        self.store.delete(self.session_id, seqs[:kept])
+        entries = list(zip(seqs[kept:], messages))
+        if entries:
+            self.store.append(self.session_id, entries)
+        for seq, message in reversed(entries):
+            self._seqs.appendleft(seq)
+            self._hot[seq] = message
+
+
+class SQLiteMemoryStore(MemoryStore):
+    """Memory store backed by a SQLite database in WAL mode"""
+
+    _instances: Dict[str, "SQLiteMemoryStore"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL keeps the database consistent, a crash may only lose the
+        # latest messages
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "session_id TEXT NOT NULL, seq INTEGER NOT NULL, data TEXT NOT NULL, "
+            "image_id TEXT, PRIMARY KEY (session_id, seq));"
+            "CREATE INDEX IF NOT EXISTS messages_image_id ON messages (image_id);"
+            "CREATE TABLE IF NOT EXISTS images ("
+            "digest TEXT PRIMARY KEY, data BLOB NOT NULL, decoded INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, metadata TEXT NOT NULL, "
+            "updated_at REAL NOT NULL);"
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_settings(
+        cls, settings: Optional[MemorySettings]
+    ) -> Optional["SQLiteMemoryStore"]:
+        """Get the shared store for the given settings, or None if disabled"""
+        if not settings or settings.backend == "memory":
+            return None
+        if settings.backend != "sqlite":
+            raise ValueError(f"Invalid memory backend: {settings.backend}")
+        path = Path(settings.path)
+        if not path.is_absolute():
+            path = PROJECT_ROOT / path
+        with cls._instances_lock:
+            key = str(path)
+            if key not in cls._instances:
+                cls._instances[key] = cls(path)
+            store = cls._instances[key]
+        store.cached_messages = settings.cached_messages
+        return store
+
+    def append(self, session_id: str, entries: List[Tuple[int, Message]]) -> None:
+        images = []
+        for _, message in entries:
+            entry = (
+                image_store.get_entry(message.image_id) if message.image_id else None
+            )
+            if entry:
+                images.append((message.image_id, entry[0], int(entry[1])))
+        with self._lock, self._conn:
+            if images:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO images (digest, data, decoded) "
+                    "VALUES (?, ?, ?)",
+                    images,
+                )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO messages (session_id, seq, data, image_id) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        session_id,
+                        seq,
+                        message.model_dump_json(exclude_none=True),
+                        message.image_id,
+                    )
+                    for seq, message in entries
+                ],
+            )
+
+    def load(self, session_id: str, seqs: List[int]) -> Dict[int, Message]:
+        if not seqs:
+            return {}
+        placeholders = ",".join("?" * len(seqs))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT seq, data, image_id FROM messages "
+                f"WHERE session_id = ? AND seq IN ({placeholders})",
+                (session_id, *seqs),
+            ).fetchall()
+            # Hold the images until the messages take their own references.
+            # Those of paged-out messages may have been freed in RAM
+            held, missing = [], set()
+            for image_id in {image_id for _, _, image_id in rows if image_id}:
+                try:
+                    image_store.acquire(image_id)
+                    held.append(image_id)
+                except KeyError:
+                    missing.add(image_id)
+            images = []
+            if missing:
+                placeholders = ",".join("?" * len(missing))
+                images = self._conn.execute(
+                    f"SELECT data, decoded FROM images WHERE digest IN ({placeholders})",
+                    tuple(missing),
+                ).fetchall()
+        held.extend(
+            image_store.put_bytes(data, bool(decoded)) for data, decoded in images
+        )
+        try:
+            return {seq: Message.model_validate_json(data) for seq, data, _ in rows}
+        finally:
+            for image_id in held:
+                image_store.release(image_id)
+
+    def seqs(self, session_id: str) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq FROM messages WHERE session_id = ? ORDER BY seq",
+                (session_id,),
+            ).fetchall()
+        return [seq for (seq,) in rows]
+
+    def delete(self, session_id: str, seqs: Optional[List[int]] = None) -> None:
+        condition, params = "session_id = ?", [session_id]
+        if seqs is not None:
+            if not seqs:
+                return
+            condition += f" AND seq IN ({','.join('?' * len(seqs))})"
+            params.extend(seqs)
+        with self._lock, self._conn:
+            with_images = self._conn.execute(
+                f"SELECT 1 FROM messages WHERE {condition} AND image_id IS NOT NULL "
+                "LIMIT 1",
+                params,
+            ).fetchone()
+            self._conn.execute(f"DELETE FROM messages WHERE {condition}", params)
+            if with_images:
+                self._conn.execute(
+                    "DELETE FROM images WHERE digest NOT IN "
+                    "(SELECT image_id FROM messages WHERE image_id IS NOT NULL)"
+                )
+
+    def save_session(self, session_id: str, metadata: dict) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, metadata, updated_at) "
+                "VALUES (?, ?, ?)",
+                (session_id, json.dumps(metadata), time.time()),
+            )
+
+    def get_session(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT metadata FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_session(self, session_id: str) -> None:
+        self.delete(session_id)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+            )
+
+
+def get_memory_store() -> Optional[MemoryStore]:
+    """Get the configured memory store, None if memory is in-process only"""
+    return SQLiteMemoryStore.from_settings(config.memory)
+
+
+def create_memory(session_id: Optional[str] = None, **kwargs) -> Memory:
+    """Create a memory using the configured backend.
+
+    Args:
+        session_id: Id of the session to create or resume, generated if None
+        **kwargs: Further Memory fields
+    """
+    store = get_memory_store()
+    if store is None:
+        return Memory(session_id=session_id, **kwargs)
+    return Memory(
+        store=store,
+        session_id=session_id,
+        hot_messages=config.memory.hot_messages,
+        **kwargs,
+    )
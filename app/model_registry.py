@@ -0,0 +1,185 @@
+"""
+Model capability registry.
+
+Maps model names to their limits, features and pricing so that token
+budgeting and request shaping use per-model values. Built-in entries cover
+common models; ``[models."<name>"]`` tables in config add new models or
+override individual fields of a built-in entry.
+
+Lookups match the exact model name first, then the longest registered name
+that the model starts with, optionally behind a provider prefix. For
+example, ``gpt-4o-2024-08-06`` resolves to ``gpt-4o`` and
+``us.anthropic.claude-3-7-sonnet-20250219-v1:0`` resolves to
+``claude-3-7-sonnet``.
+"""
+
+import re
+import threading
+from typing import Dict, Optional
+
+from app.config import ModelCapabilities, config
+from app.logger import logger
+
+
+BUILTIN_MODELS: Dict[str, dict] = {
+    "gpt-4-vision-preview": {
+        "context_window": 128000,
+        "max_output_tokens": 4096,
+        "tokenizer": "cl100k_base",
+        "supports_images": True,
+        "input_price": 10.0,
+        "output_price": 30.0,
+    },
+    "gpt-4o": {
+        "context_window": 128000,
+        "max_output_tokens": 16384,
+        "tokenizer": "o200k_base",
+        "supports_images": True,
+        "input_price": 2.5,
+        "cached_input_price": 1.25,
+        "output_price": 10.0,
+    },
+    "gpt-4o-mini": {
+        "context_window": 128000,
+        "max_output_tokens": 16384,
+        "tokenizer": "o200k_base",
+        "supports_images": True,
+        "input_price": 0.15,
+        "cached_input_price": 0.075,
+        "output_price": 0.6,
+    },
+    "o1": {
+        "context_window": 200000,
+        "max_output_tokens": 100000,
+        "tokenizer": "o200k_base",
+        "reasoning": True,
+        "input_price": 15.0,
+        "cached_input_price": 7.5,
+        "output_price": 60.0,
+    },
+    "o3-mini": {
+        "context_window": 200000,
+        "max_output_tokens": 100000,
+        "tokenizer": "o200k_base",
+        "reasoning": True,
+        "input_price": 1.1,
+        "cached_input_price": 0.55,
+        "output_price": 4.4,
+    },
+    # Anthropic does not publish a tiktoken encoding, cl100k_base is the
+    # closest approximation for local estimates
+    "claude-3-opus": {
+        "context_window": 200000,
+        "max_output_tokens": 4096,
+        "tokenizer": "cl100k_base",
+        "supports_images": True,
+        "supports_prompt_caching": True,
+        "input_price": 15.0,
+        "cached_input_price": 1.5,
+        "output_price": 75.0,
+    },
+    "claude-3-sonnet": {
+        "context_window": 200000,
+        "max_output_tokens": 4096,
+        "tokenizer": "cl100k_base",
+        "supports_images": True,
+        "input_price": 3.0,
+        "output_price": 15.0,
+    },
+    "claude-3-haiku": {
+        "context_window": 200000,
+        "max_output_tokens": 4096,
+        "tokenizer": "cl100k_base",
+        "supports_images": True,
+        "supports_prompt_caching": True,
+        "input_price": 0.25,
+        "cached_input_price": 0.03,
+        "output_price": 1.25,
+    },
+    "claude-3-5-sonnet": {
+        "context_window": 200000,
+        "max_output_tokens": 8192,
+        "tokenizer": "cl100k_base",
+        "supports_images": True,
+        "supports_prompt_caching": True,
+        "input_price": 3.0,
+        "cached_input_price": 0.3,
+        "output_price": 15.0,
+    },
+    "claude-3-7-sonnet": {
+        "context_window": 200000,
+        "max_output_tokens": 64000,
+        "tokenizer": "cl100k_base",
+        "supports_images": True,
+        "supports_prompt_caching": True,
+        "input_price": 3.0,
+        "cached_input_price": 0.3,
+        "output_price": 15.0,
+    },
+}
+
+
+class ModelRegistry:
+    """Resolves model names to their capabilities"""
+
+    def __init__(self, overrides: Optional[Dict[str, ModelCapabilities]] = None):
+        self._models: Dict[str, ModelCapabilities] = {
+            name: ModelCapabilities(**capabilities)
+            for name, capabilities in BUILTIN_MODELS.items()
+        }
+        for name, capabilities in (overrides or {}).items():
+            self.register(name, capabilities)
+        self._resolved: Dict[str, Optional[str]] = {}
+
+    def register(self, name: str, capabilities: ModelCapabilities) -> None:
+        """Add a model, merging the explicitly set fields into any existing entry"""
+        existing = self._models.get(name)
+        if existing is not None:
+            capabilities = existing.model_copy(
+                update=capabilities.model_dump(exclude_unset=True)
+            )
+        self._models[name] = capabilities
+        self._resolved = {}
+
+    def _resolve(self, model: str) -> Optional[str]:
+        if model in self._models:
+            return model
+        best = None
+        for name in self._models:
+            # Match a versioned name, optionally behind a provider prefix
+            # such as "openai/" or "us.anthropic."
+            pattern = rf"(^|[/.:]){re.escape(name)}([-:@]|$)"
+            if re.search(pattern, model) and (best is None or len(name) > len(best)):
+                best = name
+        return best
+
+    def get(self, model: str) -> ModelCapabilities:
+        """Get the capabilities of a model, falling back to conservative defaults"""
+        if model not in self._resolved:
+            self._resolved[model] = self._resolve(model)
+            if self._resolved[model] is None:
+                logger.warning(
+                    f"Model '{model}' is not in the model registry, using default capabilities. "
+                    f'Describe it in a [models."{model}"] config table for accurate limits.'
+                )
+        name = self._resolved[model]
+        return self._models[name] if name else ModelCapabilities()
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Get the process-wide registry, built from config on first use"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry(config.models)
+    return _registry
+
+
+def get_model_capabilities(model: str) -> ModelCapabilities:
+    """Get the capabilities of a model from the process-wide registry"""
+    return get_model_registry().get(model)
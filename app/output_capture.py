@@ -0,0 +1,68 @@
+"""
+Bounded capture of command output.
+
+Builds and test runs can print far more output than is useful to keep or to
+send to the model. OutputCapture keeps the beginning and the end of the
+output up to a character limit and drops the middle, so memory stays
+bounded however much a command prints.
+"""
+
+from collections import deque
+from typing import Deque, List, Optional
+
+
+class OutputCapture:
+    """Collects output chunks, keeping only the head and tail past a limit"""
+
+    def __init__(self, max_chars: Optional[int] = None, head_ratio: float = 0.5):
+        """
+        Args:
+            max_chars: Characters to keep, None to keep everything
+            head_ratio: Fraction of the kept characters taken from the start
+        """
+        self.max_chars = max_chars
+        self.total_chars = 0
+        self._head_limit = int(max_chars * head_ratio) if max_chars else 0
+        self._tail_limit = max_chars - self._head_limit if max_chars else 0
+        self._head: List[str] = []
+        self._head_size = 0
+        self._tail: Deque[str] = deque()
+        self._tail_size = 0
+
+    def write(self, chunk: str) -> None:
+        """Add a chunk of output"""
+        self.total_chars += len(chunk)
+        if self.max_chars is None:
+            self._head.append(chunk)
+            return
+
+        if self._head_size < self._head_limit:
+            part = chunk[: self._head_limit - self._head_size]
+            self._head.append(part)
+            self._head_size += len(part)
+            chunk = chunk[len(part) :]
+        if not chunk or not self._tail_limit:
+            return
+
+        self._tail.append(chunk)
+        self._tail_size += len(chunk)
+        # Drop whole chunks once the rest still fills the tail
+        while len(self._tail) > 1 and (
+            self._tail_size - len(self._tail[0]) >= self._tail_limit
+        ):
+            self._tail_size -= len(self._tail.popleft())
+
+    @property
+    def truncated(self) -> bool:
+        """Whether part of the output was dropped"""
+        return self.max_chars is not None and self.total_chars > self.max_chars
+
+    def getvalue(self) -> str:
+        """The captured output, with a marker where output was dropped"""
+        head = "".join(self._head)
+        if not self.truncated:
+            return head + "".join(self._tail)
+
+        tail = "".join(self._tail)[-self._tail_limit :] if self._tail_limit else ""
+        omitted = self.total_chars - len(head) - len(tail)
+        return f"{head}\n\n... [{omitted} characters omitted] ...\n\n{tail}"
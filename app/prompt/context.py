@@ -0,0 +1,15 @@
+SUMMARY_SYSTEM_PROMPT = """
+You are compressing the working history of an AI agent so it can keep going within its context window.
+Write a concise summary that preserves everything the agent still needs:
+- Progress made so far and the current state of the task
+- Key facts, results, numbers, file paths, URLs and identifiers found by tools
+- Decisions taken, approaches that failed and why
+- Open questions and the next planned steps
+Do not invent details. Write plain prose or short bullet points, no preamble.
+"""
+
+SUMMARY_PROMPT = """
+{previous_summary}Summarize the following steps of the agent's history into an updated summary{merge_hint}.
+
+{transcript}
+"""
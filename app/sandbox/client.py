@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Optional, Protocol
+from typing import AsyncIterator, Dict, Optional, Protocol
 
 from app.config import SandboxSettings
 from app.sandbox.core.sandbox import DockerSandbox
@@ -62,6 +62,12 @@ class BaseSandboxClient(ABC):
     async def run_command(self, command: str, timeout: Optional[int] = None) -> str:
         """Executes command."""
 
+    @abstractmethod
+    def run_command_stream(
+        self, command: str, timeout: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """Executes command, yielding output as it arrives."""
+
     @abstractmethod
     async def copy_from(self, container_path: str, local_path: str) -> None:
         """Copies file from container."""
@@ -70,6 +76,10 @@ class BaseSandboxClient(ABC):
     async def copy_to(self, local_path: str, container_path: str) -> None:
         """Copies file to container."""
 
+    @abstractmethod
+    async def sync_to(self, local_path: str, container_path: str) -> int:
+        """Copies changed files of a directory to container."""
+
     @abstractmethod
     async def read_file(self, path: str) -> str:
         """Reads file."""
@@ -124,6 +134,26 @@ class LocalSandboxClient(BaseSandboxClient):
             raise RuntimeError("Sandbox not initialized")
         return await self.sandbox.run_command(command, timeout)
 
+    async def run_command_stream(
+        self, command: str, timeout: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """Runs command in sandbox, yielding output as it arrives.
+
+        Args:
+            command: Command to execute.
+            timeout: Execution timeout in seconds.
+
+        Yields:
+            Chunks of command output.
+
+        Raises:
+            RuntimeError: If sandbox not initialized.
+        """
+        if not self.sandbox:
+            raise RuntimeError("Sandbox not initialized")
+        async for chunk in self.sandbox.run_command_stream(command, timeout):
+            yield chunk
+
     async def copy_from(self, container_path: str, local_path: str) -> None:
         """Copies file from container to local.
 
@@ -152,6 +182,23 @@ class LocalSandboxClient(BaseSandboxClient):
             raise RuntimeError("Sandbox not initialized")
         await self.sandbox.copy_to(local_path, container_path)
 
+    async def sync_to(self, local_path: str, container_path: str) -> int:
+        """Copies the files of a local directory that differ in the container.
+
+        Args:
+            local_path: Local source directory path.
+            container_path: Destination directory path in container.
+
+        Returns:
+            Number of files transferred.
+
+        Raises:
+            RuntimeError: If sandbox not initialized.
+        """
+        if not self.sandbox:
+            raise RuntimeError("Sandbox not initialized")
+        return await self.sandbox.sync_to(local_path, container_path)
+
     async def read_file(self, path: str) -> str:
         """Reads file from container.
 
@@ -1,7 +1,8 @@
 import asyncio
 import uuid
+from collections import deque
 from contextlib import asynccontextmanager
-from typing import Dict, Optional, Set
+from typing import Deque, Dict, Optional, Set
 
 import docker
 from docker.errors import APIError, ImageNotFound
@@ -18,12 +19,22 @@ class SandboxManager:
     monitoring, and cleanup. Provides concurrent access control and automatic
     cleanup mechanisms for sandbox resources.
 
+    Optionally keeps a warm pool of started sandboxes with initialized
+    terminals. Requests for the pool configuration without volume bindings
+    are served from the pool in O(1), and the pool is replenished in the
+    background. Pooled sandboxes count toward max_sandboxes only once handed
+    out.
+
     Attributes:
         max_sandboxes: Maximum allowed number of sandboxes.
         idle_timeout: Sandbox idle timeout in seconds.
         cleanup_interval: Cleanup check interval in seconds.
+        pool_size: Number of warm sandboxes to keep ready.
+        pool_config: Configuration of pooled sandboxes.
+        reset_on_release: Whether released sandboxes are reset and reused.
         _sandboxes: Active sandbox instance mapping.
         _last_used: Last used time record for sandboxes.
+        _pool: Warm sandboxes ready to be handed out.
     """
 
     def __init__(
@@ -31,6 +42,9 @@ class SandboxManager:
         max_sandboxes: int = 100,
         idle_timeout: int = 3600,
         cleanup_interval: int = 300,
+        pool_size: int = 0,
+        pool_config: Optional[SandboxSettings] = None,
+        reset_on_release: bool = False,
     ):
         """Initializes sandbox manager.
 
@@ -38,10 +52,20 @@ class SandboxManager:
             max_sandboxes: Maximum sandbox count limit.
             idle_timeout: Idle timeout in seconds.
             cleanup_interval: Cleanup check interval in seconds.
+            pool_size: Warm pool size, 0 disables the pool.
+            pool_config: Configuration of pooled sandboxes. Default
+                configuration used if None.
+            reset_on_release: Reset released sandboxes and return them to the
+                pool, instead of discarding and replacing them. Off by default:
+                a fresh container is the only clean state guaranteed, a reset
+                one is reused only if its changes can be undone.
         """
         self.max_sandboxes = max_sandboxes
         self.idle_timeout = idle_timeout
         self.cleanup_interval = cleanup_interval
+        self.pool_size = pool_size
+        self.pool_config = pool_config or SandboxSettings()
+        self.reset_on_release = reset_on_release
 
         # Docker client
         self._client = docker.from_env()
@@ -55,6 +79,13 @@ class SandboxManager:
         self._global_lock = asyncio.Lock()
         self._active_operations: Set[str] = set()
 
+        # Warm pool
+        self._pool: Deque[DockerSandbox] = deque()
+        self._pool_task: Optional[asyncio.Task] = None
+        self._pool_hits = 0
+        self._pool_misses = 0
+        self._pool_recycled = 0
+
         # Cleanup task
         self._cleanup_task: Optional[asyncio.Task] = None
         self._is_shutting_down = False
@@ -62,6 +93,9 @@ class SandboxManager:
         # Start automatic cleanup
         self.start_cleanup_task()
 
+        # Start filling the warm pool
+        self._replenish_pool()
+
     async def ensure_image(self, image: str) -> bool:
         """Ensures Docker image is available.
 
@@ -134,6 +168,17 @@ class SandboxManager:
                     f"Maximum number of sandboxes ({self.max_sandboxes}) reached"
                 )
 
+            if self._is_poolable(config, volume_bindings):
+                if self._pool:
+                    sandbox_id = str(uuid.uuid4())
+                    self._register_sandbox(sandbox_id, self._pool.popleft())
+                    self._pool_hits += 1
+                    self._replenish_pool()
+                    logger.info(f"Created sandbox {sandbox_id} from the warm pool")
+                    return sandbox_id
+                self._pool_misses += 1
+                self._replenish_pool()
+
             config = config or SandboxSettings()
             if not await self.ensure_image(config.image):
                 raise RuntimeError(f"Failed to ensure Docker image: {config.image}")
@@ -143,9 +188,7 @@ class SandboxManager:
                 sandbox = DockerSandbox(config, volume_bindings)
                 await sandbox.create()
 
-                self._sandboxes[sandbox_id] = sandbox
-                self._last_used[sandbox_id] = asyncio.get_event_loop().time()
-                self._locks[sandbox_id] = asyncio.Lock()
+                self._register_sandbox(sandbox_id, sandbox)
 
                 logger.info(f"Created sandbox {sandbox_id}")
                 return sandbox_id
@@ -156,6 +199,127 @@ class SandboxManager:
                     await self.delete_sandbox(sandbox_id)
                 raise RuntimeError(f"Failed to create sandbox: {e}")
 
+    def _register_sandbox(self, sandbox_id: str, sandbox: DockerSandbox) -> None:
+        """Registers a sandbox as active.
+
+        Args:
+            sandbox_id: Sandbox ID.
+            sandbox: Started sandbox instance.
+        """
+        self._sandboxes[sandbox_id] = sandbox
+        self._last_used[sandbox_id] = asyncio.get_event_loop().time()
+        self._locks[sandbox_id] = asyncio.Lock()
+
+    def _is_poolable(
+        self,
+        config: Optional[SandboxSettings],
+        volume_bindings: Optional[Dict[str, str]],
+    ) -> bool:
+        """Checks whether a sandbox request can be served by the warm pool.
+
+        Args:
+            config: Requested sandbox configuration.
+            volume_bindings: Requested volume mappings.
+
+        Returns:
+            bool: Whether pooled sandboxes match the request.
+        """
+        return (
+            self.pool_size > 0
+            and not volume_bindings
+            and (config is None or config == self.pool_config)
+        )
+
+    def _replenish_pool(self) -> None:
+        """Starts refilling the warm pool in the background if needed."""
+        if (
+            self.pool_size <= 0
+            or self._is_shutting_down
+            or len(self._pool) >= self.pool_size
+            or (self._pool_task and not self._pool_task.done())
+        ):
+            return
+        self._pool_task = asyncio.create_task(self._fill_pool())
+
+    async def _fill_pool(self) -> None:
+        """Creates sandboxes concurrently until the warm pool is full."""
+        if not await self.ensure_image(self.pool_config.image):
+            logger.error(
+                f"Warm pool disabled, image unavailable: {self.pool_config.image}"
+            )
+            return
+
+        while not self._is_shutting_down and len(self._pool) < self.pool_size:
+            missing = self.pool_size - len(self._pool)
+            creating = asyncio.gather(
+                *(DockerSandbox(self.pool_config).create() for _ in range(missing)),
+                return_exceptions=True,
+            )
+            try:
+                # Cancelling a create midway would leak its container
+                results = await asyncio.shield(creating)
+            except asyncio.CancelledError:
+                for result in await creating:
+                    if isinstance(result, DockerSandbox):
+                        await result.cleanup()
+                raise
+            failed = False
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to create pooled sandbox: {result}")
+                    failed = True
+                elif self._is_shutting_down or len(self._pool) >= self.pool_size:
+                    await result.cleanup()
+                else:
+                    self._pool.append(result)
+            if failed:
+                # Retry on the next request rather than spinning on errors
+                return
+
+    async def release_sandbox(self, sandbox_id: str) -> None:
+        """Releases a sandbox that is no longer needed.
+
+        Sandboxes with the pool configuration are reset and returned to the
+        warm pool while it has room. Other sandboxes, and those that fail to
+        reset, are deleted and the pool is replenished.
+
+        Args:
+            sandbox_id: Sandbox ID.
+        """
+        lock = self._locks.get(sandbox_id)
+        if lock is None:
+            return
+
+        # Wait for running operations on the sandbox to finish
+        async with lock:
+            async with self._global_lock:
+                sandbox = self._sandboxes.pop(sandbox_id, None)
+                self._last_used.pop(sandbox_id, None)
+                self._locks.pop(sandbox_id, None)
+        if sandbox is None:
+            return
+
+        reusable = (
+            self.reset_on_release
+            and len(self._pool) < self.pool_size
+            and self._is_poolable(sandbox.config, sandbox.volume_bindings)
+        )
+        if reusable:
+            try:
+                await sandbox.reset()
+            except Exception as e:
+                logger.warning(f"Discarding sandbox {sandbox_id}: {e}")
+                reusable = False
+
+        if reusable and not self._is_shutting_down and len(self._pool) < self.pool_size:
+            self._pool.append(sandbox)
+            self._pool_recycled += 1
+            logger.info(f"Returned sandbox {sandbox_id} to the warm pool")
+        else:
+            await sandbox.cleanup()
+            logger.info(f"Deleted sandbox {sandbox_id}")
+            self._replenish_pool()
+
     async def get_sandbox(self, sandbox_id: str) -> DockerSandbox:
         """Gets a sandbox instance.
 
@@ -216,6 +380,12 @@ class SandboxManager:
             except (asyncio.CancelledError, asyncio.TimeoutError):
                 pass
 
+        # Stop filling the pool, waiting for the sandboxes being created to
+        # be removed; wait() does not cancel the task again on timeout
+        if self._pool_task and not self._pool_task.done():
+            self._pool_task.cancel()
+            await asyncio.wait([self._pool_task], timeout=30.0)
+
         # Get all sandbox IDs to clean up
         async with self._global_lock:
             sandbox_ids = list(self._sandboxes.keys())
@@ -225,6 +395,8 @@ class SandboxManager:
         for sandbox_id in sandbox_ids:
             task = asyncio.create_task(self._safe_delete_sandbox(sandbox_id))
             cleanup_tasks.append(task)
+        while self._pool:
+            cleanup_tasks.append(asyncio.create_task(self._pool.popleft().cleanup()))
 
         if cleanup_tasks:
             # Wait for all cleanup tasks to complete, with timeout to avoid infinite waiting
@@ -310,4 +482,14 @@ class SandboxManager:
             "idle_timeout": self.idle_timeout,
             "cleanup_interval": self.cleanup_interval,
             "is_shutting_down": self._is_shutting_down,
+            "pool_size": self.pool_size,
+            "pool_available": len(self._pool),
+            "pool_hits": self._pool_hits,
+            "pool_misses": self._pool_misses,
+            "pool_hit_rate": (
+                self._pool_hits / (self._pool_hits + self._pool_misses)
+                if self._pool_hits + self._pool_misses
+                else 0.0
+            ),
+            "pool_recycled": self._pool_recycled,
         }
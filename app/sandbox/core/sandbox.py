@@ -1,10 +1,13 @@
 import asyncio
 import io
 import os
+import shlex
+import shutil
+import stat
 import tarfile
 import tempfile
 import uuid
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import docker
 from docker.errors import NotFound
@@ -15,6 +18,44 @@ from app.sandbox.core.exceptions import SandboxTimeoutError
 from app.sandbox.core.terminal import AsyncDockerizedTerminal
 
 
+# Bytes of file content read or written at a time when copying files
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+# Kind of a path added to the container filesystem in a Docker diff
+_DIFF_ADDED = 1
+
+# Paths removed per command when syncing deletions
+_DELETE_BATCH_SIZE = 500
+
+
+class _ChunkReader(io.RawIOBase):
+    """Readable file over an iterator of byte chunks.
+
+    Lets tarfile read an archive straight from the chunks of a Docker
+    archive response, without spooling it to disk first. Archives sent to
+    the container are passed to ``put_archive`` as such a stream, so they
+    are uploaded as they are generated.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
 class DockerSandbox:
     """Docker sandbox environment.
 
@@ -45,6 +86,8 @@ class DockerSandbox:
         self.client = docker.from_env()
         self.container: Optional[Container] = None
         self.terminal: Optional[AsyncDockerizedTerminal] = None
+        # Filesystem changes of the freshly created container, kept by reset()
+        self._baseline: Set[str] = set()
 
     async def create(self) -> "DockerSandbox":
         """Creates and starts the sandbox container.
@@ -91,10 +134,15 @@ class DockerSandbox:
             self.terminal = AsyncDockerizedTerminal(
                 container["Id"],
                 self.config.work_dir,
-                env_vars={"PYTHONUNBUFFERED": "1"}
+                env_vars={"PYTHONUNBUFFERED": "1"},
                 # Ensure Python output is not buffered
+                max_output=self.config.max_output_chars,
             )
             await self.terminal.init()
+            self._baseline = {
+                change["Path"]
+                for change in await asyncio.to_thread(self.container.diff) or []
+            }
 
             return self
 
@@ -102,6 +150,77 @@ class DockerSandbox:
             await self.cleanup()  # Ensure resources are cleaned up
             raise RuntimeError(f"Failed to create sandbox: {e}") from e
 
+    async def reset(self) -> None:
+        """Resets the sandbox to a clean state for reuse.
+
+        Kills leftover processes, removes every file added to the container
+        filesystem since it was created (work dir, /tmp, home directory,
+        installed packages) and starts a fresh terminal session, so no state
+        leaks to the next user. Files of the image that were modified or
+        deleted cannot be restored, so the reset fails and the sandbox must
+        be discarded instead.
+
+        Raises:
+            RuntimeError: If sandbox not initialized or reset fails.
+        """
+        if not self.container or not self.terminal:
+            raise RuntimeError("Sandbox not initialized")
+
+        try:
+            await self.terminal.close()
+            # kill -1 signals every process but init and the shell itself
+            await self._exec_checked(["sh", "-c", "kill -9 -1 2>/dev/null; true"])
+
+            changes = [
+                change
+                for change in await asyncio.to_thread(self.container.diff) or []
+                if change["Path"] not in self._baseline
+            ]
+            added = sorted(c["Path"] for c in changes if c["Kind"] == _DIFF_ADDED)
+            changed = [c["Path"] for c in changes if c["Kind"] != _DIFF_ADDED]
+
+            # Directories are changed by adding files to them, which are
+            # removed below; any other change is to a file of the image
+            if changed:
+                result = await self._exec_checked(
+                    ["sh", "-c", 'for p; do [ -d "$p" ] || echo "$p"; done', "sh"]
+                    + changed
+                )
+                if result.strip():
+                    raise RuntimeError(
+                        f"image files changed: {', '.join(result.split())}"
+                    )
+
+            # Removing a directory removes what was added inside it
+            roots: List[str] = []
+            for path in added:
+                if not roots or not path.startswith(roots[-1].rstrip("/") + "/"):
+                    roots.append(path)
+            if roots:
+                await self._exec_checked(["rm", "-rf", "--"] + roots)
+
+            await self.terminal.init()
+        except Exception as e:
+            raise RuntimeError(f"Failed to reset sandbox: {e}") from e
+
+    async def _exec_checked(self, cmd: List[str]) -> str:
+        """Runs a command as root in the container, failing on a nonzero exit.
+
+        Args:
+            cmd: Command and arguments.
+
+        Returns:
+            Command output.
+
+        Raises:
+            RuntimeError: If the command fails.
+        """
+        result = await asyncio.to_thread(self.container.exec_run, cmd, user="root")
+        output = result.output.decode("utf-8", errors="replace")
+        if result.exit_code != 0:
+            raise RuntimeError(output)
+        return output
+
     def _prepare_volume_bindings(self) -> Dict[str, Dict[str, str]]:
         """Prepares volume binding configuration.
 
@@ -163,6 +282,38 @@ class DockerSandbox:
                 f"Command execution timed out after {timeout or self.config.timeout} seconds"
             )
 
+    async def run_command_stream(
+        self, cmd: str, timeout: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """Runs a command in the sandbox, yielding output as it arrives.
+
+        Output is read from the container only as fast as it is consumed,
+        so a slow consumer holds back the command rather than buffering.
+
+        Args:
+            cmd: Command to execute.
+            timeout: Timeout in seconds.
+
+        Yields:
+            Chunks of command output.
+
+        Raises:
+            RuntimeError: If sandbox not initialized or command execution fails.
+            SandboxTimeoutError: If command execution times out.
+        """
+        if not self.terminal:
+            raise RuntimeError("Sandbox not initialized")
+
+        try:
+            async for chunk in self.terminal.run_command_stream(
+                cmd, timeout=timeout or self.config.timeout
+            ):
+                yield chunk
+        except TimeoutError:
+            raise SandboxTimeoutError(
+                f"Command execution timed out after {timeout or self.config.timeout} seconds"
+            )
+
     async def read_file(self, path: str) -> str:
         """Reads a file from the container.
 
@@ -271,41 +422,36 @@ class DockerSandbox:
 
             # Get file stream
             resolved_src = self._safe_resolve_path(src_path)
-            stream, stat = await asyncio.to_thread(
+            stream, _ = await asyncio.to_thread(
                 self.container.get_archive, resolved_src
             )
 
-            # Create temporary directory to extract file
-            with tempfile.TemporaryDirectory() as tmp_dir:
-                # Write stream to temporary file
-                tar_path = os.path.join(tmp_dir, "temp.tar")
-                with open(tar_path, "wb") as f:
-                    for chunk in stream:
-                        f.write(chunk)
-
-                # Extract file
-                with tarfile.open(tar_path) as tar:
-                    members = tar.getmembers()
-                    if not members:
-                        raise FileNotFoundError(f"Source file is empty: {src_path}")
-
+            def extract() -> None:
+                # Members are extracted as the archive chunks arrive
+                with tarfile.open(fileobj=_ChunkReader(stream), mode="r|") as tar:
                     # If destination is a directory, we should preserve relative path structure
                     if os.path.isdir(dst_path):
                         tar.extractall(dst_path)
-                    else:
-                        # If destination is a file, we only extract the source file's content
-                        if len(members) > 1:
-                            raise RuntimeError(
-                                f"Source path is a directory but destination is a file: {src_path}"
-                            )
-
-                        with open(dst_path, "wb") as dst:
-                            src_file = tar.extractfile(members[0])
-                            if src_file is None:
-                                raise RuntimeError(
-                                    f"Failed to extract file: {src_path}"
-                                )
-                            dst.write(src_file.read())
+                        if not tar.members:
+                            raise FileNotFoundError(f"Source file is empty: {src_path}")
+                        return
+
+                    member = tar.next()
+                    if member is None:
+                        raise FileNotFoundError(f"Source file is empty: {src_path}")
+                    # If destination is a file, we only extract the source file's content
+                    if not member.isfile():
+                        raise RuntimeError(
+                            f"Source path is a directory but destination is a file: {src_path}"
+                        )
+
+                    src_file = tar.extractfile(member)
+                    if src_file is None:
+                        raise RuntimeError(f"Failed to extract file: {src_path}")
+                    with open(dst_path, "wb") as dst:
+                        shutil.copyfileobj(src_file, dst, _COPY_CHUNK_SIZE)
+
+            await asyncio.to_thread(extract)
 
         except docker.errors.NotFound:
             raise FileNotFoundError(f"Source file not found: {src_path}")
@@ -333,47 +479,202 @@ class DockerSandbox:
             if container_dir:
                 await self.run_command(f"mkdir -p {container_dir}")
 
-            # Create tar file to upload
-            with tempfile.TemporaryDirectory() as tmp_dir:
-                tar_path = os.path.join(tmp_dir, "temp.tar")
-                with tarfile.open(tar_path, "w") as tar:
-                    # Handle directory source path
-                    if os.path.isdir(src_path):
-                        os.path.basename(src_path.rstrip("/"))
-                        for root, _, files in os.walk(src_path):
-                            for file in files:
-                                file_path = os.path.join(root, file)
-                                arcname = os.path.join(
-                                    os.path.basename(dst_path),
-                                    os.path.relpath(file_path, src_path),
-                                )
-                                tar.add(file_path, arcname=arcname)
-                    else:
-                        # Add single file to tar
-                        tar.add(src_path, arcname=os.path.basename(dst_path))
-
-                # Read tar file content
-                with open(tar_path, "rb") as f:
-                    data = f.read()
-
-                # Upload to container
-                await asyncio.to_thread(
-                    self.container.put_archive,
-                    os.path.dirname(resolved_dst) or "/",
-                    data,
-                )
+            # Upload to container, the archive is generated as it is sent
+            entries = list(self._walk_files(src_path, os.path.basename(dst_path)))
+            await asyncio.to_thread(
+                self.container.put_archive,
+                os.path.dirname(resolved_dst) or "/",
+                _ChunkReader(self._iter_tar(entries)),
+            )
 
-                # Verify file was created successfully
-                try:
-                    await self.run_command(f"test -e {resolved_dst}")
-                except Exception:
-                    raise RuntimeError(f"Failed to verify file creation: {dst_path}")
+            # Verify file was created successfully
+            try:
+                await self.run_command(f"test -e {resolved_dst}")
+            except Exception:
+                raise RuntimeError(f"Failed to verify file creation: {dst_path}")
 
         except FileNotFoundError:
             raise
         except Exception as e:
             raise RuntimeError(f"Failed to copy file: {e}")
 
+    async def sync_to(self, src_path: str, dst_path: str, delete: bool = False) -> int:
+        """Copies the files of a host directory that differ in the container.
+
+        Files are compared by size and modification time and directories are
+        sent when missing. Transfers keep the modification time, so repeated
+        syncs only send changed entries. Entries deleted on the host are
+        only removed from the container with ``delete``.
+
+        Args:
+            src_path: Source directory path (host).
+            dst_path: Destination directory path (container).
+            delete: Whether to remove container entries missing on the host.
+
+        Returns:
+            Number of files, symlinks and directories transferred or removed.
+
+        Raises:
+            FileNotFoundError: If source directory does not exist.
+            RuntimeError: If sync operation fails.
+        """
+        if not os.path.isdir(src_path):
+            raise FileNotFoundError(f"Source directory not found: {src_path}")
+        if not self.container:
+            raise RuntimeError("Sandbox not initialized")
+
+        try:
+            resolved_dst = self._safe_resolve_path(dst_path)
+            remote_files = await self._list_files(resolved_dst)
+            local_entries = list(self._walk_files(src_path, ""))
+            entries = [
+                (file_path, arcname)
+                for file_path, arcname in local_entries
+                if self._needs_sync(file_path, remote_files.get(arcname))
+            ]
+
+            stale: List[str] = []
+            if delete:
+                local_names = {arcname for _, arcname in local_entries}
+                # Sorted, a directory comes before its contents, which are
+                # removed along with it
+                removed = set()
+                for name in sorted(set(remote_files) - local_names):
+                    if os.path.dirname(name) not in removed:
+                        stale.append(name)
+                    removed.add(name)
+                for start in range(0, len(stale), _DELETE_BATCH_SIZE):
+                    paths = stale[start : start + _DELETE_BATCH_SIZE]
+                    await self._exec_checked(
+                        ["rm", "-rf", "--"]
+                        + [os.path.join(resolved_dst, path) for path in paths]
+                    )
+
+            if entries:
+                await self.run_command(f"mkdir -p {shlex.quote(resolved_dst)}")
+                await asyncio.to_thread(
+                    self.container.put_archive,
+                    resolved_dst,
+                    _ChunkReader(self._iter_tar(entries)),
+                )
+            return len(entries) + len(stale)
+
+        except Exception as e:
+            raise RuntimeError(f"Failed to sync directory: {e}")
+
+    async def _list_files(self, path: str) -> Dict[str, Tuple[int, int]]:
+        """Lists the files, symlinks and directories below a container directory.
+
+        Args:
+            path: Directory path (container).
+
+        Returns:
+            Size and modification time by path relative to the directory,
+            empty if the directory does not exist.
+        """
+        result = await asyncio.to_thread(
+            self.container.exec_run,
+            ["find", path, "-mindepth", "1"]
+            + ["(", "-type", "f", "-o", "-type", "l", "-o", "-type", "d", ")"]
+            + ["-printf", "%s %T@ %P\\0"],
+        )
+        if result.exit_code != 0:
+            return {}
+
+        files = {}
+        for entry in result.output.decode("utf-8", "surrogateescape").split("\0"):
+            if entry:
+                size, mtime, name = entry.split(" ", 2)
+                files[name] = (int(size), int(float(mtime)))
+        return files
+
+    @staticmethod
+    def _file_signature(path: str) -> Tuple[int, int]:
+        """Size and modification time compared by sync_to."""
+        file_stat = os.lstat(path)
+        return file_stat.st_size, int(file_stat.st_mtime)
+
+    @classmethod
+    def _needs_sync(cls, path: str, remote: Optional[Tuple[int, int]]) -> bool:
+        """Whether sync_to transfers a host entry given its container signature."""
+        if os.path.isdir(path) and not os.path.islink(path):
+            # Directory sizes and times differ between hosts, only send missing ones
+            return remote is None
+        return remote != cls._file_signature(path)
+
+    @staticmethod
+    def _walk_files(src_path: str, arcname: str) -> Iterator[Tuple[str, str]]:
+        """Lists the entries to archive for a host path.
+
+        Directories are listed before their contents, so empty directories
+        are kept. Symlinks, including symlinked directories, are listed as
+        links and not followed.
+
+        Args:
+            src_path: File or directory path (host).
+            arcname: Archive name of the path, empty to list only the contents.
+
+        Yields:
+            Tuples of (host path, archive name).
+        """
+        if arcname or not os.path.isdir(src_path) or os.path.islink(src_path):
+            yield src_path, arcname
+        if not os.path.isdir(src_path) or os.path.islink(src_path):
+            return
+
+        for root, dirs, files in os.walk(src_path):
+            # os.walk lists symlinked directories in dirs without entering them
+            for name in dirs + files:
+                entry_path = os.path.join(root, name)
+                yield entry_path, os.path.join(
+                    arcname, os.path.relpath(entry_path, src_path)
+                )
+
+    @staticmethod
+    def _iter_tar(entries: List[Tuple[str, str]]) -> Iterator[bytes]:
+        """Generates a tar archive of host files chunk by chunk.
+
+        Only one chunk of file content is held at a time, so archives of
+        any size are produced in bounded memory.
+
+        Args:
+            entries: Tuples of (host path, archive name).
+
+        Yields:
+            Chunks of the archive.
+        """
+        for path, arcname in entries:
+            file_stat = os.lstat(path)
+            info = tarfile.TarInfo(arcname)
+            info.mode = stat.S_IMODE(file_stat.st_mode)
+            info.mtime = int(file_stat.st_mtime)
+            if stat.S_ISLNK(file_stat.st_mode):
+                info.type = tarfile.SYMTYPE
+                info.linkname = os.readlink(path)
+                yield info.tobuf(tarfile.PAX_FORMAT)
+                continue
+            if stat.S_ISDIR(file_stat.st_mode):
+                info.type = tarfile.DIRTYPE
+                yield info.tobuf(tarfile.PAX_FORMAT)
+                continue
+
+            info.size = file_stat.st_size
+            yield info.tobuf(tarfile.PAX_FORMAT)
+            remaining = info.size
+            with open(path, "rb") as f:
+                while remaining:
+                    chunk = f.read(min(remaining, _COPY_CHUNK_SIZE))
+                    if not chunk:
+                        # The file shrank while being archived
+                        chunk = bytes(min(remaining, _COPY_CHUNK_SIZE))
+                    remaining -= len(chunk)
+                    yield chunk
+            # Pad the content to a whole block
+            yield bytes(-info.size % tarfile.BLOCKSIZE)
+
+        # End of archive marker
+        yield bytes(2 * tarfile.BLOCKSIZE)
+
     @staticmethod
     async def _create_tar_stream(name: str, content: bytes) -> io.BytesIO:
         """Creates a tar file stream.
@@ -406,12 +707,9 @@ class DockerSandbox:
         Raises:
             RuntimeError: If read operation fails.
         """
-        with tempfile.NamedTemporaryFile() as tmp:
-            for chunk in tar_stream:
-                tmp.write(chunk)
-            tmp.seek(0)
 
-            with tarfile.open(fileobj=tmp) as tar:
+        def read() -> bytes:
+            with tarfile.open(fileobj=_ChunkReader(tar_stream), mode="r|") as tar:
                 member = tar.next()
                 if not member:
                     raise RuntimeError("Empty tar archive")
@@ -422,6 +720,8 @@ class DockerSandbox:
 
                 return file_content.read()
 
+        return await asyncio.to_thread(read)
+
     async def cleanup(self) -> None:
         """Cleans up sandbox resources."""
         errors = []
@@ -6,17 +6,41 @@ allowing interactive command execution with timeout control.
 """
 
 import asyncio
-import re
+import codecs
 import socket
-from typing import Dict, Optional, Tuple, Union
+import uuid
+from typing import AsyncIterator, Dict, Optional, Tuple, Union
 
 import docker
 from docker import APIClient
 from docker.errors import APIError
 from docker.models.containers import Container
 
+from app.output_capture import OutputCapture
+
+
+def _overlap(data: bytearray, marker: bytes) -> int:
+    """Returns the length of the longest end of data that starts marker."""
+    for size in range(min(len(marker) - 1, len(data)), 0, -1):
+        if data.endswith(marker[:size]):
+            return size
+    return 0
+
 
 class DockerSession:
+    """Interactive bash session inside a container.
+
+    The Docker attach socket is read through the event loop, so commands
+    complete as soon as their output arrives. Each command is followed by a
+    unique sentinel line carrying its exit status, which marks the end of
+    its output.
+    """
+
+    # Size of a single socket read
+    READ_SIZE = 65536
+    # Start of the line printed after each command
+    SENTINEL_PREFIX = b"__OPENMANUS_DONE_"
+
     def __init__(self, container_id: str) -> None:
         """Initializes a Docker session.
 
@@ -27,6 +51,9 @@ class DockerSession:
         self.container_id = container_id
         self.exec_id = None
         self.socket = None
+        self.last_exit_code: Optional[int] = None
+        # Output received after the sentinel of the previous command
+        self._pending = bytearray()
 
     async def create(self, working_dir: str, env_vars: Dict[str, str]) -> None:
         """Creates an interactive session with the container.
@@ -38,16 +65,19 @@ class DockerSession:
         Raises:
             RuntimeError: If socket connection fails.
         """
+        # No prompts and no line editing, so the output is only what the
+        # commands print
         startup_command = [
             "bash",
             "-c",
             f"cd {working_dir} && "
             "PROMPT_COMMAND='' "
-            "PS1='$ ' "
-            "exec bash --norc --noprofile",
+            "PS1='' PS2='' "
+            "exec bash --norc --noprofile --noediting",
         ]
 
-        exec_data = self.api.exec_create(
+        exec_data = await asyncio.to_thread(
+            self.api.exec_create,
             self.container_id,
             startup_command,
             stdin=True,
@@ -56,12 +86,17 @@ class DockerSession:
             stderr=True,
             privileged=True,
             user="root",
-            environment={**env_vars, "TERM": "dumb", "PS1": "$ ", "PROMPT_COMMAND": ""},
+            environment={**env_vars, "TERM": "dumb", "PS1": "", "PROMPT_COMMAND": ""},
         )
         self.exec_id = exec_data["Id"]
 
-        socket_data = self.api.exec_start(
-            self.exec_id, socket=True, tty=True, stream=True, demux=True
+        socket_data = await asyncio.to_thread(
+            self.api.exec_start,
+            self.exec_id,
+            socket=True,
+            tty=True,
+            stream=True,
+            demux=True,
         )
 
         if hasattr(socket_data, "_sock"):
@@ -70,7 +105,9 @@ class DockerSession:
         else:
             raise RuntimeError("Failed to get socket connection")
 
-        await self._read_until_prompt()
+        # Stop the terminal from echoing input back, then wait for the shell
+        await self._send("stty -echo\n")
+        await self._run("true")
 
     async def close(self) -> None:
         """Cleans up session resources.
@@ -83,7 +120,7 @@ class DockerSession:
             if self.socket:
                 # Send exit command to close bash session
                 try:
-                    self.socket.sendall(b"exit\n")
+                    await asyncio.wait_for(self._send("exit\n"), timeout=1.0)
                     # Allow time for command execution
                     await asyncio.sleep(0.1)
                 except:
@@ -101,7 +138,9 @@ class DockerSession:
             if self.exec_id:
                 try:
                     # Check exec instance status
-                    exec_inspect = self.api.exec_inspect(self.exec_id)
+                    exec_inspect = await asyncio.to_thread(
+                        self.api.exec_inspect, self.exec_id
+                    )
                     if exec_inspect.get("Running", False):
                         # If still running, wait for it to complete
                         await asyncio.sleep(0.5)
@@ -114,106 +153,194 @@ class DockerSession:
             # Log error but don't raise, ensure cleanup continues
             print(f"Warning: Error during session cleanup: {e}")
 
-    async def _read_until_prompt(self) -> str:
-        """Reads output until prompt is found.
+    async def _send(self, data: str) -> None:
+        """Writes input to the shell."""
+        await asyncio.get_running_loop().sock_sendall(self.socket, data.encode())
 
-        Returns:
-            String containing output up to the prompt.
+    async def _recv(self) -> bytes:
+        """Reads the next chunk of output from the shell.
 
         Raises:
-            socket.error: If socket communication fails.
+            RuntimeError: If the shell closed the connection.
         """
-        buffer = b""
-        while b"$ " not in buffer:
-            try:
-                chunk = self.socket.recv(4096)
-                if chunk:
-                    buffer += chunk
-            except socket.error as e:
-                if e.errno == socket.EWOULDBLOCK:
-                    await asyncio.sleep(0.1)
-                    continue
-                raise
-        return buffer.decode("utf-8")
+        chunk = await asyncio.get_running_loop().sock_recv(self.socket, self.READ_SIZE)
+        if not chunk:
+            raise RuntimeError("Session closed by the container")
+        return chunk
 
-    async def execute(self, command: str, timeout: Optional[int] = None) -> str:
-        """Executes a command and returns cleaned output.
+    @staticmethod
+    def _sentinel_command(token: str) -> str:
+        """Command printing the sentinel line with the exit status.
+
+        The marker is assembled by printf, so the command text itself never
+        contains it, even if echoed.
+        """
+        return f"printf '\\n%s_%s:%d\\n' __OPENMANUS_DONE {token} \"$?\"\n"
+
+    def _take_output(self, buffer: bytearray, marker: bytes) -> Tuple[bytes, bool]:
+        """Removes the output that is ready to be returned from the buffer.
+
+        Bytes that may be the start of a sentinel split across reads stay in
+        the buffer until more data arrives.
 
         Args:
-            command: Shell command to execute.
-            timeout: Maximum execution time in seconds.
+            buffer: Received output not returned yet.
+            marker: Start of the running command's sentinel.
 
         Returns:
-            Command output as string with prompt markers removed.
-
-        Raises:
-            RuntimeError: If session not initialized or execution fails.
-            TimeoutError: If command execution exceeds timeout.
+            Tuple of (output, whether the command's sentinel was reached).
         """
-        if not self.socket:
-            raise RuntimeError("Session not initialized")
+        prefix = self.SENTINEL_PREFIX
+        while True:
+            index = buffer.find(prefix)
+            end = buffer.find(b"\n", index) if index != -1 else -1
+            if end == -1:
+                # Hold back a partial sentinel and the newline ahead of it
+                ready = index if index != -1 else len(buffer) - _overlap(buffer, prefix)
+                if buffer[:ready].endswith(b"\n"):
+                    ready -= 1
+                if buffer[:ready].endswith(b"\r"):
+                    ready -= 1
+                output = bytes(buffer[:ready])
+                del buffer[:ready]
+                return output, False
+
+            if not buffer.startswith(marker, index):
+                # Output of an interrupted command that finished late
+                del buffer[: end + 1]
+                continue
+
+            status = bytes(buffer[index + len(marker) : end]).strip()
+            self.last_exit_code = int(status) if status.isdigit() else None
+            self._pending = buffer[end + 1 :]
+            output = bytes(buffer[:index])
+            buffer.clear()
+            # Drop the newline printed ahead of the sentinel
+            if output.endswith(b"\r\n"):
+                output = output[:-2]
+            elif output.endswith(b"\n"):
+                output = output[:-1]
+            return output, True
+
+    async def _stream(
+        self, command: str, timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """Runs a command and yields its output up to the sentinel.
 
-        try:
-            # Sanitize command to prevent shell injection
-            sanitized_command = self._sanitize_command(command)
-            full_command = f"{sanitized_command}\necho $?\n"
-            self.socket.sendall(full_command.encode())
+        Args:
+            command: Shell command to execute.
+            timeout: Maximum execution time in seconds.
 
-            async def read_output() -> str:
-                buffer = b""
-                result_lines = []
-                command_sent = False
+        Yields:
+            Chunks of output, with the exit status in last_exit_code once
+            the command is done.
 
-                while True:
-                    try:
-                        chunk = self.socket.recv(4096)
-                        if not chunk:
-                            break
+        Raises:
+            asyncio.TimeoutError: If the command runs past the timeout.
+        """
+        token = uuid.uuid4().hex
+        marker = self.SENTINEL_PREFIX + f"{token}:".encode()
+        await self._send(f"{command}\n{self._sentinel_command(token)}")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        buffer = self._pending
+        self._pending = bytearray()
+        while True:
+            data, finished = self._take_output(buffer, marker)
+            text = decoder.decode(data, final=finished).replace("\r\n", "\n")
+            if text:
+                yield text
+            if finished:
+                return
+            if deadline is None:
+                buffer += await self._recv()
+            else:
+                remaining = max(0.0, deadline - loop.time())
+                buffer += await asyncio.wait_for(self._recv(), remaining)
 
-                        buffer += chunk
-                        lines = buffer.split(b"\n")
+    async def _run(self, command: str) -> str:
+        """Runs a command and returns its whole output."""
+        return "".join([chunk async for chunk in self._stream(command)])
 
-                        buffer = lines[-1]
-                        lines = lines[:-1]
+    async def _interrupt(self) -> None:
+        """Interrupts the running command and discards its output."""
+        try:
+            await self._send("\x03")
+            await asyncio.wait_for(self._run("true"), timeout=2.0)
+        except Exception:
+            pass
 
-                        for line in lines:
-                            line = line.rstrip(b"\r")
+    async def execute_stream(
+        self, command: str, timeout: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """Executes a command and yields its output as it arrives.
 
-                            if not command_sent:
-                                command_sent = True
-                                continue
+        The socket is only read as fast as the chunks are consumed. Closing
+        the iterator before the command is done interrupts the command.
 
-                            if line.strip() == b"echo $?" or line.strip().isdigit():
-                                continue
+        Args:
+            command: Shell command to execute.
+            timeout: Maximum execution time in seconds.
 
-                            if line.strip():
-                                result_lines.append(line)
+        Yields:
+            Chunks of command output. The exit status is stored in
+            last_exit_code once the command is done.
 
-                        if buffer.endswith(b"$ "):
-                            break
+        Raises:
+            RuntimeError: If session not initialized.
+            TimeoutError: If command execution exceeds timeout.
+        """
+        if not self.socket:
+            raise RuntimeError("Session not initialized")
 
-                    except socket.error as e:
-                        if e.errno == socket.EWOULDBLOCK:
-                            await asyncio.sleep(0.1)
-                            continue
-                        raise
+        # Sanitize command to prevent shell injection
+        sanitized_command = self._sanitize_command(command)
 
-                output = b"\n".join(result_lines).decode("utf-8")
-                output = re.sub(r"\n\$ echo \$\$?.*$", "", output)
+        finished = False
+        try:
+            async for chunk in self._stream(sanitized_command, timeout):
+                yield chunk
+            finished = True
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Command execution timed out after {timeout} seconds")
+        finally:
+            # Stop the command so its output does not leak into the next one
+            if not finished:
+                await self._interrupt()
 
-                return output
+    async def execute(
+        self,
+        command: str,
+        timeout: Optional[int] = None,
+        max_output: Optional[int] = None,
+    ) -> str:
+        """Executes a command and returns cleaned output.
 
-            if timeout:
-                result = await asyncio.wait_for(read_output(), timeout)
-            else:
-                result = await read_output()
+        Args:
+            command: Shell command to execute.
+            timeout: Maximum execution time in seconds.
+            max_output: Characters of output to keep. Beyond it only the
+                beginning and the end of the output are returned.
 
-            return result.strip()
+        Returns:
+            Command output as string. The exit status is stored in
+            last_exit_code.
 
-        except asyncio.TimeoutError:
-            raise TimeoutError(f"Command execution timed out after {timeout} seconds")
+        Raises:
+            RuntimeError: If session not initialized or execution fails.
+            TimeoutError: If command execution exceeds timeout.
+        """
+        capture = OutputCapture(max_output)
+        try:
+            async for chunk in self.execute_stream(command, timeout):
+                capture.write(chunk)
+        except TimeoutError:
+            raise
         except Exception as e:
             raise RuntimeError(f"Failed to execute command: {e}")
+        return capture.getvalue().strip()
 
     def _sanitize_command(self, command: str) -> str:
         """Sanitizes the command string to prevent shell injection.
@@ -255,6 +382,7 @@ class AsyncDockerizedTerminal:
         working_dir: str = "/workspace",
         env_vars: Optional[Dict[str, str]] = None,
         default_timeout: int = 60,
+        max_output: Optional[int] = None,
     ) -> None:
         """Initializes an asynchronous terminal for Docker containers.
 
@@ -263,6 +391,8 @@ class AsyncDockerizedTerminal:
             working_dir: Working directory inside the container.
             env_vars: Environment variables to set.
             default_timeout: Default command execution timeout in seconds.
+            max_output: Characters of command output returned by
+                run_command, None for no limit.
         """
         self.client = docker.from_env()
         self.container = (
@@ -273,6 +403,7 @@ class AsyncDockerizedTerminal:
         self.working_dir = working_dir
         self.env_vars = env_vars or {}
         self.default_timeout = default_timeout
+        self.max_output = max_output
         self.session = None
 
     async def init(self) -> None:
@@ -329,7 +460,37 @@ class AsyncDockerizedTerminal:
         if not self.session:
             raise RuntimeError("Terminal not initialized")
 
-        return await self.session.execute(cmd, timeout=timeout or self.default_timeout)
+        return await self.session.execute(
+            cmd, timeout=timeout or self.default_timeout, max_output=self.max_output
+        )
+
+    async def run_command_stream(
+        self, cmd: str, timeout: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """Runs a command in the container, yielding output as it arrives.
+
+        Args:
+            cmd: Shell command to execute.
+            timeout: Maximum execution time in seconds.
+
+        Yields:
+            Chunks of command output.
+
+        Raises:
+            RuntimeError: If terminal not initialized.
+        """
+        if not self.session:
+            raise RuntimeError("Terminal not initialized")
+
+        async for chunk in self.session.execute_stream(
+            cmd, timeout=timeout or self.default_timeout
+        ):
+            yield chunk
+
+    @property
+    def last_exit_code(self) -> Optional[int]:
+        """Exit status of the last command run in the session."""
+        return self.session.last_exit_code if self.session else None
 
     async def close(self) -> None:
         """Closes the terminal session."""
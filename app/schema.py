@@ -1,7 +1,33 @@
+import uuid
+import weakref
+from collections import deque
 from enum import Enum
-from typing import Any, List, Literal, Optional, Union
-
-from pydantic import BaseModel, Field
+from itertools import chain, islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    PrivateAttr,
+    ValidationInfo,
+    field_serializer,
+    field_validator,
+    model_validator,
+)
+
+from app.image_store import image_store
 
 
 class Role(str, Enum):
@@ -51,15 +77,209 @@ class ToolCall(BaseModel):
     function: Function
 
 
+# Leading base64 characters of the image formats screenshots are sent as
+IMAGE_MIME_PREFIXES = {
+    "/9j/": "image/jpeg",
+    "iVBOR": "image/png",
+    "UklGR": "image/webp",
+    "R0lGOD": "image/gif",
+}
+
+# Text standing in for an image dropped by the image retention policy
+IMAGE_OMITTED_PLACEHOLDER = "[Image omitted: an older screenshot is no longer shown]"
+
+
+class FormattedMessage(dict):
+    """A message memoized in the OpenAI wire format, never mutated.
+
+    Unlike a plain dict it can be weakly referenced, so per-message results
+    such as token counts can be cached for as long as it exists.
+    """
+
+
+def format_message_dict(
+    message: dict, supports_images: bool = False, image_detail: Optional[str] = None
+) -> dict:
+    """Convert a message dict to the OpenAI wire format.
+
+    A ``base64_image`` is spliced into the content as an ``image_url`` part
+    when the model supports images and dropped otherwise. The input dict is
+    not mutated.
+
+    Args:
+        message: Message dict, as produced by ``Message.to_dict``
+        supports_images: Flag indicating if the target model supports image inputs
+        image_detail: None to send the image as is, "low" to request low
+            detail, or "drop" to replace it with a textual placeholder
+
+    Returns:
+        dict: The formatted message
+    """
+    if "base64_image" not in message:
+        return dict(message)
+
+    base64_image = message["base64_image"]
+    formatted = {key: value for key, value in message.items() if key != "base64_image"}
+    if supports_images and base64_image and image_detail == "drop":
+        content = message.get("content")
+        if isinstance(content, list):
+            formatted["content"] = content + [
+                {"type": "text", "text": IMAGE_OMITTED_PLACEHOLDER}
+            ]
+        else:
+            formatted["content"] = "\n".join(
+                filter(None, [content, IMAGE_OMITTED_PLACEHOLDER])
+            )
+    elif supports_images and base64_image:
+        content = message.get("content")
+        if not content:
+            content = []
+        elif isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        else:
+            # Convert string items to proper text objects
+            content = [
+                {"type": "text", "text": item} if isinstance(item, str) else item
+                for item in content
+            ]
+        formatted["content"] = content + [image_url_part(base64_image, image_detail)]
+    return formatted
+
+
+def image_url_part(base64_image: str, image_detail: Optional[str] = None) -> dict:
+    """Build the ``image_url`` content part for a base64 encoded image"""
+    mime_type = next(
+        (
+            mime
+            for prefix, mime in IMAGE_MIME_PREFIXES.items()
+            if base64_image.startswith(prefix)
+        ),
+        "image/jpeg",
+    )
+    image_url = {"url": f"data:{mime_type};base64,{base64_image}"}
+    if image_detail:
+        image_url["detail"] = image_detail
+    return {"type": "image_url", "image_url": image_url}
+
+
+class _ImageHold:
+    """A message's reference on a stored image, released with the message.
+
+    Copies start empty, so a copied message takes its own reference.
+    """
+
+    __slots__ = ("_finalizer",)
+
+    def __init__(self):
+        self._finalizer: Optional[weakref.finalize] = None
+
+    def set(self, owner: Any, image_id: Optional[str]) -> None:
+        """Reference ``image_id`` for the lifetime of ``owner``, releasing the
+        previously referenced image"""
+        previous = self._finalizer
+        self._finalizer = None
+        if image_id:
+            image_store.acquire(image_id)
+            self._finalizer = weakref.finalize(owner, image_store.release, image_id)
+        if previous:
+            previous()
+
+    def __copy__(self) -> "_ImageHold":
+        return _ImageHold()
+
+    def __deepcopy__(self, memo: dict) -> "_ImageHold":
+        return _ImageHold()
+
+
 class Message(BaseModel):
-    """Represents a chat message in the conversation"""
+    """Represents a chat message in the conversation.
+
+    An image passed as ``base64_image`` is kept in the content-addressed
+    image store and the message holds only its digest in ``image_id``.
+    Reading ``base64_image`` fetches it back from the store.
+    """
 
     role: ROLE_TYPE = Field(...)  # type: ignore
     content: Optional[str] = Field(default=None)
     tool_calls: Optional[List[ToolCall]] = Field(default=None)
     name: Optional[str] = Field(default=None)
     tool_call_id: Optional[str] = Field(default=None)
-    base64_image: Optional[str] = Field(default=None)
+    image_id: Optional[str] = Field(default=None)
+
+    # Wire-format dicts keyed by (supports_images, image_detail), dropped on
+    # field assignment. The image part is left out and added on each call, so
+    # the memo does not keep a second copy of the image as a data URL
+    _formatted: Dict[tuple, dict] = PrivateAttr(default_factory=dict)
+    _image_hold: _ImageHold = PrivateAttr(default_factory=_ImageHold)
+
+    @model_validator(mode="wrap")
+    @classmethod
+    def _store_image(cls, data: Any, handler: Callable) -> Any:
+        """Move an inline base64 image into the image store"""
+        if not isinstance(data, dict) or "base64_image" not in data:
+            return handler(data)
+        data = dict(data)
+        base64_image = data.pop("base64_image")
+        if not base64_image:
+            return handler(data)
+        # The store's reference keeps the image until the message holds its own
+        data["image_id"] = image_store.put(base64_image)
+        try:
+            return handler(data)
+        finally:
+            image_store.release(data["image_id"])
+
+    def model_post_init(self, __context: Any) -> None:
+        self._image_hold.set(self, self.image_id)
+
+    @property
+    def base64_image(self) -> Optional[str]:
+        """The message image as a base64 string"""
+        return image_store.get(self.image_id) if self.image_id else None
+
+    @base64_image.setter
+    def base64_image(self, value: Optional[str]) -> None:
+        if not value:
+            self.image_id = None
+            return
+        image_id = image_store.put(value)
+        try:
+            self.image_id = image_id
+        finally:
+            image_store.release(image_id)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name == "image_id":
+            self._image_hold.set(self, value)
+        if name in type(self).model_fields:
+            self._formatted = {}
+
+    def __copy__(self) -> "Message":
+        copied = super().__copy__()
+        copied._adopt()
+        return copied
+
+    def __deepcopy__(self, memo: Optional[dict] = None) -> "Message":
+        copied = super().__deepcopy__(memo)
+        copied._adopt()
+        return copied
+
+    def model_copy(
+        self, *, update: Optional[dict] = None, deep: bool = False
+    ) -> "Message":
+        # ``update`` bypasses __setattr__, so a copy may hold a new image
+        copied = super().model_copy(update=update, deep=deep)
+        if update:
+            copied._formatted = {}
+            copied._image_hold.set(copied, copied.image_id)
+        return copied
+
+    def _adopt(self) -> None:
+        """Reset the private state a copy shares with its original"""
+        self._formatted = {}
+        self._image_hold = _ImageHold()
+        self._image_hold.set(self, self.image_id)
 
     def __add__(self, other) -> List["Message"]:
         """支持 Message + list 或 Message + Message 的操作"""
@@ -92,10 +312,48 @@ class Message(BaseModel):
             message["name"] = self.name
         if self.tool_call_id is not None:
             message["tool_call_id"] = self.tool_call_id
-        if self.base64_image is not None:
-            message["base64_image"] = self.base64_image
+        base64_image = self.base64_image
+        if base64_image is not None:
+            message["base64_image"] = base64_image
         return message
 
+    def to_formatted_dict(
+        self, supports_images: bool = False, image_detail: Optional[str] = None
+    ) -> dict:
+        """Get the message in the OpenAI wire format, memoized per message.
+
+        Messages are not changed once added to memory, so the formatted dict
+        is built once and reused on every step. The returned dict is shared
+        and must not be mutated; it is rebuilt after a field is reassigned.
+        An image is spliced in as a data URL on each call rather than kept in
+        the memo.
+        """
+        key = (supports_images, image_detail)
+        base64_image = None
+        if supports_images and self.image_id and image_detail != "drop":
+            base64_image = self.base64_image
+        formatted = self._formatted.get(key)
+        if formatted is None:
+            formatted = FormattedMessage(
+                format_message_dict(self.to_dict(), supports_images, image_detail)
+            )
+            if self.image_id:
+                if base64_image:
+                    formatted["content"] = formatted["content"][:-1]
+                # Images only age from full to low detail to dropped, keep
+                # just the current variant rather than a copy of each
+                self._formatted = {
+                    k: v for k, v in self._formatted.items() if k[0] != supports_images
+                }
+            self._formatted[key] = formatted
+        if base64_image:
+            return {
+                **formatted,
+                "content": formatted["content"]
+                + [image_url_part(base64_image, image_detail)],
+            }
+        return formatted
+
     @classmethod
     def user_message(
         cls, content: str, base64_image: Optional[str] = None
@@ -156,23 +414,234 @@ class Message(BaseModel):
         )
 
 
+# Content prefix of the message holding a summary of compacted history
+CONTEXT_SUMMARY_PREFIX = "[Summary of earlier progress]"
+
+
+class MessageBuffer(Sequence):
+    """Ring-buffer store for conversation messages.
+
+    New messages are appended to a deque and the oldest ones are dropped from
+    its left end, both O(1). The leading anchor messages can be pinned so
+    they survive trimming without reslicing the history. Supports len(),
+    iteration, reversed(), indexing and slicing (slices return lists).
+    """
+
+    # The MemoryStore persisting the messages, None for in-process buffers
+    store: Any = None
+
+    def __init__(self, messages: Iterable[Message] = ()):
+        self._pinned: List[Message] = []
+        self._items: deque = deque(messages)
+
+    def __len__(self) -> int:
+        return len(self._pinned) + len(self._items)
+
+    def __iter__(self) -> Iterator[Message]:
+        return chain(self._pinned, self._items)
+
+    def __reversed__(self) -> Iterator[Message]:
+        return chain(reversed(self._items), reversed(self._pinned))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1 and stop == len(self):
+                # Tail slices such as [-n:] are the common case
+                return self.recent(stop - start)
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+        if index < len(self._pinned):
+            return self._pinned[index]
+        return self._items[index - len(self._pinned)]
+
+    def __repr__(self) -> str:
+        return f"MessageBuffer({list(self)!r})"
+
+    def append(self, message: Message) -> None:
+        self._items.append(message)
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        self._items.extend(messages)
+
+    def clear(self) -> None:
+        self._pinned.clear()
+        self._items.clear()
+
+    def recent(self, n: int) -> List[Message]:
+        """Get the n most recent messages, oldest first"""
+        if n <= 0:
+            return []
+        return list(islice(reversed(self), n))[::-1]
+
+    def snapshot(self) -> List[Message]:
+        """Shallow copy of the messages, safe to use while the buffer changes"""
+        return list(self)
+
+    def pin(self, count: int) -> None:
+        """Protect the first count messages from popleft()"""
+        while len(self._pinned) < count and self._items:
+            self._pinned.append(self._items.popleft())
+        while len(self._pinned) > count:
+            self._items.appendleft(self._pinned.pop())
+
+    def oldest(self) -> Optional[Message]:
+        """The oldest message that is not pinned"""
+        return self._items[0] if self._items else None
+
+    def popleft(self) -> Message:
+        """Remove and return the oldest message that is not pinned"""
+        return self._items.popleft()
+
+    def replace_oldest(self, count: int, messages: List[Message]) -> None:
+        """Replace the count oldest messages that are not pinned, e.g. with a
+        summary of them. At most count messages can be put in their place."""
+        count = min(count, len(self._items))
+        if len(messages) > count:
+            raise ValueError("Cannot put more messages in place than are replaced")
+        for _ in range(count):
+            self._items.popleft()
+        self._items.extendleft(reversed(messages))
+
+
 class Memory(BaseModel):
-    messages: List[Message] = Field(default_factory=list)
+    """Conversation history of an agent.
+
+    With a ``store`` (see ``app.memory_store``), messages are written through
+    to it as they are added and only the latest ``hot_messages`` are kept in
+    RAM. A memory created with the ``session_id`` of a stored session resumes
+    it, possibly in another process.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True, validate_assignment=True)
+
+    # Declared before messages so that their validator can see them
+    store: Optional[Any] = Field(default=None, exclude=True)
+    session_id: Optional[str] = Field(default=None)
+    hot_messages: int = Field(default=20)
+    messages: MessageBuffer = Field(default_factory=MessageBuffer)
     max_messages: int = Field(default=100)
 
+    @field_validator("messages", mode="before")
+    @classmethod
+    def _to_buffer(cls, value: Any, info: ValidationInfo) -> MessageBuffer:
+        """Accept plain message lists, e.g. when assigning a new history"""
+        store = info.data.get("store")
+        if isinstance(value, MessageBuffer) and value.store is store:
+            return value
+        messages = [
+            Message.model_validate(m) if isinstance(m, dict) else m for m in value
+        ]
+        if store is None:
+            return MessageBuffer(messages)
+        # Assigning a history to a persistent memory replaces the stored one
+        return store.open_buffer(
+            info.data.get("session_id") or uuid.uuid4().hex,
+            messages,
+            info.data.get("hot_messages", 20),
+        )
+
+    @field_serializer("messages")
+    def _serialize_messages(self, messages: MessageBuffer) -> List[dict]:
+        """Dump the buffer as message dicts, which _to_buffer reads back"""
+        return [message.to_dict() for message in messages]
+
+    @model_validator(mode="after")
+    def _open_session(self) -> "Memory":
+        """Attach the buffer to the store, resuming a stored session"""
+        if self.store is None:
+            return self
+        if self.messages.store is not self.store:
+            # An empty memory resumes the session, existing messages replace it
+            messages = self.messages.snapshot() if len(self.messages) else None
+            self.__dict__["messages"] = self.store.open_buffer(
+                self.session_id or uuid.uuid4().hex, messages, self.hot_messages
+            )
+        elif self.session_id and self.session_id != self.messages.session_id:
+            # Switched to another session
+            self.__dict__["messages"] = self.store.open_buffer(
+                self.session_id, None, self.hot_messages
+            )
+        # The buffer may have created the session
+        self.__dict__["session_id"] = self.messages.session_id
+        return self
+
     def add_message(self, message: Message) -> None:
         """Add a message to memory"""
         self.messages.append(message)
-        # Optional: Implement message limit
-        if len(self.messages) > self.max_messages:
-            self.messages = self.messages[-self.max_messages :]
+        self._trim()
 
     def add_messages(self, messages: List[Message]) -> None:
         """Add multiple messages to memory"""
         self.messages.extend(messages)
-        # Optional: Implement message limit
-        if len(self.messages) > self.max_messages:
-            self.messages = self.messages[-self.max_messages :]
+        self._trim()
+
+    def anchor_count(self) -> int:
+        """Number of leading messages that are never trimmed.
+
+        These are the system messages and the original user request, followed
+        by the summary of compacted history if there is one.
+        """
+        count = 0
+        while count < len(self.messages) and self.messages[count].role == Role.SYSTEM:
+            count += 1
+        if count < len(self.messages) and self.messages[count].role == Role.USER:
+            count += 1
+        if count < len(self.messages) and (
+            self.messages[count].content or ""
+        ).startswith(CONTEXT_SUMMARY_PREFIX):
+            count += 1
+        return count
+
+    def _trim(self) -> None:
+        """Drop the oldest messages beyond max_messages.
+
+        Anchor messages are kept, and tool results are never kept without the
+        assistant message that requested them. Each dropped message costs O(1).
+        """
+        excess = len(self.messages) - self.max_messages
+        if excess <= 0:
+            return
+        self.messages.pin(self.anchor_count())
+        for _ in range(excess):
+            if self.messages.oldest() is None:
+                return
+            self.messages.popleft()
+        while (oldest := self.messages.oldest()) and oldest.role == Role.TOOL:
+            self.messages.popleft()
+
+    def recent(self, n: int) -> List[Message]:
+        """Get the n most recent messages, oldest first"""
+        return self.messages.recent(n)
+
+    def context(self) -> List[Message]:
+        """Messages to send with the next LLM request.
+
+        In-process memories send all messages. Persistent memories send the
+        anchor messages followed by at most ``hot_messages`` latest ones, so
+        a step reads nothing back from the store. ContextManager summarizes
+        older steps before they fall out of this window; like trimmed
+        messages, steps it cannot summarize are left out.
+        """
+        if self.store is None:
+            return self.snapshot()
+        anchor_count = self.anchor_count()
+        self.messages.pin(anchor_count)
+        window = self.messages.recent(
+            min(self.hot_messages, len(self.messages) - anchor_count)
+        )
+        # A tool result is never sent without the assistant message calling it
+        start = 0
+        while start < len(window) and window[start].role == Role.TOOL:
+            start += 1
+        return [self.messages[i] for i in range(anchor_count)] + window[start:]
+
+    def snapshot(self) -> List[Message]:
+        """Shallow copy of the messages, e.g. for formatting an LLM request"""
+        return self.messages.snapshot()
 
     def clear(self) -> None:
         """Clear all messages"""
@@ -180,7 +649,7 @@ class Memory(BaseModel):
 
     def get_recent_messages(self, n: int) -> List[Message]:
         """Get n most recent messages"""
-        return self.messages[-n:]
+        return self.recent(n)
 
     def to_dict_list(self) -> List[dict]:
         """Convert messages to list of dicts"""
@@ -1,13 +1,24 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
 
 from pydantic import BaseModel, Field
 
 
+# Receives progressive output of the running tool call. Set by the agent
+# around each call, so concurrent calls each report to their own sink.
+tool_output_sink: ContextVar[Optional[Callable[[str], Awaitable[None]]]] = ContextVar(
+    "tool_output_sink", default=None
+)
+
+
 class BaseTool(ABC, BaseModel):
     name: str
     description: str
     parameters: Optional[dict] = None
+    # Whether calls to this tool may run concurrently with other parallel-safe
+    # calls. Tools holding exclusive state (browser, shell session) keep False.
+    parallel_safe: bool = False
 
     class Config:
         arbitrary_types_allowed = True
@@ -20,6 +31,12 @@ class BaseTool(ABC, BaseModel):
     async def execute(self, **kwargs) -> Any:
         """Execute the tool with given parameters."""
 
+    async def emit_output(self, chunk: str) -> None:
+        """Report a chunk of output while the call is still running"""
+        sink = tool_output_sink.get()
+        if sink is not None:
+            await sink(chunk)
+
     def to_param(self) -> Dict:
         """Convert tool to function call format."""
         return {
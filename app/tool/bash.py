@@ -1,8 +1,11 @@
 import asyncio
+import codecs
 import os
-from typing import Optional
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
 
 from app.exceptions import ToolError
+from app.output_capture import OutputCapture
 from app.tool.base import BaseTool, CLIResult
 
 
@@ -20,13 +23,20 @@ class _BashSession:
     _process: asyncio.subprocess.Process
 
     command: str = "/bin/bash"
-    _output_delay: float = 0.2  # seconds
     _timeout: float = 120.0  # seconds
-    _sentinel: str = "<<exit>>"
+    _read_size: int = 65536  # bytes
+    _max_output: int = 100000  # characters, the start and end are kept
+    # start of the line printed after each command, completed by a token
+    # unique to the command so that no output can end it early
+    _sentinel: str = "__OPENMANUS_DONE_"
 
     def __init__(self):
         self._started = False
         self._timed_out = False
+        # exit status of the last command
+        self.exit_code: Optional[int] = None
+        # output of each pipe received after the sentinel of the last command
+        self._pending: Dict[asyncio.StreamReader, bytearray] = {}
 
     async def start(self):
         if self._started:
@@ -52,8 +62,17 @@ class _BashSession:
             return
         self._process.terminate()
 
-    async def run(self, command: str):
-        """Execute a command in the bash shell."""
+    async def run(
+        self,
+        command: str,
+        on_output: Optional[Callable[[str], Awaitable[None]]] = None,
+    ):
+        """Execute a command in the bash shell.
+
+        Args:
+            command: The command to run
+            on_output: Optional coroutine receiving stdout chunks as they arrive
+        """
         if not self._started:
             raise ToolError("Session has not started.")
         if self._process.returncode is not None:
@@ -66,51 +85,112 @@ class _BashSession:
                 f"timed out: bash has not returned in {self._timeout} seconds and must be restarted",
             )
 
-        # we know these are not None because we created the process with PIPEs
-        assert self._process.stdin
-        assert self._process.stdout
-        assert self._process.stderr
-
-        # send command to the process
-        self._process.stdin.write(
-            command.encode() + f"; echo '{self._sentinel}'\n".encode()
-        )
-        await self._process.stdin.drain()
-
-        # read output from the process, until the sentinel is found
+        output = OutputCapture(self._max_output)
+        error = OutputCapture(self._max_output)
         try:
             async with asyncio.timeout(self._timeout):
-                while True:
-                    await asyncio.sleep(self._output_delay)
-                    # if we read directly from stdout/stderr, it will wait forever for
-                    # EOF. use the StreamReader buffer directly instead.
-                    output = (
-                        self._process.stdout._buffer.decode()
-                    )  # pyright: ignore[reportAttributeAccessIssue]
-                    if self._sentinel in output:
-                        # strip the sentinel and break
-                        output = output[: output.index(self._sentinel)]
-                        break
+                async for chunk in self.stream(command, errors=error):
+                    output.write(chunk)
+                    if on_output:
+                        await on_output(chunk)
         except asyncio.TimeoutError:
             self._timed_out = True
             raise ToolError(
                 f"timed out: bash has not returned in {self._timeout} seconds and must be restarted",
             ) from None
 
-        if output.endswith("\n"):
-            output = output[:-1]
+        return CLIResult(
+            output=output.getvalue().removesuffix("\n"),
+            error=error.getvalue().removesuffix("\n"),
+        )
+
+    async def stream(
+        self, command: str, errors: Optional[OutputCapture] = None
+    ) -> AsyncIterator[str]:
+        """Send a command to the shell and yield its stdout as it arrives.
+
+        The pipe is only read as fast as the chunks are consumed, so a slow
+        consumer holds back the command instead of buffering its output.
+        stderr is drained concurrently, into ``errors`` when given, so a
+        command writing a lot of errors never blocks on a full pipe. The
+        exit status is stored in ``exit_code`` once the command is done.
+        """
+        # we know these are not None because we created the process with PIPEs
+        assert self._process.stdin
+        assert self._process.stdout
+        assert self._process.stderr
 
-        error = (
-            self._process.stderr._buffer.decode()
-        )  # pyright: ignore[reportAttributeAccessIssue]
-        if error.endswith("\n"):
-            error = error[:-1]
+        marker = f"{self._sentinel}{uuid.uuid4().hex}:"
 
-        # clear the buffers so that the next output can be read correctly
-        self._process.stdout._buffer.clear()  # pyright: ignore[reportAttributeAccessIssue]
-        self._process.stderr._buffer.clear()  # pyright: ignore[reportAttributeAccessIssue]
+        async def drain_stderr():
+            async for chunk in self._read_until_sentinel(self._process.stderr, marker):
+                if errors is not None:
+                    errors.write(chunk)
+
+        self.exit_code = None
+        stderr_task = asyncio.create_task(drain_stderr())
+        try:
+            # the sentinels go on their own lines, so they also follow
+            # commands ending in "&" or a comment
+            self._process.stdin.write(
+                f"{command}\n"
+                f"printf '\\n{marker}%d\\n' \"$?\"; "
+                f"printf '\\n{marker}\\n' >&2\n".encode()
+            )
+            await self._process.stdin.drain()
+
+            async for chunk in self._read_until_sentinel(self._process.stdout, marker):
+                yield chunk
+            await stderr_task
+        finally:
+            stderr_task.cancel()
+
+    async def _read_until_sentinel(
+        self, reader: asyncio.StreamReader, marker: str
+    ) -> AsyncIterator[str]:
+        """Yield the output of a pipe up to the command's sentinel line.
+
+        The sentinel only counts at the start of a line. Each read returns
+        as soon as data is available, and UTF-8 sequences split across
+        reads are decoded once complete. An exit status following the
+        sentinel is stored in ``exit_code``. Whatever was read past the
+        sentinel line, e.g. output of a background job, is kept for the next
+        command.
+        """
+        # the sentinel is printed after a newline, which is not output
+        sentinel = b"\n" + marker.encode()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        buffer = self._pending.pop(reader, bytearray())
+        while True:
+            index = buffer.find(sentinel)
+            end = buffer.find(b"\n", index + len(sentinel)) if index != -1 else -1
+            if end != -1:
+                status = bytes(buffer[index + len(sentinel) : end])
+                if status.isdigit():
+                    self.exit_code = int(status)
+                self._pending[reader] = buffer[end + 1 :]
+                text = decoder.decode(bytes(buffer[:index]), final=True)
+                if text:
+                    yield text
+                return
+
+            # hold back what may be the start of the sentinel line
+            ready = index
+            if index == -1:
+                ready = len(buffer)
+                for size in range(min(len(sentinel) - 1, len(buffer)), 0, -1):
+                    if buffer.endswith(sentinel[:size]):
+                        ready -= size
+                        break
+            text = decoder.decode(bytes(buffer[:ready]))
+            del buffer[:ready]
+            if text:
+                yield text
 
-        return CLIResult(output=output, error=error)
+            chunk = await reader.read(self._read_size)
+            if not chunk:
+                raise ToolError("bash has exited and must be restarted")
+            buffer += chunk
 
 
 class Bash(BaseTool):
@@ -147,7 +227,7 @@ class Bash(BaseTool):
             await self._session.start()
 
         if command is not None:
-            return await self._session.run(command)
+            return await self._session.run(command, on_output=self.emit_output)
 
         raise ToolError("no command provided.")
 
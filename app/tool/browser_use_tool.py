@@ -1,5 +1,6 @@
 import asyncio
 import base64
+import io
 import json
 from typing import Generic, Optional, TypeVar
 
@@ -7,11 +8,12 @@ from browser_use import Browser as BrowserUseBrowser
 from browser_use import BrowserConfig
 from browser_use.browser.context import BrowserContext, BrowserContextConfig
 from browser_use.dom.service import DomService
+from PIL import Image
 from pydantic import Field, field_validator
 from pydantic_core.core_schema import ValidationInfo
 
-from app.config import config
-from app.llm import LLM
+from app.config import BrowserSettings, config
+from app.llm import LLM, TokenCounter
 from app.tool.base import BaseTool, ToolResult
 from app.tool.web_search import WebSearch
 
@@ -33,9 +35,40 @@ Key capabilities include:
 Note: When using element indices, refer to the numbered elements shown in the current browser state.
 """
 
+# Hashes the DOM in the page, so only the digest crosses the CDP connection
+_DOM_HASH_SCRIPT = """() => {
+    const html = document.documentElement ? document.documentElement.outerHTML : "";
+    let hash = 0;
+    for (let i = 0; i < html.length; i++) {
+        hash = (hash * 31 + html.charCodeAt(i)) | 0;
+    }
+    return [location.href, html.length, hash, window.scrollX, window.scrollY,
+            window.innerWidth, window.innerHeight].join(":");
+}"""
+
 Context = TypeVar("Context")
 
 
+def encode_screenshot(
+    data: bytes, image_format: str = "jpeg", quality: int = 80, resize: bool = True
+) -> bytes:
+    """Re-encode a PNG screenshot in the given format and quality.
+
+    With ``resize``, the image is downscaled to the size the model scales
+    high detail images to before splitting them into 512px tiles, so no
+    pixels are sent that the model would discard. Images are never upscaled.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGB")
+        if resize:
+            width, height = TokenCounter.high_detail_size(*image.size)
+            if width < image.width:
+                image = image.resize((width, height), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format=image_format.upper(), quality=quality)
+        return output.getvalue()
+
+
 class BrowserUseTool(BaseTool, Generic[Context]):
     name: str = "browser_use"
     description: str = _BROWSER_DESCRIPTION
@@ -132,6 +165,9 @@ class BrowserUseTool(BaseTool, Generic[Context]):
 
     llm: Optional[LLM] = Field(default_factory=LLM)
 
+    # DOM hash of the page when the last screenshot was taken
+    last_dom_hash: Optional[str] = Field(default=None, exclude=True)
+
     @field_validator("parameters", mode="before")
     def validate_parameters(cls, v: dict, info: ValidationInfo) -> dict:
         if not v:
@@ -504,11 +540,17 @@ Page content:
             await page.bring_to_front()
             await page.wait_for_load_state()
 
-            screenshot = await page.screenshot(
-                full_page=True, animations="disabled", type="jpeg", quality=100
+            settings = config.browser_config or BrowserSettings()
+            screenshot = None
+            dom_hash = await self._get_dom_hash(page)
+            unchanged = (
+                settings.screenshot_skip_unchanged
+                and dom_hash is not None
+                and dom_hash == self.last_dom_hash
             )
-
-            screenshot = base64.b64encode(screenshot).decode("utf-8")
+            if not unchanged:
+                screenshot = await self._capture_screenshot(page, settings)
+                self.last_dom_hash = dom_hash
 
             # Build the state info with all required fields
             state_info = {
@@ -530,6 +572,8 @@ Page content:
                 },
                 "viewport_height": viewport_height,
             }
+            if unchanged:
+                state_info["screenshot"] = "Page unchanged since the last screenshot"
 
             return ToolResult(
                 output=json.dumps(state_info, indent=4, ensure_ascii=False),
@@ -538,6 +582,48 @@ Page content:
         except Exception as e:
             return ToolResult(error=f"Failed to get browser state: {str(e)}")
 
+    @staticmethod
+    async def _get_dom_hash(page) -> Optional[str]:
+        """Hash of the page DOM, URL, scroll position and viewport"""
+        try:
+            return await page.evaluate(_DOM_HASH_SCRIPT)
+        except Exception:
+            # Pages mid-navigation cannot be evaluated, always capture them
+            return None
+
+    @staticmethod
+    async def _capture_screenshot(page, settings: BrowserSettings) -> str:
+        """Capture a screenshot of the page as configured, base64 encoded"""
+        viewport = page.viewport_size
+        needs_resize = settings.screenshot_resize and (
+            settings.screenshot_full_page
+            or not viewport
+            or TokenCounter.high_detail_size(viewport["width"], viewport["height"])[0]
+            < viewport["width"]
+        )
+        if settings.screenshot_format == "jpeg" and not needs_resize:
+            # The browser encodes the final image directly
+            screenshot = await page.screenshot(
+                full_page=settings.screenshot_full_page,
+                animations="disabled",
+                type="jpeg",
+                quality=settings.screenshot_quality,
+            )
+        else:
+            screenshot = await page.screenshot(
+                full_page=settings.screenshot_full_page,
+                animations="disabled",
+                type="png",
+            )
+            screenshot = await asyncio.to_thread(
+                encode_screenshot,
+                screenshot,
+                settings.screenshot_format,
+                settings.screenshot_quality,
+                needs_resize,
+            )
+        return base64.b64encode(screenshot).decode("utf-8")
+
     async def cleanup(self):
         """Clean up browser resources."""
         async with self.lock:
@@ -545,6 +631,7 @@ Page content:
                 await self.context.close()
                 self.context = None
                 self.dom_service = None
+                self.last_dom_hash = None
             if self.browser is not None:
                 await self.browser.close()
                 self.browser = None
@@ -47,8 +47,14 @@ class MCPClients(ToolCollection):
         super().__init__()  # Initialize with empty tools list
         self.name = "mcp"  # Keep name for backward compatibility
 
-    async def connect_sse(self, server_url: str, server_id: str = "") -> None:
-        """Connect to an MCP server using SSE transport."""
+    async def connect_sse(
+        self, server_url: str, server_id: str = "", parallel_safe: bool = False
+    ) -> None:
+        """Connect to an MCP server using SSE transport.
+
+        Tools of servers marked parallel_safe may run concurrently with other
+        tool calls; the server must not rely on calls running in order.
+        """
         if not server_url:
             raise ValueError("Server URL is required.")
 
@@ -66,12 +72,19 @@ class MCPClients(ToolCollection):
         session = await exit_stack.enter_async_context(ClientSession(*streams))
         self.sessions[server_id] = session
 
-        await self._initialize_and_list_tools(server_id)
+        await self._initialize_and_list_tools(server_id, parallel_safe)
 
     async def connect_stdio(
-        self, command: str, args: List[str], server_id: str = ""
+        self,
+        command: str,
+        args: List[str],
+        server_id: str = "",
+        parallel_safe: bool = False,
     ) -> None:
-        """Connect to an MCP server using stdio transport."""
+        """Connect to an MCP server using stdio transport.
+
+        See connect_sse for parallel_safe.
+        """
         if not command:
             raise ValueError("Server command is required.")
 
@@ -92,9 +105,11 @@ class MCPClients(ToolCollection):
         session = await exit_stack.enter_async_context(ClientSession(read, write))
         self.sessions[server_id] = session
 
-        await self._initialize_and_list_tools(server_id)
+        await self._initialize_and_list_tools(server_id, parallel_safe)
 
-    async def _initialize_and_list_tools(self, server_id: str) -> None:
+    async def _initialize_and_list_tools(
+        self, server_id: str, parallel_safe: bool = False
+    ) -> None:
         """Initialize session and populate tool map."""
         session = self.sessions.get(server_id)
         if not session:
@@ -116,6 +131,7 @@ class MCPClients(ToolCollection):
                 session=session,
                 server_id=server_id,
                 original_name=original_name,
+                parallel_safe=parallel_safe,
             )
             self.tool_map[tool_name] = server_tool
 
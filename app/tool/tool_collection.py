@@ -1,11 +1,28 @@
 """Collection classes for managing multiple tools."""
-from typing import Any, Dict, List
+from itertools import count
+from typing import Any, Dict, List, Optional, Tuple
 
 from app.exceptions import ToolError
 from app.logger import logger
 from app.tool.base import BaseTool, ToolFailure, ToolResult
 
 
+# Source of ToolCollection versions, unique across collections
+_versions = count(1)
+
+
+class ToolParams(list):
+    """Tool schemas of a ToolCollection, tagged with the collection version.
+
+    The same version always has the same schemas, so token counts and other
+    per-schema work can be cached by version.
+    """
+
+    def __init__(self, version: int, params: List[Dict[str, Any]]):
+        super().__init__(params)
+        self.version = version
+
+
 class ToolCollection:
     """A collection of defined tools."""
 
@@ -15,12 +32,32 @@ class ToolCollection:
     def __init__(self, *tools: BaseTool):
         self.tools = tools
         self.tool_map = {tool.name: tool for tool in tools}
+        self._params: Optional[ToolParams] = None
+
+    @property
+    def tools(self) -> Tuple[BaseTool, ...]:
+        return self._tools
+
+    @tools.setter
+    def tools(self, tools: Tuple[BaseTool, ...]) -> None:
+        # Every add/remove rebinds the tuple, which starts a new version
+        self._tools = tools
+        self.version = next(_versions)
 
     def __iter__(self):
         return iter(self.tools)
 
-    def to_params(self) -> List[Dict[str, Any]]:
-        return [tool.to_param() for tool in self.tools]
+    def to_params(self) -> ToolParams:
+        """Convert all tools to function call format.
+
+        The result is reused until the tools change, so repeated steps send
+        the same schema list.
+        """
+        if self._params is None or self._params.version != self.version:
+            self._params = ToolParams(
+                self.version, [tool.to_param() for tool in self.tools]
+            )
+        return self._params
 
     async def execute(
         self, *, name: str, tool_input: Dict[str, Any] = None
@@ -0,0 +1,82 @@
+"""Tests for uploading generated archives through the Docker SDK.
+
+A local HTTP server stands in for the Docker daemon, so these tests run
+without Docker.
+"""
+
+import io
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import docker
+import pytest
+
+from app.sandbox.core.sandbox import DockerSandbox, _ChunkReader
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """Accepts PUT /containers/<id>/archive and records the request."""
+
+    def do_PUT(self):
+        body = bytearray()
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            while size := int(self.rfile.readline().split(b";")[0], 16):
+                body += self.rfile.read(size)
+                self.rfile.readline()
+            self.rfile.readline()
+        else:
+            body += self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append((self.path, dict(self.headers), bytes(body)))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def daemon():
+    """Runs the stand-in daemon and yields a container bound to it."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = docker.DockerClient(
+        base_url=f"tcp://127.0.0.1:{server.server_port}", version="1.41"
+    )
+    try:
+        yield server, client.containers.prepare_model({"Id": "sandbox"})
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_put_archive_streams_generated_archive(daemon, tmp_path):
+    """Tests that a generated archive is uploaded as a chunked stream."""
+    server, container = daemon
+    src = tmp_path / "src"
+    (src / "nested").mkdir(parents=True)
+    (src / "empty").mkdir()
+    (src / "a.txt").write_text("first")
+    (src / "nested" / "b.bin").write_bytes(bytes(range(256)) * 8192)
+    (src / "link").symlink_to("nested")
+
+    entries = list(DockerSandbox._walk_files(str(src), "copied"))
+    container.put_archive("/workspace", _ChunkReader(DockerSandbox._iter_tar(entries)))
+
+    path, headers, body = server.requests[0]
+    assert path.startswith("/v1.41/containers/sandbox/archive?path=")
+    assert headers["Transfer-Encoding"] == "chunked"
+    with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+        members = {member.name: member for member in tar}
+        assert tar.extractfile(members["copied/a.txt"]).read() == b"first"
+        assert (
+            tar.extractfile(members["copied/nested/b.bin"]).read()
+            == (src / "nested" / "b.bin").read_bytes()
+        )
+    assert members["copied/empty"].isdir()
+    assert members["copied/link"].issym()
+    assert members["copied/link"].linkname == "nested"
@@ -81,6 +81,50 @@ class TestAsyncDockerizedTerminal:
         assert "First" in cmd1
         assert "Second" in cmd2
 
+    @pytest.mark.asyncio
+    async def test_exit_code(self, terminal):
+        """Test exit status tracking of commands."""
+        await terminal.run_command("true")
+        assert terminal.last_exit_code == 0
+        result = await terminal.run_command("echo failed; false")
+        assert result == "failed"
+        assert terminal.last_exit_code == 1
+
+    @pytest.mark.asyncio
+    async def test_large_output(self, terminal):
+        """Test output spanning many socket reads."""
+        result = await terminal.run_command("seq 1 100000")
+        lines = result.splitlines()
+        assert len(lines) == 100000
+        assert lines[-1] == "100000"
+
+    @pytest.mark.asyncio
+    async def test_stream_output(self, terminal):
+        """Test output arriving in chunks while the command runs."""
+        chunks = [
+            chunk
+            async for chunk in terminal.run_command_stream(
+                "for i in 1 2 3; do echo $i; sleep 0.2; done"
+            )
+        ]
+        assert len(chunks) > 1
+        assert "".join(chunks).split() == ["1", "2", "3"]
+        assert terminal.last_exit_code == 0
+
+    @pytest.mark.asyncio
+    async def test_output_limit(self, docker_container):
+        """Test that only the start and end of long output are kept."""
+        terminal = AsyncDockerizedTerminal(docker_container, max_output=1000)
+        await terminal.init()
+        try:
+            result = await terminal.run_command("seq 1 100000")
+            assert result.startswith("1\n2\n")
+            assert result.endswith("99999\n100000")
+            assert "characters omitted" in result
+            assert len(result) < 1100
+        finally:
+            await terminal.close()
+
     @pytest.mark.asyncio
     async def test_session_cleanup(self, docker_container):
         """Test proper cleanup of resources."""
@@ -137,6 +137,101 @@ async def test_sandbox_cleanup(sandbox_config):
     assert not any(c.id == container_id for c in containers)
 
 
+@pytest.mark.asyncio
+async def test_sandbox_reset(sandbox_config):
+    """Tests resetting a sandbox for reuse."""
+    sandbox = DockerSandbox(sandbox_config)
+    await sandbox.create()
+    try:
+        leftovers = [
+            "/workspace/leftover.txt",
+            "/tmp/leftover.txt",
+            "/root/leftover.txt",
+            "/usr/local/lib/leftover/module.py",
+        ]
+        for path in leftovers:
+            await sandbox.write_file(path, "test")
+        await sandbox.run_command("export LEFTOVER=1 && cd /tmp")
+
+        await sandbox.reset()
+
+        # Added files are gone and the shell state is fresh
+        for path in leftovers:
+            result = await sandbox.run_command(f"test -e {path} && echo left")
+            assert result.strip() == ""
+        assert (await sandbox.run_command("ls -A /workspace")).strip() == ""
+        assert (await sandbox.run_command("echo ${LEFTOVER:-unset}")).strip() == "unset"
+        assert (await sandbox.run_command("pwd")).strip() == "/workspace"
+    finally:
+        await sandbox.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_sandbox_reset_changed_image_file(sandbox_config):
+    """Tests that a sandbox whose image files changed cannot be reset."""
+    sandbox = DockerSandbox(sandbox_config)
+    await sandbox.create()
+    try:
+        await sandbox.run_command("echo changed >> /etc/issue")
+        with pytest.raises(RuntimeError, match="/etc/issue"):
+            await sandbox.reset()
+    finally:
+        await sandbox.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_sandbox_copy_directory(sandbox, tmp_path):
+    """Tests copying a directory to and from the sandbox."""
+    src = tmp_path / "src"
+    (src / "nested").mkdir(parents=True)
+    (src / "a.txt").write_text("first")
+    (src / "nested" / "b.bin").write_bytes(bytes(range(256)) * 8192)
+    (src / "empty").mkdir()
+    (src / "link").symlink_to("nested")
+
+    await sandbox.copy_to(str(src), "/workspace/copied")
+    assert (await sandbox.read_file("/workspace/copied/a.txt")) == "first"
+    checks = "test -d /workspace/copied/empty && test -L /workspace/copied/link"
+    assert (await sandbox.run_command(f"{checks} && echo ok")).strip() == "ok"
+
+    dst = tmp_path / "dst"
+    dst.mkdir()
+    await sandbox.copy_from("/workspace/copied", str(dst))
+    assert (dst / "copied" / "a.txt").read_text() == "first"
+    assert (dst / "copied" / "nested" / "b.bin").read_bytes() == (
+        src / "nested" / "b.bin"
+    ).read_bytes()
+    assert (dst / "copied" / "empty").is_dir()
+    assert (dst / "copied" / "link").is_symlink()
+    assert str((dst / "copied" / "link").readlink()) == "nested"
+
+
+@pytest.mark.asyncio
+async def test_sandbox_sync_directory(sandbox, tmp_path):
+    """Tests that syncing a directory only transfers changed files."""
+    (tmp_path / "a.txt").write_text("first")
+    (tmp_path / "b.txt").write_text("unchanged")
+
+    assert await sandbox.sync_to(str(tmp_path), "/workspace/synced") == 2
+    assert await sandbox.sync_to(str(tmp_path), "/workspace/synced") == 0
+
+    (tmp_path / "a.txt").write_text("second version")
+    assert await sandbox.sync_to(str(tmp_path), "/workspace/synced") == 1
+    assert (await sandbox.read_file("/workspace/synced/a.txt")) == "second version"
+
+    # Deletions are only synced on request, a removed directory counts once
+    (tmp_path / "gone").mkdir()
+    (tmp_path / "gone" / "c.txt").write_text("removed later")
+    assert await sandbox.sync_to(str(tmp_path), "/workspace/synced") == 2
+    (tmp_path / "gone" / "c.txt").unlink()
+    (tmp_path / "gone").rmdir()
+    (tmp_path / "b.txt").unlink()
+    assert await sandbox.sync_to(str(tmp_path), "/workspace/synced") == 0
+    assert await sandbox.sync_to(str(tmp_path), "/workspace/synced", delete=True) == 2
+    listing = await sandbox.run_command("ls -A /workspace/synced")
+    assert listing.split() == ["a.txt"]
+
+
 @pytest.mark.asyncio
 async def test_sandbox_error_handling():
     """Tests error handling with invalid configuration."""
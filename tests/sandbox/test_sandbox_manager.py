@@ -134,5 +134,96 @@ async def test_manager_cleanup(manager):
     assert not manager._last_used
 
 
+@pytest.mark.asyncio
+async def test_warm_pool():
+    """Tests serving sandboxes from the warm pool."""
+    manager = SandboxManager(max_sandboxes=2, pool_size=1)
+    try:
+        # Wait for the pool to be filled in the background
+        await manager._pool_task
+        assert manager.get_stats()["pool_available"] == 1
+
+        sandbox_id = await manager.create_sandbox()
+        stats = manager.get_stats()
+        assert stats["pool_hits"] == 1
+        assert stats["pool_misses"] == 0
+
+        # Pooled sandboxes have an initialized terminal
+        sandbox = await manager.get_sandbox(sandbox_id)
+        result = await sandbox.run_command("echo 'pooled'")
+        assert result.strip() == "pooled"
+
+        # The pool is replenished in the background
+        await manager._pool_task
+        assert manager.get_stats()["pool_available"] == 1
+
+        # Requests with volume bindings are not served from the pool
+        with tempfile.TemporaryDirectory() as host_dir:
+            await manager.create_sandbox(volume_bindings={host_dir: "/data"})
+        stats = manager.get_stats()
+        assert stats["pool_hits"] == 1
+        assert stats["pool_available"] == 1
+    finally:
+        await manager.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_release_to_warm_pool():
+    """Tests returning released sandboxes to the warm pool."""
+    manager = SandboxManager(max_sandboxes=2, reset_on_release=True)
+    try:
+        sandbox_id = await manager.create_sandbox()
+
+        # Enable the pool without filling it, so the released sandbox fits
+        manager.pool_size = 1
+        await manager.release_sandbox(sandbox_id)
+        assert sandbox_id not in manager._sandboxes
+        stats = manager.get_stats()
+        assert stats["pool_recycled"] == 1
+        assert stats["pool_available"] == 1
+    finally:
+        await manager.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_release_discards_by_default():
+    """Tests that released sandboxes are replaced rather than reused."""
+    manager = SandboxManager(max_sandboxes=2)
+    try:
+        sandbox_id = await manager.create_sandbox()
+        sandbox = manager._sandboxes[sandbox_id]
+
+        manager.pool_size = 1
+        await manager.release_sandbox(sandbox_id)
+        assert manager.get_stats()["pool_recycled"] == 0
+        assert sandbox not in manager._pool
+        await manager._pool_task
+        assert manager.get_stats()["pool_available"] == 1
+    finally:
+        await manager.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_cleanup_while_filling_pool():
+    """Tests that cleanup removes sandboxes the pool is still creating."""
+    manager = SandboxManager(max_sandboxes=2, pool_size=2)
+
+    def sandbox_containers():
+        return {
+            c.id
+            for c in manager._client.containers.list(all=True)
+            if c.name.startswith("sandbox_")
+        }
+
+    before = sandbox_containers()
+    try:
+        # Let the pool start creating containers
+        await asyncio.sleep(0.5)
+    finally:
+        await manager.cleanup()
+    assert manager._pool_task.done()
+    assert sandbox_containers() <= before
+
+
 if __name__ == "__main__":
     pytest.main(["-v", __file__])
@@ -0,0 +1,43 @@
+"""Tests for the Bedrock client's OpenAI-style responses."""
+
+from openai.types.chat import ChatCompletionMessage
+
+from app.bedrock import ChatCompletions
+from app.llm import LLMResponseCache
+
+
+BEDROCK_RESPONSE = {
+    "output": {
+        "message": {
+            "role": "assistant",
+            "content": [
+                {"text": "Searching"},
+                {
+                    "toolUse": {
+                        "toolUseId": "tooluse_1",
+                        "name": "web_search",
+                        "input": {"query": "openmanus"},
+                    }
+                },
+            ],
+        }
+    },
+    "stopReason": "tool_use",
+    "usage": {"inputTokens": 10, "outputTokens": 5, "totalTokens": 15},
+}
+
+
+def test_response_cache_round_trip(tmp_path):
+    """Tests caching a Bedrock tool call message and reading it back."""
+    completions = ChatCompletions(client=None, executor=None)
+    response = completions._convert_bedrock_response_to_openai_format(BEDROCK_RESPONSE)
+    message = response.choices[0].message
+
+    cache = LLMResponseCache(tmp_path / "cache.sqlite", max_size=1024 * 1024)
+    cache.put("key", message.model_dump())
+    cached = ChatCompletionMessage.model_validate(cache.get("key"))
+
+    assert cached.content == "Searching"
+    assert cached.tool_calls[0].id == "tooluse_1"
+    assert cached.tool_calls[0].function.name == "web_search"
+    assert cached.tool_calls[0].function.arguments == '{"query": "openmanus"}'
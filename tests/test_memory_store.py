@@ -0,0 +1,160 @@
+"""Tests for the persistent memory store."""
+
+import base64
+from itertools import islice
+
+import pytest
+
+from app.memory_store import SQLiteMemoryStore
+from app.schema import Memory, Message, ToolCall
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Creates a store in a temporary database."""
+    return SQLiteMemoryStore(tmp_path / "memory.sqlite")
+
+
+def count_loads(store: SQLiteMemoryStore) -> list:
+    """Records the sequence numbers of every load from the store."""
+    loads = []
+    load = store.load
+
+    def recording_load(session_id, seqs):
+        loads.append(list(seqs))
+        return load(session_id, seqs)
+
+    store.load = recording_load
+    return loads
+
+
+def test_store_round_trip(store):
+    """Tests storing, loading and deleting messages with images."""
+    image = base64.b64encode(b"\x89PNG image").decode()
+    messages = [
+        Message.user_message("look", base64_image=image),
+        Message.assistant_message("seen"),
+    ]
+    store.append("s", list(enumerate(messages)))
+
+    assert store.seqs("s") == [0, 1]
+    loaded = store.load("s", [0, 1])
+    assert [loaded[seq].to_dict() for seq in (0, 1)] == [m.to_dict() for m in messages]
+
+    store.delete("s", [0])
+    assert store.seqs("s") == [1]
+    # The image is deleted with the last message using it
+    assert store._conn.execute("SELECT COUNT(*) FROM images").fetchone()[0] == 0
+
+
+def test_resume_session(store):
+    """Tests resuming a stored session in a new memory."""
+    memory = Memory(store=store, session_id="s", hot_messages=2)
+    memory.add_message(Message.system_message("system"))
+    for i in range(5):
+        memory.add_message(Message.user_message(f"message {i}"))
+
+    resumed = Memory(store=store, session_id="s", hot_messages=2)
+    assert resumed.to_dict_list() == memory.to_dict_list()
+
+    resumed.add_message(Message.assistant_message("reply"))
+    assert len(Memory(store=store, session_id="s").messages) == 7
+
+
+def test_trimming_deletes_from_store(store):
+    """Tests that trimmed messages are deleted from the store."""
+    memory = Memory(store=store, session_id="s", hot_messages=2, max_messages=5)
+    memory.add_messages(
+        [Message.system_message("system"), Message.user_message("request")]
+    )
+    for i in range(4):
+        memory.add_messages(
+            [
+                Message.from_tool_calls(
+                    [ToolCall(id=str(i), function={"name": "bash", "arguments": "{}"})]
+                ),
+                Message.tool_message(f"result {i}", name="bash", tool_call_id=str(i)),
+            ]
+        )
+
+    messages = memory.snapshot()
+    # Anchors are kept and a tool result is not kept without its call
+    assert [m.content for m in messages[:2]] == ["system", "request"]
+    assert messages[2].role == "assistant"
+    assert messages[-1].content == "result 3"
+    assert len(messages) <= 5
+    assert len(store.seqs("s")) == len(messages)
+
+    resumed = Memory(store=store, session_id="s")
+    assert resumed.to_dict_list() == memory.to_dict_list()
+
+
+def test_iteration_reads_cold_messages_once(store):
+    """Tests that iterating the history does not reload older messages."""
+    memory = Memory(store=store, session_id="s", hot_messages=2)
+    for i in range(10):
+        memory.add_message(Message.user_message(f"message {i}"))
+    resumed = Memory(store=store, session_id="s", hot_messages=2)
+    loads = count_loads(store)
+
+    contents = [f"message {i}" for i in range(10)]
+    assert [m.content for m in resumed.messages] == contents
+    assert len(loads) == 1
+    assert [m.content for m in resumed.messages] == contents
+    assert len(loads) == 1
+
+
+def test_iteration_is_lazy(store):
+    """Tests that iterating pages older messages in as they are reached."""
+    store.cached_messages = 0
+    memory = Memory(store=store, session_id="s", hot_messages=2)
+    count = 3 * memory.messages.PAGE_SIZE
+    for i in range(count):
+        memory.add_message(Message.user_message(f"message {i}"))
+    loads = count_loads(store)
+
+    first = list(islice(iter(memory.messages), 1))
+    assert first[0].content == "message 0"
+    # The oldest message stays in RAM
+    assert loads == [list(range(1, memory.messages.PAGE_SIZE))]
+
+    assert len(list(memory.messages)) == count
+    assert sum(len(seqs) for seqs in loads) == memory.messages.PAGE_SIZE + count - 4
+
+
+def test_context_reads_no_cold_messages(store):
+    """Tests that the LLM context of a large session is served from RAM."""
+    store.cached_messages = 0
+    memory = Memory(store=store, session_id="s", hot_messages=4)
+    memory.add_message(Message.system_message("system"))
+    memory.add_message(Message.user_message("request"))
+    for i in range(50):
+        memory.add_message(Message.user_message(f"message {i}"))
+    # The first steps pin the anchors and read the oldest message once
+    memory.context()
+    memory.context()
+    loads = count_loads(store)
+
+    context = memory.context()
+    assert [m.content for m in context] == ["system", "request"] + [
+        f"message {i}" for i in range(46, 50)
+    ]
+    assert loads == []
+
+
+def test_replace_oldest_keeps_other_messages(store):
+    """Tests replacing old messages with a summary in place."""
+    memory = Memory(store=store, session_id="s", hot_messages=2)
+    memory.add_message(Message.user_message("request"))
+    for i in range(6):
+        memory.add_message(Message.user_message(f"message {i}"))
+    seqs = store.seqs("s")
+
+    memory.messages.pin(1)
+    memory.messages.replace_oldest(3, [Message.user_message("summary")])
+    contents = ["request", "summary", "message 3", "message 4", "message 5"]
+    assert [m.content for m in memory.messages] == contents
+    # The summary takes the place of the last replaced message
+    assert store.seqs("s") == [seqs[0]] + seqs[3:]
+    resumed = Memory(store=store, session_id="s")
+    assert [m.content for m in resumed.messages] == contents
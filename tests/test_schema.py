@@ -0,0 +1,58 @@
+"""Tests for the message and memory models."""
+
+import base64
+
+import pytest
+
+from app.image_store import image_store
+from app.schema import Memory, Message, ToolCall
+
+
+def make_memory() -> Memory:
+    image = base64.b64encode(b"\x89PNG image").decode()
+    memory = Memory()
+    memory.add_messages(
+        [
+            Message.system_message("system"),
+            Message.user_message("look", base64_image=image),
+            Message.from_tool_calls(
+                [ToolCall(id="1", function={"name": "bash", "arguments": "{}"})],
+                content="calling",
+            ),
+            Message.tool_message("done", name="bash", tool_call_id="1"),
+        ]
+    )
+    return memory
+
+
+def test_memory_model_dump():
+    """Tests that messages are dumped as plain dicts."""
+    memory = make_memory()
+    dumped = memory.model_dump()
+    assert dumped["messages"] == memory.to_dict_list()
+    assert all(isinstance(message, dict) for message in dumped["messages"])
+
+
+def test_memory_json_round_trip():
+    """Tests that a memory dumped to JSON validates back unchanged."""
+    memory = make_memory()
+    restored = Memory.model_validate_json(memory.model_dump_json())
+    assert restored.to_dict_list() == memory.to_dict_list()
+    assert restored.messages[1].base64_image == memory.messages[1].base64_image
+    assert restored.messages[2].tool_calls == memory.messages[2].tool_calls
+
+
+def test_message_image_references():
+    """Tests that stored images live exactly as long as their messages."""
+    image = base64.b64encode(b"\x89PNG referenced").decode()
+    message = Message.user_message("look", base64_image=image)
+    copied = message.model_copy()
+    image_id = message.image_id
+    assert image_store._refs[image_id] == 2
+
+    del message
+    assert copied.base64_image == image
+    del copied
+    assert image_id not in image_store
+    with pytest.raises(KeyError):
+        image_store.acquire(image_id)
@@ -0,0 +1,102 @@
+"""Tests for the Bash tool session."""
+
+import asyncio
+import shlex
+
+import pytest
+
+from app.tool.bash import _BashSession
+
+
+@pytest.mark.asyncio
+async def test_output_and_exit_code():
+    """Tests output, errors and exit status of commands."""
+    session = _BashSession()
+    await session.start()
+    try:
+        result = await session.run("echo out; echo err >&2; false")
+        assert result.output == "out"
+        assert result.error == "err"
+        assert session.exit_code == 1
+    finally:
+        await close_session(session)
+
+
+@pytest.mark.asyncio
+async def test_output_containing_sentinel():
+    """Tests that output containing a sentinel does not end a command."""
+    session = _BashSession()
+    await session.start()
+    try:
+        sentinel = session._sentinel
+        lines = [sentinel, "<<exit>>", f"{sentinel}abc:0"]
+        result = await session.run(
+            "printf '%s\\n' "
+            + " ".join(shlex.quote(line) for line in lines)
+            + "; echo END"
+        )
+        assert result.output.splitlines() == lines + ["END"]
+
+        # Later commands get their own output
+        for i in range(3):
+            result = await session.run(f"echo n{i}")
+            assert result.output == f"n{i}"
+    finally:
+        await close_session(session)
+
+
+@pytest.mark.asyncio
+async def test_output_without_trailing_newline():
+    """Tests output that does not end with a newline."""
+    session = _BashSession()
+    await session.start()
+    try:
+        result = await session.run("printf 'no newline'")
+        assert result.output == "no newline"
+        result = await session.run("echo next")
+        assert result.output == "next"
+    finally:
+        await close_session(session)
+
+
+@pytest.mark.asyncio
+async def test_streamed_output():
+    """Tests receiving output while the command runs."""
+    session = _BashSession()
+    await session.start()
+    try:
+        chunks = []
+
+        async def on_output(chunk):
+            chunks.append(chunk)
+
+        result = await session.run(
+            "for i in 1 2 3; do echo $i; sleep 0.1; done", on_output=on_output
+        )
+        assert result.output == "1\n2\n3"
+        assert len(chunks) > 1
+    finally:
+        await close_session(session)
+
+
+@pytest.mark.asyncio
+async def test_output_after_sentinel_is_kept():
+    """Tests that output read past a sentinel goes to the next command."""
+    session = _BashSession()
+    reader = asyncio.StreamReader()
+    first, second = f"{session._sentinel}a:", f"{session._sentinel}b:"
+    reader.feed_data(f"one\n{first}0\nlate\n".encode())
+    reader.feed_data(f"two\n{second}1\n".encode())
+
+    chunks = [chunk async for chunk in session._read_until_sentinel(reader, first)]
+    assert "".join(chunks) == "one"
+    assert session.exit_code == 0
+    chunks = [chunk async for chunk in session._read_until_sentinel(reader, second)]
+    assert "".join(chunks) == "late\ntwo"
+    assert session.exit_code == 1
+
+
+async def close_session(session: _BashSession) -> None:
+    """Ends a session's shell and waits for it to exit."""
+    session._process.stdin.close()
+    await asyncio.wait_for(session._process.wait(), 5)
@@ -5,6 +5,7 @@ A simple web interface for OpenManus AI agents
 """
 
 import asyncio
+import concurrent.futures
 import logging
 import queue
 import threading
@@ -18,7 +19,11 @@ from flask_cors import CORS
 from app.agent.data_analysis import DataAnalysis
 from app.agent.manus import Manus
 from app.agent.mcp import MCPAgent
+from app.http_pool import close_loop_connections, get_http_pool_stats
+from app.llm import STREAM_RESET
 from app.logger import logger
+from app.memory_store import create_memory, get_memory_store
+
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -42,6 +47,38 @@ class WebManusSession:
         self.is_processing = False
         self.created_at = datetime.now()
 
+        # Each session runs on its own long-lived event loop, so the agent
+        # keeps its async resources (MCP sessions, pooled LLM connections)
+        # across requests, and a tool that blocks its loop only stalls this
+        # session
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(
+            target=self._run_loop, name=f"session-{session_id}", daemon=True
+        ).start()
+
+    def _run_loop(self) -> None:
+        """Run the session's event loop until close() stops it"""
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def run_in_background(self, coro) -> "concurrent.futures.Future":
+        """Schedule a coroutine on the session's event loop"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self) -> "concurrent.futures.Future":
+        """Clean up the agent, then stop the session's event loop"""
+
+        async def cleanup_and_stop():
+            try:
+                await self.cleanup()
+                await close_loop_connections()
+            finally:
+                self.loop.call_soon(self.loop.stop)
+
+        return self.run_in_background(cleanup_and_stop())
+
     async def initialize_agent(self):
         """Initialize the selected agent type"""
         try:
@@ -55,6 +92,24 @@ class WebManusSession:
             else:
                 raise ValueError(f"Unknown agent type: {self.agent_type}")
 
+            # Forward the model's output to the client while it is generated
+            self.agent.on_token = self.forward_token
+            # and the output of long running tools while they run
+            self.agent.on_tool_output = self.forward_tool_output
+
+            # With a persistent memory backend the conversation is stored as
+            # it is produced, and resumed here if the session already exists
+            self.agent.memory = create_memory(self.session_id)
+            store = get_memory_store()
+            if store:
+                store.save_session(
+                    self.session_id,
+                    {
+                        "agent_type": self.agent_type,
+                        "created_at": self.created_at.isoformat(),
+                    },
+                )
+
             logger.info(
                 f"Initialized {self.agent_type} agent for session {self.session_id}"
             )
@@ -63,6 +118,18 @@ class WebManusSession:
             logger.error(f"Failed to initialize agent: {e}")
             return False
 
+    async def forward_token(self, token: str) -> None:
+        """Queue a streamed LLM token for delivery to the client"""
+        if token == STREAM_RESET:
+            # A failed attempt is retried, its partial text is void
+            self.message_queue.put({"type": "token_reset"})
+            return
+        self.message_queue.put({"type": "token", "content": token})
+
+    async def forward_tool_output(self, tool: str, chunk: str) -> None:
+        """Queue a chunk of tool output for delivery to the client"""
+        self.message_queue.put({"type": "tool_output", "tool": tool, "content": chunk})
+
     async def process_message(self, message: str) -> str:
         """Process a message with the agent"""
         if not self.agent:
@@ -105,14 +172,14 @@ def create_session():
         active_sessions[session_id] = session
 
         # Initialize agent in background
-        def init_agent():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            success = loop.run_until_complete(session.initialize_agent())
-            if not success:
+        def on_initialized(future):
+            if future.exception() or not future.result():
                 active_sessions.pop(session_id, None)
+                session.close()
 
-        threading.Thread(target=init_agent, daemon=True).start()
+        session.run_in_background(session.initialize_agent()).add_done_callback(
+            on_initialized
+        )
 
         return jsonify(
             {
@@ -127,6 +194,46 @@ def create_session():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/session/<session_id>/resume", methods=["POST"])
+def resume_session(session_id: str):
+    """Resume a stored session, e.g. one created by another worker"""
+    session = active_sessions.get(session_id)
+    if session:
+        return jsonify(
+            {
+                "session_id": session_id,
+                "agent_type": session.agent_type,
+                "status": "active",
+            }
+        )
+
+    store = get_memory_store()
+    metadata = store.get_session(session_id) if store else None
+    if not metadata:
+        return jsonify({"error": "Session not found"}), 404
+
+    session = WebManusSession(session_id, metadata["agent_type"])
+    session.created_at = datetime.fromisoformat(metadata["created_at"])
+    active_sessions[session_id] = session
+
+    def on_initialized(future):
+        if future.exception() or not future.result():
+            active_sessions.pop(session_id, None)
+            session.close()
+
+    session.run_in_background(session.initialize_agent()).add_done_callback(
+        on_initialized
+    )
+
+    return jsonify(
+        {
+            "session_id": session_id,
+            "agent_type": session.agent_type,
+            "status": "resuming",
+        }
+    )
+
+
 @app.route("/api/session/<session_id>/status")
 def session_status(session_id: str):
     """Get session status"""
@@ -166,10 +273,12 @@ def chat(session_id: str):
             return jsonify({"error": "Message cannot be empty"}), 400
 
         # Process message in background and return immediately
-        def process_message():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            response = loop.run_until_complete(session.process_message(message))
+        def on_processed(future):
+            response = (
+                f"Error: {future.exception()}"
+                if future.exception()
+                else future.result()
+            )
             session.message_queue.put(
                 {
                     "type": "response",
@@ -178,7 +287,9 @@ def chat(session_id: str):
                 }
             )
 
-        threading.Thread(target=process_message, daemon=True).start()
+        session.run_in_background(session.process_message(message)).add_done_callback(
+            on_processed
+        )
 
         return jsonify(
             {"status": "processing", "message": "Request submitted successfully"}
@@ -213,14 +324,13 @@ def close_session(session_id: str):
     if not session:
         return jsonify({"error": "Session not found"}), 404
 
-    def cleanup():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(session.cleanup())
-
-    threading.Thread(target=cleanup, daemon=True).start()
+    session.close()
     active_sessions.pop(session_id, None)
 
+    store = get_memory_store()
+    if store:
+        store.delete_session(session_id)
+
     return jsonify({"status": "Session closed successfully"})
 
 
@@ -257,6 +367,7 @@ def health_check():
         {
             "status": "healthy",
             "active_sessions": len(active_sessions),
+            "http_pool": get_http_pool_stats(),
             "timestamp": datetime.now().isoformat(),
         }
     )
@@ -286,9 +397,7 @@ if __name__ == "__main__":
         # Cleanup all active sessions
         for session in active_sessions.values():
             try:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(session.cleanup())
+                session.close().result(timeout=30)
             except Exception as e:
                 logger.error(f"Error cleaning up session: {e}")
         print("✅ Server stopped successfully")